@@ -0,0 +1,687 @@
+"""
+Benchmark suite for ziffect's decoration, intent and dispatch paths.
+
+Each benchmark reports operations per second, and the memory allocated by a
+single operation and retained per operation as measured with ``tracemalloc``.
+Results are written as JSON lines, one benchmark per line, so the output of
+two releases can be compared::
+
+    python benchmarks/suite.py --output old.json
+    # ... change ziffect ...
+    python benchmarks/suite.py --output new.json --compare old.json
+
+Run from the root of the repository. ``--filter`` selects benchmarks whose
+name contains the given text.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import hashlib
+import itertools
+import json
+import sys
+import timeit
+import tracemalloc
+from functools import partial
+
+from effect import sync_perform, base_dispatcher
+from effect._base import _Box
+from effect.do import do, do_return
+
+import ziffect
+import ziffect.streams
+
+
+def make_interface_class(method_count):
+    """
+    Create an undecorated interface class with ``method_count`` methods, each
+    taking two int arguments.
+    """
+    namespace = {}
+    for i in range(method_count):
+        source = ('def method%d(a0=ziffect.argument(type=int), '
+                  'a1=ziffect.argument(type=int)):\n    pass\n' % (i,))
+        exec(source, {'ziffect': ziffect}, namespace)
+    return type(str('Generated%d' % (method_count,)), (object,), namespace)
+
+
+def make_interface(method_count, validation=None):
+    """
+    Create an interface with ``method_count`` methods, each taking two int
+    arguments.
+    """
+    return ziffect.interface(make_interface_class(method_count),
+                             validation=validation)
+
+
+def make_provider(method_count):
+    """
+    Create a provider of an interface made by :func:`make_interface`.
+    """
+    namespace = {}
+    for i in range(method_count):
+        source = 'def method%d(self, a0, a1):\n    return a0\n' % (i,)
+        exec(source, {}, namespace)
+    return type(str('Provider%d' % (method_count,)), (object,), namespace)()
+
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function sets up the benchmark and
+    returns a function that performs one operation.
+    """
+    def _register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return _register
+
+
+for _method_count in (1, 10, 100, 500):
+    def _decorate_setup(method_count=_method_count):
+        methods = dict(
+            (name, value)
+            for name, value in vars(make_interface_class(method_count)).items()
+            if name.startswith('method'))
+        return lambda: ziffect.interface(
+            type(str('Decorated'), (object,), dict(methods)))
+    benchmark('interface/%d_methods' % (_method_count,))(_decorate_setup)
+
+    def _first_use_setup(method_count=_method_count):
+        methods = dict(
+            (name, value)
+            for name, value in vars(make_interface_class(method_count)).items()
+            if name.startswith('method'))
+
+        def decorate_and_use():
+            interface = ziffect.interface(
+                type(str('Decorated'), (object,), dict(methods)))
+            ziffect.effects(interface).method0(a0=1, a1=2)
+        return decorate_and_use
+    benchmark('interface/%d_methods_first_use' % (_method_count,))(
+        _first_use_setup)
+
+    def _dispatcher_setup(method_count=_method_count):
+        interface = make_interface(method_count)
+        provider = make_provider(method_count)
+
+        def build():
+            ziffect.dispatcher({interface: provider})
+        ziffect.dispatcher({interface: provider})
+        return build
+    benchmark('dispatcher_build/%d_methods' % (_method_count,))(
+        _dispatcher_setup)
+
+
+@benchmark('request_setup/100_methods_fresh_dispatcher')
+def _fresh_dispatcher_per_request():
+    interface = make_interface(100)
+    provider_type = type(make_provider(100))
+    effects = ziffect.effects(interface)
+
+    def request():
+        dispatcher = ziffect.dispatcher({interface: provider_type()})
+        sync_perform(dispatcher, effects.method50(a0=1, a1=2))
+    return request
+
+
+@benchmark('request_setup/100_methods_scoped')
+def _scoped_provider_per_request():
+    from ziffect.scoped import ScopedProvider
+    interface = make_interface(100)
+    provider_type = type(make_provider(100))
+    scoped = ScopedProvider(interface)
+    dispatcher = ziffect.dispatcher({interface: scoped})
+    effects = ziffect.effects(interface)
+
+    def request():
+        with scoped.bound(provider_type()):
+            sync_perform(dispatcher, effects.method50(a0=1, a1=2))
+    return request
+
+
+@benchmark('intent/construct')
+def _construct_intent():
+    intents = ziffect.intents(make_interface(1))
+    return lambda: intents.method0(a0=1, a1=2)
+
+
+@benchmark('intent/construct_unchecked')
+def _construct_unchecked_intent():
+    intents = ziffect.intents(make_interface(1, validation='off'))
+    return lambda: intents.method0(a0=1, a1=2)
+
+
+@benchmark('effect/construct')
+def _construct_effect():
+    effects = ziffect.effects(make_interface(1))
+    return lambda: effects.method0(a0=1, a1=2)
+
+
+@benchmark('effect/construct_interned')
+def _construct_interned_effect():
+    effects = ziffect.effects(ziffect.interface(
+        make_interface_class(1), intern=True))
+    return lambda: effects.method0(a0=1, a1=2)
+
+
+@benchmark('dispatch/lookup_and_perform')
+def _dispatch():
+    interface = make_interface(100)
+    dispatcher = ziffect.dispatcher({interface: make_provider(100)})
+    intent = ziffect.intents(interface).method50(a0=1, a1=2)
+    box = _Box(lambda result: None)
+    return lambda: dispatcher(intent)(dispatcher, intent, box)
+
+
+@benchmark('dispatch/lookup_and_perform_instrumented')
+def _dispatch_instrumented():
+    from ziffect.metrics import MetricsCollector
+    interface = make_interface(100)
+    dispatcher = ziffect.dispatcher({interface: make_provider(100)},
+                                    instrument=MetricsCollector())
+    intent = ziffect.intents(interface).method50(a0=1, a1=2)
+    box = _Box(lambda result: None)
+    return lambda: dispatcher(intent)(dispatcher, intent, box)
+
+
+@benchmark('dispatch/lookup_and_perform_bulkheaded')
+def _dispatch_bulkheaded():
+    from ziffect.bulkheads import BulkheadPolicy
+    interface = make_interface(100)
+    dispatcher = ziffect.dispatcher(
+        {interface: make_provider(100)},
+        bulkhead={interface: BulkheadPolicy(max_concurrent=10),
+                  (interface, 'method50'): BulkheadPolicy(max_concurrent=2)})
+    intent = ziffect.intents(interface).method50(a0=1, a1=2)
+    box = _Box(lambda result: None)
+    return lambda: dispatcher(intent)(dispatcher, intent, box)
+
+
+@benchmark('sync_perform/single_effect')
+def _sync_perform():
+    interface = make_interface(100)
+    dispatcher = ziffect.compile_dispatcher([
+        {interface: make_provider(100)}, base_dispatcher])
+    effects = ziffect.effects(interface)
+    return lambda: sync_perform(dispatcher, effects.method50(a0=1, a1=2))
+
+
+@benchmark('sync_perform/program_of_100_effects')
+def _sync_perform_program():
+    interface = make_interface(10)
+    dispatcher = ziffect.compile_dispatcher([
+        {interface: make_provider(10)}, base_dispatcher])
+    effects = ziffect.effects(interface)
+
+    @do
+    def program():
+        for i in range(100):
+            yield effects.method3(a0=i, a1=i)
+
+    return lambda: sync_perform(dispatcher, program())
+
+
+@benchmark('sync_perform/program_of_100_effects_with_deadline')
+def _sync_perform_program_with_deadline():
+    from ziffect.deadlines import deadline_dispatcher, within
+    interface = make_interface(10)
+    dispatcher = ziffect.compile_dispatcher([
+        {interface: make_provider(10)}, deadline_dispatcher,
+        base_dispatcher])
+    effects = ziffect.effects(interface)
+
+    @do
+    def program():
+        for i in range(100):
+            yield effects.method3(a0=i, a1=i)
+
+    return lambda: sync_perform(dispatcher, within(10, program()))
+
+
+for _sample_rate in (0.0, 0.01, 1.0):
+    def _traced_setup(sample_rate=_sample_rate):
+        from ziffect.tracing import Tracer
+        interface = make_interface(10)
+        tracer = Tracer(sample_rate=sample_rate)
+        dispatcher = tracer.wrap(ziffect.compile_dispatcher([
+            {interface: make_provider(10)}, base_dispatcher]))
+        effects = ziffect.effects(interface)
+
+        @do
+        def program():
+            for i in range(100):
+                yield effects.method3(a0=i, a1=i)
+        return lambda: sync_perform(dispatcher, program())
+    benchmark('sync_perform/program_of_100_effects_traced_%g' % (
+        _sample_rate,))(_traced_setup)
+
+
+for _length in (100, 10000):
+    def _sequence_setup(length=_length, ordered=True):
+        interface = make_interface(1)
+        intents = ziffect.intents(interface)
+        effects = ziffect.effects(interface)
+        provider = make_provider(1)
+        sequence = [(intents.method0(a0=i, a1=i), provider.method0)
+                    for i in range(length)]
+
+        @do
+        def program():
+            for i in range(length):
+                yield effects.method0(a0=i, a1=i)
+
+        return lambda: ziffect.perform_sequence_destructed_args(
+            sequence, program(), ordered=ordered)
+    benchmark('perform_sequence_destructed_args/%d_intents' % (_length,))(
+        partial(_sequence_setup, ordered=True))
+    benchmark(
+        'perform_sequence_destructed_args/%d_intents_unordered' % (_length,))(
+        partial(_sequence_setup, ordered=False))
+
+
+@ziffect.interface
+class CPUBound(object):
+
+    def digest(data=ziffect.argument(type=bytes),
+               rounds=ziffect.argument(type=int)):
+        pass
+
+
+class SHA256Digester(object):
+
+    def digest(self, data, rounds):
+        for _ in range(rounds):
+            data = hashlib.sha256(data).digest()
+        return data
+
+
+def _cpu_bound(provider, **options):
+    """
+    :returns: A function that performs 8 CPU-bound effects in parallel.
+    """
+    from effect import parallel
+    from ziffect.threads import blocking_perform, threaded_base_dispatcher
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({CPUBound: provider}, **options),
+        threaded_base_dispatcher,
+    ])
+    digest = ziffect.effects(CPUBound).digest
+    return lambda: blocking_perform(dispatcher, parallel(
+        [digest(data=bytes(i), rounds=20000) for i in range(8)]))
+
+
+@benchmark('cpu_bound/8_effects_on_threads')
+def _cpu_bound_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    return _cpu_bound(SHA256Digester(),
+                      executor=ThreadPoolExecutor(max_workers=4))
+
+
+@benchmark('cpu_bound/8_effects_on_processes')
+def _cpu_bound_processes():
+    from ziffect.processes import ProcessProvider
+    return _cpu_bound(ProcessProvider(SHA256Digester, max_workers=4))
+
+
+def _codec_intent():
+    interface = make_interface(1)
+    return ziffect.intents(interface).method0(a0=1, a1=2)
+
+
+@benchmark('codec/encode_intent')
+def _codec_encode():
+    from ziffect.codec import encode
+    intent = _codec_intent()
+    return lambda: encode(intent)
+
+
+@benchmark('codec/decode_intent')
+def _codec_decode():
+    from ziffect.codec import decode, encode
+    data = encode(_codec_intent())
+    return lambda: decode(data)
+
+
+@benchmark('codec/pickle_round_trip')
+def _codec_pickle():
+    import pickle
+    intent = _codec_intent()
+    return lambda: pickle.loads(pickle.dumps(intent, protocol=2))
+
+
+DOCUMENT = {'name': 'document', 'count': 10,
+            'tags': ['a', 'b', 'c'], 'nested': {'x': 1, 'y': [1, 2, 3]}}
+
+
+def _put_revisions(db, revisions=10):
+    """
+    :returns: A function that puts the next revision of a document, moving
+        on to a new document every ``revisions`` puts.
+    """
+    puts = itertools.count()
+
+    def put():
+        n = next(puts)
+        db.put(n // revisions, n % revisions, DOCUMENT)
+    return put
+
+
+@benchmark('doc_db/get')
+def _doc_db_get():
+    from ziffect.doc import DB, uuid4
+    db = DB()
+    doc_id = uuid4()
+    db.put(doc_id, 0, DOCUMENT)
+    return lambda: db.get(doc_id)
+
+
+@benchmark('doc_db/put')
+def _doc_db_put():
+    from ziffect.doc import DB
+    db = DB()
+    return _put_revisions(db)
+
+
+@benchmark('doc_db/read_modify_write')
+def _doc_db_read_modify_write():
+    from ziffect.doc import DB, uuid4
+    db = DB()
+    doc_id = uuid4()
+    db.put(doc_id, 0, DOCUMENT)
+
+    def increment():
+        response = db.get(doc_id)
+        db.put(doc_id, response.rev + 1,
+               dict(response.doc, count=response.doc['count'] + 1))
+    return increment
+
+
+def _contended_updates(coalesce):
+    """
+    :returns: A function that applies 100 concurrent increments to one
+        document, with the providers on an executor.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from effect import parallel
+    from uuid import UUID
+    from ziffect.coalescing import UpdateCoalescer, coalescing_dispatcher
+    from ziffect.doc import DB, DBStatus, LATEST, uuid4
+    from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+    @ziffect.interface
+    class DBInterface(object):
+        def get(doc_id=ziffect.argument(type=UUID),
+                rev=ziffect.argument(type=int, default=LATEST)):
+            pass
+
+        def update(doc_id=ziffect.argument(type=UUID),
+                   rev=ziffect.argument(type=int),
+                   doc=ziffect.argument(type=dict)):
+            pass
+
+    class ZiffectDB(object):
+        def __init__(self, db):
+            self.db = db
+
+        def get(self, doc_id, rev):
+            return self.db.get(doc_id, rev)
+
+        def update(self, doc_id, rev, doc):
+            return self.db.put(doc_id, rev + 1, doc)
+
+    db = DB()
+    doc_id = uuid4()
+    db.put(doc_id, 0, DOCUMENT)
+    db_effects = ziffect.effects(DBInterface)
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({DBInterface: ZiffectDB(db)},
+                           executor=ThreadPoolExecutor(max_workers=8)),
+        coalescing_dispatcher,
+        threaded_base_dispatcher])
+
+    def increment(doc):
+        return dict(doc, count=doc['count'] + 1)
+
+    @do
+    def execute_function(doc_id, pure_function):
+        while True:
+            original = yield db_effects.get(doc_id=doc_id)
+            result = yield db_effects.update(
+                doc_id=doc_id, rev=original.rev,
+                doc=pure_function(original.doc))
+            if result.status != DBStatus.CONFLICT:
+                break
+
+    coalescer = UpdateCoalescer(
+        read=lambda doc_id: db_effects.get(doc_id=doc_id),
+        write=lambda doc_id, original, doc: db_effects.update(
+            doc_id=doc_id, rev=original.rev, doc=doc),
+        value=lambda response: dict(response.doc),
+        conflict=lambda response: response.status == DBStatus.CONFLICT)
+    if coalesce:
+        program = partial(coalescer.update, doc_id, increment)
+    else:
+        program = partial(execute_function, doc_id, increment)
+    return lambda: blocking_perform(
+        dispatcher, parallel([program() for _ in range(100)]), timeout=60)
+
+
+benchmark('doc_db/100_contended_updates')(
+    partial(_contended_updates, False))
+benchmark('doc_db/100_contended_updates_coalesced')(
+    partial(_contended_updates, True))
+
+
+def _record_calls(make_provider):
+    interface = make_interface(1)
+    effects = ziffect.effects(interface)
+    dispatcher = ziffect.compile_dispatcher([
+        {interface: make_provider(interface)}, base_dispatcher])
+    counter = itertools.count()
+
+    def record():
+        i = next(counter)
+        sync_perform(dispatcher, effects.method0(a0=i, a1=i % 16))
+    return record
+
+
+class _ListRecorder(object):
+    """
+    A hand-written recording provider, keeping a tuple per call.
+    """
+    def __init__(self, interface):
+        self.calls = []
+
+    def method0(self, a0, a1):
+        self.calls.append((a0, a1))
+
+
+benchmark('recording/call_list_of_tuples')(
+    partial(_record_calls, _ListRecorder))
+
+
+def _generated_recorder(interface):
+    from ziffect.recording import recorder
+    return recorder(interface)
+
+
+benchmark('recording/call_log')(partial(_record_calls, _generated_recorder))
+
+
+@benchmark('doc_db/put_durable')
+def _doc_db_put_durable():
+    import os
+    import tempfile
+    from ziffect.doc import DB
+    db = DB(path=os.path.join(tempfile.mkdtemp(), 'bench.log'))
+    return _put_revisions(db)
+
+
+@benchmark('replay/10000_intents')
+def _replay():
+    import os
+    import tempfile
+    from ziffect.replay import Recorder, replay
+    interface = make_interface(1)
+    effects = ziffect.effects(interface)
+    dispatcher = ziffect.compile_dispatcher([
+        {interface: make_provider(1)}, base_dispatcher])
+
+    @do
+    def program():
+        for i in range(10000):
+            yield effects.method0(a0=i, a1=i)
+
+    path = os.path.join(tempfile.mkdtemp(), 'replay.log')
+    with Recorder(path) as recorder:
+        sync_perform(recorder.wrap(dispatcher), program())
+    return lambda: replay(path, program(), ordered=True)
+
+
+@ziffect.interface
+class Scanner(object):
+
+    def scan_all(limit=ziffect.argument(type=int)):
+        pass
+
+    @ziffect.streams.streaming
+    def scan(limit=ziffect.argument(type=int)):
+        pass
+
+
+class RangeScanner(object):
+
+    def scan_all(self, limit):
+        return [(i, str(i)) for i in range(limit)]
+
+    def scan(self, limit):
+        return ((i, str(i)) for i in range(limit))
+
+
+@benchmark('streams/100000_items_materialized')
+def _scan_all():
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({Scanner: RangeScanner()}), base_dispatcher])
+
+    @do
+    def program():
+        items = yield ziffect.effects(Scanner).scan_all(limit=100000)
+        yield do_return(sum(i for i, _ in items))
+    return lambda: sync_perform(dispatcher, program())
+
+
+@benchmark('streams/100000_items_in_chunks_of_1000')
+def _scan():
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({Scanner: RangeScanner()}), base_dispatcher])
+
+    @do
+    def program():
+        stream = yield ziffect.effects(Scanner).scan(limit=100000)
+        total = 0
+        while True:
+            chunk = yield ziffect.streams.read(stream, 1000)
+            if not chunk:
+                break
+            total += sum(i for i, _ in chunk)
+        yield do_return(total)
+    return lambda: sync_perform(dispatcher, program())
+
+
+def measure(name, setup, min_time=0.2):
+    """
+    Run one benchmark.
+
+    :returns: A dict of the results.
+    """
+    operation = setup()
+    operation()
+
+    timer = timeit.Timer(operation)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(
+            2, int(min_time / elapsed * 1.2))
+    best = min([elapsed] + timer.repeat(repeat=2, number=number))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        retained_before, _ = tracemalloc.get_traced_memory()
+        iterations = min(number, 1000)
+        for _ in range(iterations):
+            operation()
+        retained_after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'name': name,
+        'ops_per_sec': number / best,
+        'usec_per_op': best / number * 1e6,
+        'peak_bytes_per_op': peak - before,
+        'retained_bytes_per_op': (
+            float(retained_after - retained_before) / iterations),
+    }
+
+
+def compare(results, baseline):
+    """
+    Print the change in ops/sec of ``results`` relative to ``baseline``.
+    """
+    baseline = dict((result['name'], result) for result in baseline)
+    for result in results:
+        old = baseline.get(result['name'])
+        if old is None:
+            continue
+        change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+        print('%-50s %+7.1f%% ops/sec  peak %d -> %d bytes' % (
+            result['name'], change * 100,
+            old['peak_bytes_per_op'], result['peak_bytes_per_op']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--output', help='write JSON lines to this file')
+    parser.add_argument('--compare', help='JSON lines of a previous run')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, setup in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        result = measure(name, setup)
+        results.append(result)
+        print('%-50s %12.1f ops/sec %10d peak bytes' % (
+            name, result['ops_per_sec'], result['peak_bytes_per_op']),
+            file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            for result in results:
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+    else:
+        for result in results:
+            print(json.dumps(result, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, [json.loads(line) for line in baseline])
+
+
+if __name__ == '__main__':
+    main()
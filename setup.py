@@ -9,5 +9,12 @@ setup(
     author='Marcus Henry Ewert',
     author_email='user@marcushenryewert.com',
     url='https://ziffect.readthedocs.org/',
-    packages=['ziffect'],
+    packages=['ziffect', 'ziffect.aio', 'ziffect.doc', 'ziffect.matchers',
+              'ziffect.threads', 'ziffect.batching', 'ziffect.caching',
+              'ziffect.metrics', 'ziffect.fanout',
+              'ziffect.retry', 'ziffect.codec', 'ziffect.processes',
+              'ziffect.replay', 'ziffect.streams', 'ziffect.tracing',
+              'ziffect.scoped',
+              'ziffect.bulkheads', 'ziffect.deadlines',
+              'ziffect.coalescing', 'ziffect.recording'],
 )
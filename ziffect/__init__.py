@@ -5,21 +5,55 @@ The ziffect module.
 
 from __future__ import unicode_literals
 
-from effect import TypeDispatcher, Effect, sync_performer
-from effect.testing import perform_sequence
-from pyrsistent import PClass, field, PClassMeta
-from six import add_metaclass, iteritems
-from funcsigs import signature
+import os
+import sys
+import time
+from collections import deque
+from functools import partial
+from importlib import import_module
+from heapq import heapify, heappop, heappush
+from itertools import chain, count
+from threading import Condition, Lock, Thread, local
+
+from effect import (
+    TypeDispatcher, ComposedDispatcher, Effect, ParallelEffects,
+    base_dispatcher, sync_perform)
+from pyrsistent import PClass, PTypeError, field
+from six import iteritems
+from funcsigs import signature, Parameter
+
+try:
+    from effect.parallel_async import perform_parallel_async
+except ImportError:
+    perform_parallel_async = import_module(
+        'effect.async').perform_parallel_async
+
+# A monotonic clock with the highest available resolution, for timeouts and
+# durations.
+_clock = getattr(time, 'perf_counter', time.time)
 
 try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
 
+try:
+    from asyncio import iscoroutinefunction as _iscoroutinefunction
+except ImportError:
+    def _iscoroutinefunction(function):
+        return False
+
+try:
+    from contextvars import ContextVar, copy_context
+except ImportError:
+    ContextVar = copy_context = None
+
 __all__ = [
     'interface',
     'effects',
-    'argument'
+    'argument',
+    'CompiledDispatcher',
+    'compile_dispatcher',
 ]
 
 
@@ -36,35 +70,240 @@ class argument(PClass):
     default = field(initial=_TOKEN)
 
 
-def _make_intent_from_args(args):
+def _raise_invalid_type(intent_type, name, expected, value):
+    """
+    Raise the same error that a pyrsistent ``field`` raises when it is given a
+    value of the wrong type.
+    """
+    raise PTypeError(
+        intent_type, name, (expected,), type(value),
+        'Invalid type for field {0}.{1}, was {2}'.format(
+            intent_type.__name__, name, type(value).__name__))
+
+
+class _IntentBase(object):
+    """
+    Base class of the generated intent types.
+
+    The values of an intent are stored in a single tuple, ``_ziffect_values``,
+    in the order the arguments are declared on the interface. This lets
+    performers call providers positionally without building a dict per call.
+    """
+    __slots__ = ('_ziffect_values', '_ziffect_hash')
+
+    _ziffect_fields = ()
+    _ziffect_args = ()
+    _ziffect_arguments = ()
+    _ziffect_name = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "'{0}' object is immutable".format(type(self).__name__))
+
+    def __eq__(self, other):
+        if other is self:
+            return True
+        if type(other) is type(self):
+            return self._ziffect_values == other._ziffect_values
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        try:
+            return self._ziffect_hash
+        except AttributeError:
+            result = hash((type(self), self._ziffect_values))
+            object.__setattr__(self, '_ziffect_hash', result)
+            return result
+
+    def __repr__(self):
+        return '{0}({1})'.format(
+            type(self).__name__,
+            ', '.join('{0}={1}'.format(k, repr(v))
+                      for k, v in iteritems(self._to_dict())))
+
+    def _to_dict(self):
+        return OrderedDict(
+            (a, getattr(self, a)) for a in self._ziffect_fields)
+
+    def __reduce__(self):
+        if self._ziffect_name is None:
+            raise TypeError(
+                "Can't pickle intents that do not belong to an interface")
+        return (_rebuild_intent, (self._ziffect_name, self._ziffect_values))
+
+
+_intent_registry = {}
+
+
+def _intent_type(name):
+    """
+    Find the intent type with a name given by :func:`_intent_name`.
+
+    Intent types that have been used in this process are found in a registry.
+    Otherwise the module of the interface is imported, so that intents can be
+    rebuilt in another process.
+
+    :raises LookupError: if there is no such intent type.
+    """
+    intent = _intent_registry.get(name)
+    if intent is not None:
+        return intent
+    module_name, _, path = name.partition(':')
+    qualname, _, method_name = path.rpartition('.')
+    try:
+        interface = import_module(module_name)
+        for part in qualname.split('.'):
+            interface = getattr(interface, part)
+        return getattr(interface._ziffect_intents, method_name)
+    except (ImportError, AttributeError, ValueError):
+        raise LookupError('Unknown intent type {0!r}'.format(name))
+
+
+def _interface_name(interface):
+    """
+    The name of an interface, which tells apart interfaces of the same name
+    in different modules: ``'module:QualifiedName'``.
+    """
+    return '{0}:{1}'.format(
+        interface.__module__,
+        getattr(interface, '__qualname__', interface.__name__))
+
+
+def _intent_name(interface, method_name):
+    """
+    The name of the intent type of a method of an interface, which is the
+    same in every process: ``'module:QualifiedName.method'``.
+    """
+    return '{0}.{1}'.format(_interface_name(interface), method_name)
+
+
+def _rebuild_intent(name, values):
+    """
+    Unpickle an intent.
+    """
+    intent = _intent_type(name)
+    return intent(**dict(zip(intent._ziffect_args, values)))
+
+
+def _field_property(index):
+    """
+    Create a read-only property for the value at ``index`` of an intent.
+    """
+    def _get(self):
+        return self._ziffect_values[index]
+    return property(_get)
+
+
+_INTENT_INIT_TEMPLATE = """
+def __init__(self, {params}):
+{checks}
+    _setattr(self, '_ziffect_values', ({values}))
+"""
+
+_VALIDATION_ENVIRONMENT_VARIABLE = 'ZIFFECT_VALIDATION'
+
+
+def _validation_sample_rate(validation):
+    """
+    Parse a validation mode.
+
+    :param validation: ``'full'`` to type check the arguments of every intent,
+        ``'off'`` to never check them, or a positive integer ``N`` (or its
+        string form) to check the arguments of one in every ``N`` intents.
+        ``None`` uses the ``ZIFFECT_VALIDATION`` environment variable, and
+        defaults to ``'full'``.
+
+    :returns: The number of intents per check, or ``0`` to never check.
+    """
+    if validation is None:
+        validation = os.environ.get(_VALIDATION_ENVIRONMENT_VARIABLE, 'full')
+    if validation == 'full':
+        return 1
+    if validation == 'off':
+        return 0
+    try:
+        rate = int(validation)
+    except (TypeError, ValueError):
+        rate = 0
+    if rate < 1:
+        raise ValueError(
+            "Validation must be 'full', 'off' or a positive integer, "
+            "not {0!r}".format(validation))
+    return rate
+
+
+def _make_intent_from_args(args, validation=None):
     """
     Create an intent type for a given set of arguments.
 
+    The ``__init__`` of the returned type is generated code specialized to the
+    arguments, so constructing an intent performs only the type checks that
+    the arguments ask for.
+
     :param args: a dict with keys as the names of arguments and values as
-        :class:`argument`s.
+        :class:`argument`s. If the dict is ordered, the order is used as the
+        positional order of the arguments when calling providers.
+    :param validation: How often to type check arguments. See
+        :func:`interface`.
 
     :returns: A new type that can hold all of the data to call a function that
         has the given arguments.
     """
-    class _Intent(PClass):
-        _ziffect_fields = sorted(args.keys())
-
-        def _to_dict(self):
-            return OrderedDict(
-                (a, getattr(self, a)) for a in
-                sorted(list(k for k in self._ziffect_fields))
-            )
-
-    for name, arg in iteritems(args):
+    names = tuple(args.keys())
+    sample_rate = _validation_sample_rate(validation)
+    namespace = {
+        '_setattr': object.__setattr__,
+        '_isinstance': isinstance,
+        '_invalid': _raise_invalid_type,
+        '_tick': partial(next, count()),
+        '_sample_rate': sample_rate,
+    }
+    indent = '    ' if sample_rate == 1 else '        '
+    required = []
+    optional = []
+    checks = []
+    for name in names:
+        arg = args[name]
         if arg.default is _TOKEN:
-            setattr(_Intent, name, field(type=arg.type))
+            required.append(name)
         else:
-            setattr(_Intent, name, field(type=arg.type,
-                                         initial=arg.default))
-
-    _PIntent = add_metaclass(PClassMeta)(_Intent)
+            namespace['_default_' + name] = arg.default
+            optional.append('{0}=_default_{0}'.format(name))
+        namespace['_type_' + name] = arg.type
+        checks.append(
+            '{1}if not _isinstance({0}, _type_{0}):\n'
+            '{1}    _invalid(self.__class__, {0!r}, _type_{0}, {0})'.format(
+                name, indent))
+    if sample_rate == 0 or not checks:
+        checks = ['    pass']
+    elif sample_rate > 1:
+        checks.insert(0, '    if not _tick() % _sample_rate:')
+
+    source = _INTENT_INIT_TEMPLATE.format(
+        params=', '.join(required + optional),
+        checks='\n'.join(checks),
+        values=''.join(name + ', ' for name in names),
+    )
+    exec(compile(source, '<ziffect intent>', 'exec'), namespace)
 
-    return _PIntent
+    attributes = dict(
+        (name, _field_property(index))
+        for index, name in enumerate(names)
+    )
+    attributes.update(
+        __slots__=(),
+        __init__=namespace['__init__'],
+        _ziffect_fields=tuple(sorted(names)),
+        _ziffect_args=names,
+        _ziffect_arguments=tuple(args[name] for name in names),
+    )
+    return type(str('_Intent'), (_IntentBase,), attributes)
 
 
 def _iterate_methods(interface):
@@ -80,102 +319,238 @@ def _iterate_methods(interface):
             yield operator_name
 
 
-def _get_method_argspecs(interface):
+def _get_method_args(interface, method_name):
     """
-    A generator to get the argspecs of methods on an interface.
+    Get the arguments of a method on an interface.
 
     :param interface: The ziffect interface to inspect.
+    :param method_name: The name of the method.
 
-    :yields: tuples of method name and dictionaries that map name of
-        argument to :class:`argument` instances.
+    :returns: An ordered dictionary that maps name of argument to
+        :class:`argument` instances, in declaration order.
     """
-    for method_name in _iterate_methods(interface):
-        method = getattr(interface, method_name)
-        sig = signature(method)
-        args = dict(
-            (name, arg.default)
-            for name, arg in iteritems(sig.parameters)
-        )
-        yield method_name, args
+    sig = signature(getattr(interface, method_name))
+    return OrderedDict(
+        (name, arg.default)
+        for name, arg in iteritems(sig.parameters)
+    )
 
 
-def _make_intents(argspecs):
+class _LazyMethods(object):
     """
-    Constructs intents for each of the argspecs passed in.
+    Base class for objects with an attribute for each method of an interface,
+    that is created the first time it is accessed.
 
-    :param argspecs: A dict with keys as method names, and values as
-        dicts that map name of argument to :class:`argument` instances.
+    Created attributes are stored on the instance, so later accesses are
+    ordinary attribute lookups.
 
-    :return: An intent class that has methods that return intents for each of
-        the methods.
+    :param interface: The ziffect interface.
+    """
+    def __init__(self, interface):
+        self._interface = interface
+        self._lock = Lock()
+
+    def _materialize(self, method_name):
+        """
+        Create the attribute for a method.
+        """
+        raise NotImplementedError()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(self._interface, name):
+            raise AttributeError(name)
+        with self._lock:
+            value = self.__dict__.get(name)
+            if value is None:
+                value = self.__dict__[name] = self._materialize(name)
+        return value
+
+    def __dir__(self):
+        return list(_iterate_methods(self._interface))
+
+
+class _Intents(_LazyMethods):
     """
-    def _Intents(object):
-        pass
+    The intent types of the methods of an interface.
 
-    intents = dict(
-     (method_name, _make_intent_from_args(args))
-     for method_name, args in iteritems(argspecs)
-    )
+    :param interface: The ziffect interface.
+    :param validation: How often to type check arguments. See
+        :func:`interface`.
+    """
+    def __init__(self, interface, validation):
+        super(_Intents, self).__init__(interface)
+        self._validation = validation
 
-    for k, v in iteritems(intents):
-        setattr(_Intents, k, v)
-    return _Intents
+    def _materialize(self, method_name):
+        intent = _make_intent_from_args(
+            _get_method_args(self._interface, method_name), self._validation)
+        intent._ziffect_name = _intent_name(self._interface, method_name)
+        _intent_registry[intent._ziffect_name] = intent
+        return intent
 
 
-def _make_effect_method(intent):
+_DEFAULT_INTERN_SIZE = 4096
+
+
+class _InternTable(object):
     """
-    Turn an intent into a method that creates an effect.
+    A bounded table of canonical intents, keyed by their values.
 
-    :param intent: The class for the intent.
+    Entries are kept in two generations. Lookups are made in the recent
+    generation, and entries found in the older one are moved back into it.
+    When the recent generation fills half the table it becomes the older one,
+    dropping the entries that were not used since the last turnover. This
+    approximates a least recently used table, with a single dict lookup per
+    hit.
 
-    :returns Effect: An effect that describes the given intent.
+    :param size: The maximum number of entries.
     """
-    def _method(self, **kwargs):
-        return Effect(intent(**kwargs))
-    return _method
+    def __init__(self, size):
+        self._limit = max(size // 2, 1)
+        self._lock = Lock()
+        self.recent = {}
+        self._older = {}
+
+    def add(self, key, make):
+        """
+        Find the entry of a key that is not in the recent generation, or
+        create it with ``make()`` and add it.
+        """
+        with self._lock:
+            value = self._older.pop(key, None)
+            if value is None:
+                value = self.recent.get(key)
+            if value is None:
+                value = make()
+            if len(self.recent) >= self._limit:
+                self._older = self.recent.copy()
+                self.recent.clear()
+            self.recent[key] = value
+        return value
+
+
+_INTERNING_EFFECT_METHOD_TEMPLATE = """
+def _method({params}):
+    _ziffect_key = ({key})
+    try:
+        _ziffect_intent = _get(_ziffect_key)
+    except TypeError:
+        return _Effect(_intent({kwargs}))
+    if _ziffect_intent is None:
+        _ziffect_intent = _add(_ziffect_key, lambda: _intent({kwargs}))
+    return _Effect(_ziffect_intent)
+"""
 
 
-def _make_effects(intents, method_names):
+def _make_effect_method(intent, intern=0):
     """
-    Creates a class that has methods that generate effects for the given
-    intents.
+    Turn an intent into a function that creates an effect.
+
+    :param intent: The class for the intent.
+    :param intern: The size of the table of canonical intents to reuse, or
+        ``0`` to create a new intent for every effect.
+
+    :returns: A function that takes the arguments of the intent as keyword
+        arguments, and returns an Effect that describes the given intent.
+    """
+    if not intern:
+        def _method(**kwargs):
+            return Effect(intent(**kwargs))
+        return _method
+
+    table = _InternTable(intern)
+    namespace = {
+        '_Effect': Effect,
+        '_intent': intent,
+        '_type': type,
+        '_get': table.recent.get,
+        '_add': table.add,
+    }
+    required = []
+    optional = []
+    for name, arg in zip(intent._ziffect_args, intent._ziffect_arguments):
+        if arg.default is _TOKEN:
+            required.append(name)
+        else:
+            namespace['_default_' + name] = arg.default
+            optional.append('{0}=_default_{0}'.format(name))
+    # The types of the values are part of the key, so that values that are
+    # equal but of different types, such as ``1`` and ``1.0``, are type
+    # checked and passed to providers as given.
+    source = _INTERNING_EFFECT_METHOD_TEMPLATE.format(
+        params=', '.join(required + optional),
+        key=''.join('{0}, _type({0}), '.format(name)
+                    for name in intent._ziffect_args),
+        kwargs=', '.join('{0}={0}'.format(name)
+                         for name in intent._ziffect_args),
+    )
+    exec(compile(source, '<ziffect effect>', 'exec'), namespace)
+    return namespace['_method']
 
-    :param intents: Corresponding _Intents object.
-    :param method_names: list of the method_names of the interface.
 
-    :returns: A new class with method names equal to the keys of the input.
-        Each method on this class will generate an Effect for use with the
-        Effect library.
+class _Effects(_LazyMethods):
     """
-    class _Effects(object):
-        pass
+    The functions that generate effects for the methods of an interface.
 
-    for method_name in method_names:
-        intent = getattr(intents, method_name)
-        method = _make_effect_method(intent)
-        setattr(_Effects, method_name, method)
+    :param intents: Corresponding :class:`_Intents` object.
+    :param intern: The size of the table of canonical intents of each
+        method, or ``0`` to not reuse intents.
+    """
+    def __init__(self, intents, intern=0):
+        super(_Effects, self).__init__(intents._interface)
+        self._intents = intents
+        self._intern = intern
 
-    return _Effects()
+    def _materialize(self, method_name):
+        return _make_effect_method(
+            getattr(self._intents, method_name), self._intern)
 
 
-def interface(wrapped_class):
+def interface(wrapped_class=None, validation=None, intern=None):
     """
     Class decorator to wrap ziffect interfaces.
 
+    Arguments of intents are type checked when the intents are created. This
+    can be relaxed for hot code paths by passing ``validation``, in which case
+    the decorator is used as ``@ziffect.interface(validation='off')``. Intents
+    are equal and hashable whatever the validation mode.
+
+    Programs that create effects with the same arguments over and over can
+    pass ``intern``, so that the effects of :func:`effects` share one intent
+    for each combination of arguments, which is created and type checked once
+    and compares equal to itself by identity. Intents with unhashable
+    arguments are created anew. Intents created with :func:`intents` are not
+    interned.
+
+    The intent type and effect function of a method are created the first
+    time they are used, so decorating an interface with many methods is cheap.
+
     :param wrapped_class: The class to wrap.
+    :param validation: ``'full'`` to check the arguments of every intent,
+        ``'off'`` to never check them, or a positive integer ``N`` to check
+        the arguments of one in every ``N`` intents. Defaults to the value of
+        the ``ZIFFECT_VALIDATION`` environment variable, or ``'full'`` if it
+        is not set.
+    :param intern: ``True`` to reuse the intents of recently created effects
+        of each method, or the number of intents to keep per method. Defaults
+        to not reusing intents.
 
     :returns: The newly created wrapped class.
     """
-    wrapped_class._ziffect_argspecs = dict(
-        (key, value)
-        for key, value in _get_method_argspecs(wrapped_class)
-    )
-    wrapped_class._ziffect_intents = _make_intents(
-        wrapped_class._ziffect_argspecs)
-    wrapped_class._ziffect_effects = _make_effects(
-        wrapped_class._ziffect_intents,
-        wrapped_class._ziffect_argspecs.keys()
-    )
+    if wrapped_class is None:
+        return partial(interface, validation=validation, intern=intern)
+    validation = _validation_sample_rate(validation) or 'off'
+    if intern is True:
+        intern = _DEFAULT_INTERN_SIZE
+    elif not intern:
+        intern = 0
+    elif intern < 1:
+        raise ValueError(
+            'intern must be a boolean or a positive integer, not '
+            '{0!r}'.format(intern))
+    wrapped_class._ziffect_intents = _Intents(wrapped_class, validation)
+    wrapped_class._ziffect_effects = _Effects(
+        wrapped_class._ziffect_intents, intern)
     return wrapped_class
 
 
@@ -220,75 +595,798 @@ def implements(interface):
     return _implements_decorator
 
 
-def _destruct_intent(intent):
+_accepts_positionally_cache = {}
+
+
+def _accepts_positionally(method, arg_keys):
+    """
+    Determine whether ``method`` can be called with the values of an intent
+    passed positionally, that is whether its leading parameters are named
+    ``arg_keys`` in the same order.
+
+    The answer for the methods of a class is worked out once, so providers
+    bound per request (see :mod:`ziffect.scoped`) do not inspect signatures.
+    """
+    function = getattr(method, '__func__', None)
+    if function is None or getattr(method, '__self__', None) is None:
+        return _inspect_accepts_positionally(method, arg_keys)
+    key = (function, tuple(arg_keys))
+    result = _accepts_positionally_cache.get(key)
+    if result is None:
+        result = _accepts_positionally_cache[key] = (
+            _inspect_accepts_positionally(method, arg_keys))
+    return result
+
+
+def _inspect_accepts_positionally(method, arg_keys):
+    try:
+        parameters = list(signature(method).parameters.values())
+    except (TypeError, ValueError):
+        return False
+    if len(parameters) < len(arg_keys):
+        return False
+    for parameter, key in zip(parameters, arg_keys):
+        if (parameter.name != key or
+                parameter.kind != Parameter.POSITIONAL_OR_KEYWORD):
+            return False
+    return True
+
+
+def _make_call(method, arg_keys):
+    """
+    Constructs a function that calls ``method`` with the arguments held in an
+    intent.
+
+    When the method declares its arguments in the same order as the interface
+    the values of the intent are passed positionally, otherwise they are
+    passed as keyword arguments. Methods marked with
+    :func:`ziffect.deadlines.takes_deadline` are also passed the deadline of
+    the current context.
+
+    :param method: The underlying method to call.
+    :param arg_keys: Sequence of strings that are both the arguments of the
+        method and the names of the attributes of the intent, in the order
+        they are declared on the interface.
+
+    :returns: A function that takes an intent and returns the result of
+        calling ``method``.
+    """
+    arg_keys = tuple(arg_keys)
+    if getattr(method, '_ziffect_takes_deadline', False):
+        from ziffect.deadlines import _make_deadline_call
+        return _make_deadline_call(method, arg_keys)
+    if _accepts_positionally(method, arg_keys):
+        def _call(intent):
+            return method(*intent._ziffect_values)
+    else:
+        def _call(intent):
+            return method(**dict(zip(arg_keys, intent._ziffect_values)))
+    return _call
+
+
+def _settle(box, future):
+    """
+    Provide the outcome of a finished future to an Effect box. Works for both
+    ``concurrent.futures`` and ``asyncio`` futures.
+    """
+    try:
+        result = future.result()
+    except:
+        box.fail(sys.exc_info())
+    else:
+        box.succeed(result)
+
+
+class _ContextBox(object):
+    """
+    A box that provides the outcome of an intent in the context of the
+    program that performed it (see ``contextvars``), so that the program
+    continues in that context when the intent completes on another thread.
+    """
+    __slots__ = ('_box', '_context')
+
+    def __init__(self, box, context):
+        self._box = box
+        self._context = context
+
+    def succeed(self, result):
+        self._context.run(self._box.succeed, result)
+
+    def fail(self, exc_info):
+        self._context.run(self._box.fail, exc_info)
+
+
+def _context_box(box):
+    """
+    Wrap the box of an intent that completes on another thread in a
+    :class:`_ContextBox` of the current context, if ``contextvars`` is
+    available.
+    """
+    if copy_context is None:
+        return box
+    return _ContextBox(box, copy_context())
+
+
+class _ThreadLocalVariable(object):
     """
-    Destructs an intent into a dict that can be used as keyword arguments to a
-    ``ziffect`` style performer.
+    A stand-in for ``contextvars.ContextVar``, with values bound per thread.
     """
+    def __init__(self, name, default=None):
+        self._local = local()
+        self._default = default
 
+    def get(self):
+        return getattr(self._local, 'value', self._default)
 
-def _make_performer(method, arg_keys):
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+def _context_variable(name):
+    """
+    Create a ``contextvars.ContextVar`` whose default is ``None``, or a
+    :class:`_ThreadLocalVariable` if ``contextvars`` is not available.
+    """
+    if ContextVar is None:
+        return _ThreadLocalVariable(name, default=None)
+    return ContextVar(str(name), default=None)
+
+
+def _run_with(variable, value, function, *args):
+    """
+    Call ``function(*args)`` with ``variable`` set to ``value``, in a copy of
+    the current context if ``contextvars`` is available.
+    """
+    if copy_context is None:
+        token = variable.set(value)
+        try:
+            return function(*args)
+        finally:
+            variable.reset(token)
+
+    def _run():
+        variable.set(value)
+        return function(*args)
+    return copy_context().run(_run)
+
+
+def _context_runner():
+    """
+    :returns: A function that takes a function and its arguments, and calls
+        it in a copy of the current context, or in whatever context it is
+        called if ``contextvars`` is not available.
+    """
+    if copy_context is None:
+        return _call_directly
+    return copy_context().run
+
+
+def _call_directly(function, *args):
+    return function(*args)
+
+
+# The deadline of the effects performed in the current context, a
+# ziffect.deadlines.Deadline.
+_deadline = _context_variable('ziffect deadline')
+
+
+class _Scheduler(object):
+    """
+    A thread that calls functions at given times, started when the first
+    call is scheduled. One long-lived thread serves any number of calls.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._condition = Condition()
+        self._heap = []
+        self._cancelled = 0
+        self._sequence = count()
+        self._thread = None
+
+    def schedule(self, when, function):
+        """
+        Call ``function()`` once :func:`_clock` reaches ``when``.
+
+        :returns: A function that cancels the call.
+        """
+        entry = [when, next(self._sequence), function]
+        with self._condition:
+            heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self._name)
+                self._thread.daemon = True
+                self._thread.start()
+            if self._heap[0] is entry:
+                self._condition.notify()
+        return lambda: self._cancel(entry)
+
+    def _cancel(self, entry):
+        with self._condition:
+            if entry[2] is None:
+                return
+            entry[2] = None
+            self._cancelled += 1
+            # Drop cancelled calls once they are most of the heap, so that
+            # they do not hold memory until they were due.
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [each for each in self._heap
+                              if each[2] is not None]
+                heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    heap = self._heap
+                    while heap and heap[0][2] is None:
+                        heappop(heap)
+                        self._cancelled -= 1
+                    if not heap:
+                        self._condition.wait()
+                        continue
+                    delay = heap[0][0] - _clock()
+                    if delay <= 0:
+                        entry = heappop(heap)
+                        function, entry[2] = entry[2], None
+                        break
+                    self._condition.wait(delay)
+            try:
+                function()
+            except:
+                # The thread must keep running for the other calls.
+                pass
+
+
+def _make_call_performer(call, coroutine=False, executor=None):
+    """
+    Constructs a performer that provides the result of ``call(intent)``.
+
+    :param call: A function that takes an intent.
+    :param coroutine: Whether ``call`` returns a coroutine, which is then
+        scheduled on the running asyncio event loop. See :mod:`ziffect.aio`.
+    :param executor: An optional ``concurrent.futures.Executor`` to run
+        ``call`` on. Ignored if ``coroutine`` is true.
+
+    :returns: An Effect performer.
+    """
+    if coroutine:
+        from ziffect.aio import _make_coroutine_performer
+        return _make_coroutine_performer(call)
+
+    get_deadline = _deadline.get
+    if executor is not None:
+        def _perform(dispatcher, intent, box):
+            deadline = get_deadline()
+            if deadline is None:
+                future = executor.submit(call, intent)
+                future.add_done_callback(partial(_settle, _context_box(box)))
+            elif not deadline._fail_if_expired(box):
+                future = executor.submit(
+                    _run_with, _deadline, deadline, deadline._call, call,
+                    intent)
+                deadline._cancel_on_expiry(future)
+                future.add_done_callback(
+                    partial(deadline._settle, _context_box(box)))
+        return _perform
+
+    def _perform(dispatcher, intent, box):
+        deadline = get_deadline()
+        if deadline is not None and deadline._fail_if_expired(box):
+            return
+        try:
+            box.succeed(call(intent))
+        except:
+            box.fail(sys.exc_info())
+    return _perform
+
+
+def _make_performer(method, arg_keys, executor=None):
     """
     Constructs a performer for that calls a specific method. This involves
-    unpacking the intent into keyword arguments for the method.
+    unpacking the intent into arguments for the method.
+
+    If the method is a coroutine function (``async def``) the performer
+    schedules it on the running asyncio event loop, and provides the result
+    when it completes. See :mod:`ziffect.aio`. Otherwise, if an executor is
+    given the method is submitted to it, and the result is provided from the
+    executor's thread when it completes.
 
-    Note that this presently does not pass the dispatcher down to the
-    underlying method. Thus, ziffect interface implementations presently cannot
-    perform other effects that have side effects.
+    Note that this does not pass the dispatcher down to the underlying method.
+    Provider methods that perform other effects are marked with
+    :func:`ziffect.fanout.fans_out` instead.
 
     :param method: The underlying method to call. Should be a method bound to
         an object that provides a ziffect interface.
-    :param arg_keys: Iterable of strings that are both the keyword arguments of
-        the method and the names of the attributes of the intent.
+    :param arg_keys: Sequence of strings that are both the arguments of the
+        method and the names of the attributes of the intent, in the order
+        they are declared on the interface.
+    :param executor: An optional ``concurrent.futures.Executor`` to run the
+        method on.
 
     :returns: An Effect performer that calls method with the arguments in the
         intent.
     """
-    @sync_performer
-    def _perform(dispatcher, intent):
-        return method(**intent._to_dict())
-    return _perform
+    return _make_call_performer(
+        _make_call(method, arg_keys),
+        coroutine=_iscoroutinefunction(method),
+        executor=executor)
 
 
-def dispatcher(interface_map):
+class CompiledDispatcher(TypeDispatcher):
     """
-    Creates a dispatcher for a number of interfaces.
+    An Effect dispatcher that finds the performer for an intent with a single
+    lookup in a table keyed by intent type.
 
-    :param interface_map: A map from ziffect interface to a provider of the
-        interface.
+    :param mapping: mapping of intent type to performer.
+    :param fallback: An optional dispatcher to consult for intents whose type
+        is not in ``mapping``.
+    """
+    def __init__(self, mapping, fallback=None):
+        super(CompiledDispatcher, self).__init__(mapping)
+        self.fallback = fallback
+        self._lookup = mapping.get
 
-    :returns: An Effect dispatcher that will use the passed in interfaces to
-        perform Effects that have been generated from the
-        ``ziffect.effect(interface).method()`` implementation.
+    def __call__(self, intent):
+        performer = self._lookup(type(intent))
+        if performer is None and self.fallback is not None:
+            return self.fallback(intent)
+        return performer
+
+
+def _method_option(option, interface, method_name):
+    """
+    Resolves a per-method option of :func:`dispatcher`.
+
+    :param option: Either a single value used for every method, or a dict
+        keyed by ``(interface, method_name)`` tuples and by interfaces. Keys
+        for a method take priority over keys for its interface.
+
+    :returns: The value of the option for the given method, or ``None``.
+    """
+    if isinstance(option, dict):
+        result = option.get((interface, method_name))
+        if result is None:
+            result = option.get(interface)
+        return result
+    return option
+
+
+def _method_metadata(interface, method_name, name, default=None):
+    """
+    Gets metadata that a decorator has attached to a method of an interface,
+    such as :func:`ziffect.batching.batched`.
+    """
+    return getattr(getattr(interface, method_name), name, default)
+
+
+def _wrapped_attributes(dispatcher, interface, method_name, name):
+    """
+    Find the values of an attribute of the performer of a method in a
+    dispatcher, and of the performers it wraps, following their
+    ``ziffect_wrapped`` attributes.
+
+    :returns: A list of the values that are not ``None``, of the outermost
+        performer first.
+    """
+    intent = getattr(intents(interface), method_name)
+    performer = dispatcher.mapping.get(intent)
+    values = []
+    while performer is not None:
+        value = getattr(performer, name, None)
+        if value is not None:
+            values.append(value)
+        performer = getattr(performer, 'ziffect_wrapped', None)
+    return values
+
+
+def _make_method_performer(interface, provider, method_name, executor=None,
+                           batch=None):
+    """
+    Constructs the performer for a method of an interface, according to how
+    the method and the provider are decorated and the :func:`dispatcher`
+    options.
+    """
+    intent = getattr(interface._ziffect_intents, method_name)
+    make_performer = getattr(provider, '_ziffect_make_performer', None)
+    if make_performer is not None:
+        return make_performer(interface, method_name, intent._ziffect_args)
+    method = getattr(provider, method_name)
+    method_executor = _method_option(executor, interface, method_name)
+    bulk_name = _method_metadata(interface, method_name, '_ziffect_bulk')
+    batch_policy = _method_option(batch, interface, method_name)
+    if bulk_name is not None and batch_policy is not None:
+        from ziffect.batching import _make_batching_performer
+        return _make_batching_performer(
+            getattr(provider, bulk_name), batch_policy,
+            executor=method_executor)
+    if getattr(method, '_ziffect_fans_out', False):
+        from ziffect.fanout import _make_fanout_performer
+        return _make_fanout_performer(method, intent._ziffect_args)
+    stream_buffer = _method_metadata(
+        interface, method_name, '_ziffect_stream_buffer')
+    if stream_buffer is not None:
+        from ziffect.streams import _make_streaming_performer
+        return _make_streaming_performer(
+            method, intent._ziffect_args, stream_buffer,
+            executor=method_executor)
+    return _make_performer(
+        method, intent._ziffect_args, executor=method_executor)
+
+
+def _performer_wrapper(interface, retry=None, bulkhead=None):
+    """
+    Makes the function that wraps the performers of the methods of an
+    interface with the bulkheads, retries and caches of the
+    :func:`dispatcher` options.
+
+    Bulkheads are made once, and shared by every call of the function, while
+    retries, with their circuit breakers, and caches are made by each call,
+    so that they only apply to the performers of one provider.
+
+    :returns: A function that takes a dict from method name to performer,
+        and returns a new dict from method name to performer.
+    """
+    bulkheads = None
+    if bulkhead is not None:
+        from ziffect.bulkheads import _make_bulkheads
+        bulkheads = _make_bulkheads(
+            interface, list(_iterate_methods(interface)), bulkhead)
+
+    def _wrap(performers):
+        if bulkheads is not None:
+            from ziffect.bulkheads import _add_bulkheads
+            performers = _add_bulkheads(performers, bulkheads)
+        performers = dict(performers)
+        for method_name in performers:
+            retry_policy = _method_option(retry, interface, method_name)
+            if retry_policy is not None:
+                from ziffect.retry import _make_retrying_performer
+                performers[method_name] = _make_retrying_performer(
+                    performers[method_name], retry_policy)
+
+        if any(_method_metadata(interface, method_name, '_ziffect_cache')
+               for method_name in performers):
+            from ziffect.caching import _add_caching
+            performers = _add_caching(interface, performers)
+        return performers
+    return _wrap
+
+
+def _build_typemap(interface_map, executor=None, batch=None,
+                   instrument=None, retry=None, bulkhead=None):
+    """
+    Builds the map from intent type to performer for the interfaces in
+    ``interface_map``.
+
+    Providers with a ``_ziffect_make_performers(interface, wrap)`` method,
+    such as :class:`ziffect.scoped.ScopedProvider`, make the performers of
+    the interface themselves, and wrap those of the providers they perform
+    intents with using ``wrap``.
     """
     typemap = {}
     for interface, provider in iteritems(interface_map):
         intents = interface._ziffect_intents
-        argspecs = interface._ziffect_argspecs
-        for method_name in _iterate_methods(interface):
-            method = getattr(provider, method_name)
-            intent = getattr(intents, method_name)
-            typemap[intent] = _make_performer(method,
-                                              argspecs[method_name].keys())
-    return TypeDispatcher(typemap)
+        wrap = _performer_wrapper(interface, retry, bulkhead)
+        make_performers = getattr(provider, '_ziffect_make_performers', None)
+        if make_performers is not None:
+            performers = make_performers(interface, wrap)
+        else:
+            performers = wrap(dict(
+                (method_name, _make_method_performer(
+                    interface, provider, method_name, executor, batch))
+                for method_name in _iterate_methods(interface)))
+
+        if instrument is not None:
+            from ziffect.metrics import _make_instrumented_performer
+            performers = dict(
+                (method_name, _make_instrumented_performer(
+                    performer, instrument.recorder(interface, method_name)))
+                for method_name, performer in iteritems(performers))
+
+        for method_name, performer in iteritems(performers):
+            typemap[getattr(intents, method_name)] = performer
+
+        if any(_method_metadata(interface, method_name,
+                                '_ziffect_stream_buffer') is not None
+               for method_name in performers):
+            from ziffect.streams import ReadStream, perform_read
+            typemap[ReadStream] = perform_read
+    return typemap
+
+
+def dispatcher(interface_map, executor=None, batch=None, instrument=None,
+               retry=None, bulkhead=None):
+    """
+    Creates a dispatcher for a number of interfaces.
 
+    Every call builds new performers, along with the state some of them keep,
+    such as caches, circuit breakers and bulkheads. Build dispatchers once,
+    for instance with :func:`compile_dispatcher` at startup, and reuse them
+    rather than creating one per request.
 
-def _i(fun):
-    def b(i):
-        return fun(**i._to_dict())
-    return b
+    Provider methods are called synchronously by default. Blocking methods can
+    instead be run on a ``concurrent.futures`` executor, in which case their
+    effects complete asynchronously, from the executor's thread. Use
+    :mod:`ziffect.threads` to perform such effects, so that effects issued
+    with ``effect.parallel`` overlap.
 
+    :param interface_map: A map from ziffect interface to a provider of the
+        interface, or to a :class:`ziffect.processes.ProcessProvider` to call
+        the methods in worker processes.
+    :param executor: An optional ``concurrent.futures.Executor`` to run every
+        provider method on, or a dict that maps interfaces and
+        ``(interface, method_name)`` tuples to executors. Methods not in the
+        dict are called synchronously.
+    :param batch: An optional :class:`ziffect.batching.BatchPolicy`, or a
+        dict keyed like ``executor``. Intents of methods that have been
+        paired with a bulk method using :func:`ziffect.batching.batched` are
+        collected according to the policy and performed with one call to the
+        bulk method. Such effects complete asynchronously.
+    :param instrument: An optional object with a ``recorder(interface,
+        method_name)`` method that returns a function, which is called with
+        the duration in seconds and whether the effect failed each time an
+        effect of the method completes. See
+        :class:`ziffect.metrics.MetricsCollector`. Without it performers are
+        not instrumented at all.
+    :param retry: An optional :class:`ziffect.retry.RetryPolicy`, or a dict
+        keyed like ``executor``. Failed calls of the methods are retried with
+        backoff, and may be cut off by a circuit breaker. Retried effects
+        complete asynchronously if the dispatcher performs ``effect.Delay``
+        asynchronously.
+    :param bulkhead: An optional :class:`ziffect.bulkheads.BulkheadPolicy`
+        that limits how many effects of each method are performed at once,
+        or a dict of policies keyed by interfaces, whose methods share one
+        limit, and by ``(interface, method_name)`` tuples. Each attempt of a
+        retried method is limited, and cached results are not.
+
+    :returns: A :class:`CompiledDispatcher` that will use the passed in
+        interfaces to perform Effects that have been generated from the
+        ``ziffect.effect(interface).method()`` implementation.
+    """
+    return CompiledDispatcher(_build_typemap(
+        interface_map, executor, batch, instrument, retry, bulkhead))
+
+
+def compile_dispatcher(dispatchers):
+    """
+    Flattens a number of dispatchers into a single :class:`CompiledDispatcher`.
+
+    This is a replacement for ``ComposedDispatcher``: the dispatchers are
+    searched in the same order, but all ``TypeDispatcher`` s (including
+    nested ``ComposedDispatcher`` s of them) are merged into one table, so
+    finding a performer takes one lookup however many interfaces are
+    registered. Any other kind of dispatcher, and everything after it, is
+    consulted in order when the table has no performer for an intent.
+
+    :param dispatchers: A sequence of Effect dispatchers and interface maps,
+        in the order they should be searched. Interface maps are turned into
+        dispatchers with :func:`dispatcher`.
+
+    :returns: A :class:`CompiledDispatcher`.
+    """
+    mapping = {}
+    remaining = list(dispatchers)
+    fallback = None
+    while remaining:
+        part = remaining.pop(0)
+        if isinstance(part, dict):
+            part = dispatcher(part)
+        if isinstance(part, TypeDispatcher):
+            for intent_type, performer in iteritems(part.mapping):
+                mapping.setdefault(intent_type, performer)
+            if getattr(part, 'fallback', None) is not None:
+                remaining.insert(0, part.fallback)
+        elif isinstance(part, ComposedDispatcher):
+            remaining[0:0] = part.dispatchers
+        else:
+            remaining.insert(0, part)
+            if len(remaining) == 1:
+                fallback = part
+            else:
+                fallback = ComposedDispatcher(remaining)
+            break
+    return CompiledDispatcher(mapping, fallback)
 
-def perform_sequence_destructed_args(sequence, effect_generator):
+
+def _destructed_performer(function):
+    """
+    Constructs a performer that calls ``function`` with the values of an
+    intent as keyword arguments.
+    """
+    def _perform(dispatcher, intent, box):
+        try:
+            box.succeed(
+                function(**dict(zip(intent._ziffect_args,
+                                    intent._ziffect_values))))
+        except:
+            box.fail(sys.exc_info())
+    return _perform
+
+
+class _OrderedSequence(object):
+    """
+    Matches intents against a sequence of ``(intent, function)`` tuples in
+    order. Only the next tuple is read from the sequence, so it may be a lazy
+    iterator.
+    """
+    def __init__(self, sequence):
+        self._items = iter(sequence)
+        self._next = next(self._items, None)
+        self._step = 0
+
+    def __call__(self, intent):
+        expected = self._next
+        if expected is None or expected[0] != intent:
+            return None
+        self._next = next(self._items, None)
+        self._step += 1
+        return _destructed_performer(expected[1])
+
+    def mismatch(self, intent):
+        if self._next is None:
+            return ('Intent {0!r} was performed after the end of the '
+                    'sequence'.format(intent))
+        return ('Intent {0!r} was performed at step {1}, but {2!r} was '
+                'expected'.format(intent, self._step, self._next[0]))
+
+    def check_consumed(self):
+        if self._next is not None:
+            raise AssertionError(
+                'Not all intents were performed, starting at step {0}: '
+                '{1!r}'.format(self._step, self._next[0]))
+
+
+class _UnorderedSequence(object):
+    """
+    Matches intents against a multiset of ``(intent, function)`` tuples, in
+    any order. Tuples are indexed by intent type and then by intent, except
+    for intents with unhashable arguments, which are searched for among those
+    of the same type.
+
+    With a ``window``, at most that many tuples that have not been matched
+    are read from the sequence at a time, so it may be a lazy iterator, and
+    intents are only matched against the tuples in the window.
+    """
+    def __init__(self, sequence, window=None):
+        self._items = iter(sequence)
+        self._window = window
+        self._exhausted = False
+        self._hashable = {}
+        self._unhashable = {}
+        self._remaining = 0
+        self._fill()
+
+    def _fill(self):
+        window = self._window
+        while not self._exhausted and (window is None or
+                                       self._remaining < window):
+            item = next(self._items, None)
+            if item is None:
+                self._exhausted = True
+                return
+            intent, function = item
+            try:
+                self._hashable.setdefault(type(intent), {}).setdefault(
+                    intent, deque()).append(function)
+            except TypeError:
+                self._unhashable.setdefault(type(intent), []).append(
+                    (intent, function))
+            self._remaining += 1
+
+    def __call__(self, intent):
+        function = self._take(intent)
+        if function is None:
+            return None
+        self._remaining -= 1
+        self._fill()
+        return _destructed_performer(function)
+
+    def _take(self, intent):
+        intents = self._hashable.get(type(intent))
+        if intents:
+            try:
+                functions = intents.get(intent)
+            except TypeError:
+                functions = None
+            if functions:
+                function = functions.popleft()
+                if not functions:
+                    del intents[intent]
+                return function
+        items = self._unhashable.get(type(intent))
+        if items:
+            for index, (expected, function) in enumerate(items):
+                if expected == intent:
+                    del items[index]
+                    return function
+        return None
+
+    def _count(self, intent_type):
+        return (sum(len(functions) for functions in
+                    self._hashable.get(intent_type, {}).values()) +
+                len(self._unhashable.get(intent_type, ())))
+
+    def mismatch(self, intent):
+        if not self._exhausted:
+            return ('Intent {0!r} is not among the next {1} intents of the '
+                    'sequence, {2} of the same type; it may be further '
+                    'ahead than the window allows'.format(
+                        intent, self._remaining, self._count(type(intent))))
+        return ('Intent {0!r} is not in the sequence, which has {1} intents '
+                'left, {2} of the same type'.format(
+                    intent, self._remaining, self._count(type(intent))))
+
+    def check_consumed(self):
+        if self._remaining:
+            example = next(chain(
+                (intent for intents in self._hashable.values()
+                 for intent in intents),
+                (intent for items in self._unhashable.values()
+                 for intent, _ in items)))
+            raise AssertionError(
+                'Not all intents were performed: {0}{1} intents left, '
+                'such as {2!r}'.format(
+                    '' if self._exhausted else 'at least ',
+                    self._remaining, example))
+
+
+_sequence_fallback_dispatcher = ComposedDispatcher([
+    TypeDispatcher({ParallelEffects: perform_parallel_async}),
+    base_dispatcher,
+])
+
+
+def perform_sequence_destructed_args(sequence, effect_generator, ordered=True,
+                                     fallback_dispatcher=None, window=None):
     """
     Expect a sequence of intents and call a list of functions on those intents.
     Destruct the intents into keyword arguments. This enables testing of
     ``ziffect`` -style performers.
 
-    :param sequence: A list of (intent, bound-ziffect-provider-method) tuples.
+    Each intent is matched against the sequence in constant time, and the
+    sequence is read lazily when ``ordered`` is true or there is a ``window``,
+    so it can be a generator of any length.
+
+    :param sequence: An iterable of (intent, bound-ziffect-provider-method)
+        tuples.
     :param effect_generator: The effect to perform.
+    :param ordered: Whether the intents must be performed in the order of
+        the sequence. If not, the sequence is treated as a multiset, which
+        suits programs that perform effects in parallel.
+    :param fallback_dispatcher: A dispatcher for intents that do not match
+        the sequence, defaulting to ``effect.base_dispatcher`` and a performer
+        of ``effect.ParallelEffects``.
+    :param window: If ``ordered`` is false, an optional number of tuples of
+        the sequence that intents are matched against, read ahead as they are
+        matched. Without it the whole sequence is read first.
+
+    :raises AssertionError: if an intent does not match the sequence, or the
+        window of it, or the fallback dispatcher, or not every intent of the
+        sequence is performed.
+
+    :returns: The result of the effect.
     """
-    return perform_sequence(
-        list((intent, _i(function))
-             for intent, function in sequence),
-        effect_generator)
+    if ordered:
+        expected = _OrderedSequence(sequence)
+    else:
+        expected = _UnorderedSequence(sequence, window)
+    if fallback_dispatcher is None:
+        fallback_dispatcher = _sequence_fallback_dispatcher
+
+    def dispatcher(intent):
+        performer = expected(intent)
+        if performer is None:
+            performer = fallback_dispatcher(intent)
+        if performer is None:
+            raise AssertionError(expected.mismatch(intent))
+        return performer
+
+    result = sync_perform(dispatcher, effect_generator)
+    expected.check_consumed()
+    return result
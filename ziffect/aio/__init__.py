@@ -0,0 +1,152 @@
+"""
+The ziffect.aio module, for performing ziffect effects on an asyncio event
+loop.
+
+Providers may implement interface methods as coroutine functions
+(``async def``). Dispatchers built by :func:`ziffect.dispatcher` schedule those
+methods on the running event loop instead of blocking on them, so many effect
+programs can wait on I/O at once. Use :func:`asyncio_perform` to run an effect
+program on the event loop.
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+from functools import partial
+
+from effect import (
+    TypeDispatcher, ParallelEffects, Delay, perform, base_dispatcher
+)
+
+import ziffect
+from ziffect import _settle, perform_parallel_async
+
+__all__ = [
+    'asyncio_perform',
+    'async_dispatcher',
+    'asyncio_base_dispatcher',
+    'schedule_on_loop',
+]
+
+
+def _make_coroutine_performer(call):
+    """
+    Constructs a performer for a provider method that is a coroutine function.
+
+    :param call: A function that takes an intent and returns the coroutine of
+        the provider method.
+
+    :returns: An Effect performer that schedules the coroutine on the running
+        event loop and provides its result when it completes. If the deadline
+        of the current context passes first, the coroutine is cancelled (see
+        :mod:`ziffect.deadlines`).
+    """
+    get_deadline = ziffect._deadline.get
+
+    def _perform(dispatcher, intent, box):
+        deadline = get_deadline()
+        if deadline is None:
+            future = asyncio.ensure_future(call(intent))
+            future.add_done_callback(partial(_settle, box))
+        elif not deadline._fail_if_expired(box):
+            future = asyncio.ensure_future(call(intent))
+            timer = future.get_loop().call_later(
+                deadline.remaining(), future.cancel)
+            future.add_done_callback(lambda _: timer.cancel())
+            future.add_done_callback(partial(deadline._settle, box))
+    return _perform
+
+
+async def _take_items(iterator, count):
+    items = []
+    while len(items) < count:
+        try:
+            items.append(await iterator.__anext__())
+        except StopAsyncIteration:
+            break
+    return items
+
+
+def _take_async(iterator, count):
+    """
+    Take up to ``count`` items of an asynchronous iterator on the running
+    event loop. See :mod:`ziffect.streams`.
+
+    :returns: An ``asyncio.Future`` of the list of items.
+    """
+    return asyncio.ensure_future(_take_items(iterator, count))
+
+
+def perform_delay_with_asyncio(dispatcher, intent, box):
+    """
+    Perform a :obj:`effect.Delay` without blocking the running event loop.
+    """
+    asyncio.get_event_loop().call_later(intent.delay, box.succeed, None)
+
+
+def schedule_on_loop(delay, function):
+    """
+    Call ``function`` after ``delay`` seconds on the running event loop. Use
+    this as the scheduler of a :class:`ziffect.batching.BatchPolicy` when
+    performing with :func:`asyncio_perform`.
+    """
+    asyncio.get_event_loop().call_later(delay, function)
+
+
+asyncio_base_dispatcher = ziffect.compile_dispatcher([
+    TypeDispatcher({
+        ParallelEffects: perform_parallel_async,
+        Delay: perform_delay_with_asyncio,
+    }),
+    base_dispatcher,
+])
+
+
+def async_dispatcher(interface_map):
+    """
+    Creates a dispatcher for a number of interfaces that is suitable for use
+    with :func:`asyncio_perform`.
+
+    This is :func:`ziffect.dispatcher` combined with
+    :obj:`asyncio_base_dispatcher`, so ``effect.parallel`` performs its child
+    effects concurrently and ``effect.Delay`` does not block the event loop.
+
+    :param interface_map: A map from ziffect interface to a provider of the
+        interface.
+
+    :returns: A :class:`ziffect.CompiledDispatcher`.
+    """
+    return ziffect.compile_dispatcher([
+        ziffect.dispatcher(interface_map),
+        asyncio_base_dispatcher,
+    ])
+
+
+def asyncio_perform(dispatcher, effect, loop=None):
+    """
+    Perform an effect on an asyncio event loop.
+
+    Performing starts on the next iteration of the loop, so performers always
+    run while the loop is running.
+
+    :param dispatcher: The Effect dispatcher to use.
+    :param effect: The Effect to perform.
+    :param loop: The event loop to use. Defaults to the current event loop.
+
+    :returns: An ``asyncio.Future`` of the result of the effect.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    future = loop.create_future()
+
+    def succeed(result):
+        if not future.cancelled():
+            future.set_result(result)
+
+    def fail(exc_info):
+        if not future.cancelled():
+            future.set_exception(exc_info[1])
+
+    loop.call_soon(
+        perform, dispatcher, effect.on(success=succeed, error=fail))
+    return future
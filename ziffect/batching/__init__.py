@@ -0,0 +1,213 @@
+"""
+The ziffect.batching module, for coalescing many intents of one interface
+method into a single call to a bulk method of the provider.
+
+A method of an interface is paired with a bulk counterpart using
+:func:`batched`::
+
+    @ziffect.interface
+    class DBInterface(object):
+
+        @ziffect.batching.batched('get_many')
+        def get(doc_id=ziffect.argument(type=UUID),
+                rev=ziffect.argument(type=int, default=LATEST)):
+            pass
+
+Providers then implement ``get_many``, which takes a list of ``get`` intents
+and returns a list of results in the same order::
+
+    @ziffect.implements(DBInterface)
+    class ZiffectDB(object):
+        def get_many(self, intents):
+            return self.db.get_many([(i.doc_id, i.rev) for i in intents])
+
+Batching is turned on by passing a :class:`BatchPolicy` to
+:func:`ziffect.dispatcher`. Intents are collected until the policy's
+``max_size`` is reached or its ``delay`` has passed, identical intents are
+deduplicated, and the bulk method is called once for the whole batch.
+Batched effects complete asynchronously, so they should be performed with
+:func:`ziffect.threads.blocking_perform` or :func:`ziffect.aio.asyncio_perform`
+and issued concurrently, for instance with ``effect.parallel``.
+"""
+
+from __future__ import absolute_import
+
+import sys
+from threading import Lock
+
+from pyrsistent import PClass, field
+
+from ziffect import (
+    _Scheduler, _clock, _make_call_performer, _iscoroutinefunction,
+    _context_box)
+
+__all__ = [
+    'batched',
+    'BatchPolicy',
+    'schedule_with_timer',
+]
+
+
+def batched(bulk_method_name):
+    """
+    Decorator for methods of a ziffect interface, that pairs the method with
+    a bulk method of the same providers.
+
+    :param bulk_method_name: The name of the bulk method on providers. It is
+        called with a list of intents of the decorated method, and must return
+        a list of their results in the same order. A result that is an
+        exception instance fails the effect of that intent with the exception.
+
+    :returns: decorator for the interface method.
+    """
+    def _batched_decorator(method):
+        method._ziffect_bulk = bulk_method_name
+        return method
+    return _batched_decorator
+
+
+_batch_timer = _Scheduler('ziffect batches')
+
+
+def schedule_with_timer(delay, function):
+    """
+    Call ``function`` after ``delay`` seconds on a timer thread. This is the
+    default scheduler of :class:`BatchPolicy`.
+
+    One long-lived thread calls the functions of every batch, so bulk methods
+    that block should be run on an executor (see :func:`ziffect.dispatcher`).
+    """
+    _batch_timer.schedule(_clock() + delay, function)
+
+
+class BatchPolicy(PClass):
+    """
+    How intents are collected into batches.
+
+    :ivar max_size: The largest number of intents in a batch. A batch is
+        performed as soon as it is full.
+    :ivar delay: The number of seconds to wait for more intents after the
+        first intent of a batch arrives.
+    :ivar scheduler: A function that takes a delay and a function, and calls
+        the function after the delay. Use
+        :func:`ziffect.aio.schedule_on_loop` when performing on an asyncio
+        event loop.
+    """
+    max_size = field(type=int, initial=100)
+    delay = field(type=(int, float), initial=0.001)
+    scheduler = field(initial=lambda: schedule_with_timer)
+
+
+class _FanOutBox(object):
+    """
+    A box for the result of a bulk method, that provides each result to the
+    boxes of the intents in the batch.
+
+    :param boxes: A list with an entry for each intent passed to the bulk
+        method. Each entry is a list of the boxes waiting on that intent.
+    """
+    def __init__(self, boxes):
+        self._boxes = boxes
+
+    def succeed(self, results):
+        try:
+            results = list(results)
+            if len(results) != len(self._boxes):
+                raise ValueError(
+                    'Bulk method returned %d results for %d intents' % (
+                        len(results), len(self._boxes)))
+        except:
+            self.fail(sys.exc_info())
+            return
+        for result, boxes in zip(results, self._boxes):
+            for box in boxes:
+                if isinstance(result, BaseException):
+                    box.fail((type(result), result, None))
+                else:
+                    box.succeed(result)
+
+    def fail(self, exc_info):
+        for boxes in self._boxes:
+            for box in boxes:
+                box.fail(exc_info)
+
+
+class _Collector(object):
+    """
+    Collects the intents of one method into batches.
+
+    :param performer: The performer for the bulk method, which is performed
+        with the list of intents of a batch.
+    :param policy: The :class:`BatchPolicy`.
+    """
+    def __init__(self, performer, policy):
+        self._performer = performer
+        self._policy = policy
+        self._lock = Lock()
+        self._pending = []
+        self._scheduled = False
+
+    def add(self, dispatcher, intent, box):
+        batch = None
+        schedule = False
+        with self._lock:
+            self._pending.append((intent, _context_box(box)))
+            if len(self._pending) >= self._policy.max_size:
+                batch, self._pending = self._pending, []
+            elif not self._scheduled:
+                self._scheduled = schedule = True
+        if batch:
+            self._perform(dispatcher, batch)
+        elif schedule:
+            self._policy.scheduler(
+                self._policy.delay, lambda: self.flush(dispatcher))
+
+    def flush(self, dispatcher):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._scheduled = False
+        if batch:
+            self._perform(dispatcher, batch)
+
+    def _perform(self, dispatcher, batch):
+        intents = []
+        boxes = []
+        index = {}
+        for intent, box in batch:
+            try:
+                position = index.get(intent)
+            except TypeError:
+                # Intents with unhashable arguments are not deduplicated.
+                position = None
+                hashable = False
+            else:
+                hashable = True
+            if position is None:
+                if hashable:
+                    index[intent] = len(intents)
+                intents.append(intent)
+                boxes.append([box])
+            else:
+                boxes[position].append(box)
+        self._performer(dispatcher, intents, _FanOutBox(boxes))
+
+
+def _make_batching_performer(bulk_method, policy, executor=None):
+    """
+    Constructs a performer that collects intents into batches, and performs
+    each batch with one call to ``bulk_method``.
+
+    :param bulk_method: The bulk method of the provider.
+    :param policy: The :class:`BatchPolicy`.
+    :param executor: An optional ``concurrent.futures.Executor`` to run the
+        bulk method on.
+
+    :returns: An Effect performer.
+    """
+    collector = _Collector(
+        _make_call_performer(
+            bulk_method,
+            coroutine=_iscoroutinefunction(bulk_method),
+            executor=executor),
+        policy)
+    return collector.add
@@ -0,0 +1,321 @@
+"""
+The ziffect.bulkheads module, for limiting how many effects of an interface,
+or of one of its methods, are performed at once.
+
+Pass :class:`BulkheadPolicy` objects to :func:`ziffect.dispatcher`, keyed by
+interface to limit the methods of an interface together, and by
+``(interface, method_name)`` to limit one method on its own::
+
+    dispatcher = ziffect.dispatcher(
+        {DBInterface: ZiffectDB(db)},
+        executor=pool,
+        bulkhead={
+            DBInterface: ziffect.bulkheads.BulkheadPolicy(max_concurrent=20),
+            (DBInterface, 'scan'): ziffect.bulkheads.BulkheadPolicy(
+                max_concurrent=2, max_queued=10, overflow='shed'),
+        })
+
+Here ``scan`` is performed at most twice at once, and counts towards the
+limit of the interface too, so it cannot take the connections of the other
+methods. Intents over the limit are queued, or fail with
+:class:`BulkheadFullError`, according to the policy. A single policy, not in
+a dict, limits each method on its own.
+
+Limits only matter for effects that complete asynchronously, such as those
+of providers run on an executor (see :mod:`ziffect.threads`) or coroutine
+providers (see :mod:`ziffect.aio`). Use :func:`get_bulkheads` to read the
+depth of the queues and how long intents waited in them.
+"""
+
+from __future__ import absolute_import
+
+import sys
+from collections import deque
+from threading import Lock, local
+
+from pyrsistent import PClass, field
+
+import ziffect
+from ziffect import _clock
+
+__all__ = [
+    'BulkheadPolicy',
+    'BulkheadFullError',
+    'BulkheadStats',
+    'Bulkhead',
+    'get_bulkheads',
+    'WAIT',
+    'FAIL',
+    'SHED',
+]
+
+
+WAIT = 'wait'
+FAIL = 'fail'
+SHED = 'shed'
+
+
+class BulkheadFullError(Exception):
+    """
+    The failure of an intent that was turned away by a bulkhead.
+    """
+
+
+class BulkheadPolicy(PClass):
+    """
+    How many intents a bulkhead performs at once, and what happens to the
+    others.
+
+    :ivar max_concurrent: The largest number of intents performed at once.
+    :ivar max_queued: The largest number of intents waiting for their turn,
+        or ``None`` for no limit.
+    :ivar overflow: What happens to an intent over the limit. With
+        :data:`WAIT` it is queued, and fails if the queue is full. With
+        :data:`FAIL` it fails at once. With :data:`SHED` it is queued, and
+        the intent that has waited longest fails if the queue is full.
+    """
+    max_concurrent = field(
+        type=int, mandatory=True,
+        invariant=lambda value: (value > 0, 'max_concurrent must be positive'))
+    max_queued = field(initial=None)
+    overflow = field(
+        initial=WAIT,
+        invariant=lambda value: (value in (WAIT, FAIL, SHED),
+                                 'overflow must be wait, fail or shed'))
+
+    def __invariant__(self):
+        return (self.overflow != SHED or self.max_queued is not None,
+                'shedding needs max_queued')
+
+
+class BulkheadStats(PClass):
+    """
+    Statistics of a :class:`Bulkhead`.
+
+    :ivar active: The number of intents being performed.
+    :ivar queued: The number of intents waiting.
+    :ivar admitted: The number of intents that have been performed.
+    :ivar rejected: The number of intents that failed because the bulkhead
+        was full.
+    :ivar shed: The number of queued intents that failed to make room for
+        newer ones.
+    :ivar total_wait_seconds: The time admitted intents spent in the queue.
+    :ivar max_wait_seconds: The longest time an admitted intent spent in the
+        queue.
+    """
+    active = field(type=int, initial=0)
+    queued = field(type=int, initial=0)
+    admitted = field(type=int, initial=0)
+    rejected = field(type=int, initial=0)
+    shed = field(type=int, initial=0)
+    total_wait_seconds = field(type=float, initial=0.0)
+    max_wait_seconds = field(type=float, initial=0.0)
+
+
+def _full(name):
+    error = BulkheadFullError('The bulkhead of {0} is full'.format(name))
+    return (BulkheadFullError, error, None)
+
+
+class Bulkhead(object):
+    """
+    Limits how many intents are performed at once. Shared by the performers
+    of the methods it covers.
+
+    :param policy: A :class:`BulkheadPolicy`.
+    :param name: The name of what it covers, for error messages.
+    """
+    def __init__(self, policy, name):
+        self.policy = policy
+        self.name = name
+        self._lock = Lock()
+        self._queue = deque()
+        self._starting = local()
+        self._active = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._shed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def stats(self):
+        """
+        :returns: The current :class:`BulkheadStats`.
+        """
+        with self._lock:
+            return BulkheadStats(
+                active=self._active, queued=len(self._queue),
+                admitted=self._admitted, rejected=self._rejected,
+                shed=self._shed, total_wait_seconds=self._total_wait,
+                max_wait_seconds=self._max_wait)
+
+    def _submit(self, start, box):
+        """
+        Call ``start(box)`` now if there is room, and otherwise queue it or
+        fail ``box`` according to the policy.
+
+        Queued intents are started by the thread that makes room for them, in
+        the context of the program that performed them (see ``contextvars``),
+        so that their deadline applies (see :mod:`ziffect.deadlines`) and the
+        program continues in that context.
+        """
+        policy = self.policy
+        rejected = shed = shed_run = None
+        with self._lock:
+            if self._active < policy.max_concurrent:
+                self._active += 1
+                self._admitted += 1
+            elif policy.overflow == FAIL or policy.max_queued == 0:
+                self._rejected += 1
+                rejected = box
+                start = None
+            else:
+                if (policy.max_queued is not None and
+                        len(self._queue) >= policy.max_queued):
+                    if policy.overflow == WAIT:
+                        self._rejected += 1
+                        rejected = box
+                    else:
+                        _, shed, shed_run, _ = self._queue.popleft()
+                        self._shed += 1
+                if rejected is None:
+                    self._queue.append(
+                        (start, box, ziffect._context_runner(), _clock()))
+                start = None
+        if rejected is not None:
+            rejected.fail(_full(self.name))
+        if shed is not None:
+            shed_run(shed.fail, _full(self.name))
+        if start is not None:
+            start(box)
+
+    def _release(self):
+        """
+        Make room for the next queued intent, and start it.
+
+        Intents that complete while they are being started, such as those
+        whose deadline has passed, release the bulkhead again before this
+        returns. The intents they make room for are started by the loop here
+        rather than by nested calls, so draining a long queue does not
+        exhaust the stack.
+        """
+        with self._lock:
+            if not self._queue:
+                self._active -= 1
+                return
+            start, box, run, queued_at = self._queue.popleft()
+            self._admitted += 1
+            wait = _clock() - queued_at
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        pending = getattr(self._starting, 'pending', None)
+        if pending is not None:
+            pending.append((start, box, run))
+            return
+        self._starting.pending = pending = deque([(start, box, run)])
+        try:
+            while pending:
+                start, box, run = pending.popleft()
+                run(start, box)
+        finally:
+            self._starting.pending = None
+
+
+class _ReleasingBox(object):
+    """
+    A box that makes room in a bulkhead once its intent completes, before
+    the program that performed it continues.
+    """
+    __slots__ = ('_bulkhead', '_box')
+
+    def __init__(self, bulkhead, box):
+        self._bulkhead = bulkhead
+        self._box = box
+
+    def succeed(self, result):
+        self._bulkhead._release()
+        self._box.succeed(result)
+
+    def fail(self, exc_info):
+        self._bulkhead._release()
+        self._box.fail(exc_info)
+
+
+def _make_bulkhead_performer(performer, bulkhead):
+    """
+    Constructs a performer that performs intents with ``performer`` when
+    ``bulkhead`` has room for them.
+    """
+    def _perform(dispatcher, intent, box):
+        def start(box):
+            releasing_box = _ReleasingBox(bulkhead, box)
+            try:
+                performer(dispatcher, intent, releasing_box)
+            except:
+                releasing_box.fail(sys.exc_info())
+        bulkhead._submit(start, box)
+    _perform.ziffect_wrapped = performer
+    _perform.ziffect_bulkhead = bulkhead
+    return _perform
+
+
+def _make_bulkheads(interface, method_names, option):
+    """
+    Make the bulkheads of the methods of an interface for a
+    :func:`ziffect.dispatcher` option.
+
+    :returns: A dict from method name to a list of the :class:`Bulkhead` that
+        the method is performed through, innermost first. The bulkhead of a
+        method is outside the bulkhead of its interface, so intents waiting
+        for their method do not hold a place in the bulkhead of the
+        interface.
+    """
+    if not isinstance(option, dict):
+        option = dict(((interface, method_name), option)
+                      for method_name in method_names)
+    interface_policy = option.get(interface)
+    interface_bulkheads = []
+    if interface_policy is not None:
+        interface_bulkheads.append(
+            Bulkhead(interface_policy, interface.__name__))
+    result = {}
+    for method_name in method_names:
+        bulkheads = list(interface_bulkheads)
+        policy = option.get((interface, method_name))
+        if policy is not None:
+            bulkheads.append(Bulkhead(
+                policy, '{0}.{1}'.format(interface.__name__, method_name)))
+        result[method_name] = bulkheads
+    return result
+
+
+def _add_bulkheads(performers, bulkheads):
+    """
+    Wrap performers with bulkheads made by :func:`_make_bulkheads`.
+
+    :param performers: A dict from method name to performer.
+
+    :returns: A new dict from method name to performer.
+    """
+    result = {}
+    for method_name, performer in performers.items():
+        for bulkhead in bulkheads[method_name]:
+            performer = _make_bulkhead_performer(performer, bulkhead)
+        result[method_name] = performer
+    return result
+
+
+def get_bulkheads(dispatcher, interface, method_name):
+    """
+    Get the bulkheads that a method is performed through in a dispatcher.
+
+    :param dispatcher: A dispatcher returned by :func:`ziffect.dispatcher` or
+        :func:`ziffect.compile_dispatcher`.
+    :param interface: The ziffect interface.
+    :param method_name: The name of the method.
+
+    :returns: A list of :class:`Bulkhead`, the one of the method first, then
+        the one of its interface, of those that the method has.
+    """
+    return ziffect._wrapped_attributes(
+        dispatcher, interface, method_name, 'ziffect_bulkhead')
@@ -0,0 +1,376 @@
+"""
+The ziffect.caching module, for serving repeated intents of an interface
+method from a cache instead of the provider.
+
+Intents are immutable and hashable, so they make natural cache keys. Methods
+of an interface are marked as cacheable with :func:`cached`, and methods that
+change what a cacheable method would return are marked with
+:func:`invalidates`::
+
+    @ziffect.interface
+    class DBInterface(object):
+
+        @ziffect.caching.cached(maxsize=1024, ttl=30)
+        def get(doc_id=ziffect.argument(type=UUID),
+                rev=ziffect.argument(type=int, default=LATEST)):
+            pass
+
+        @ziffect.caching.invalidates('get', 'doc_id')
+        def update(doc_id=ziffect.argument(type=UUID),
+                   rev=ziffect.argument(type=int),
+                   doc=ziffect.argument(type=dict)):
+            pass
+
+Every dispatcher built by :func:`ziffect.dispatcher` then has a cache for each
+cacheable method. Only successful results are cached, and intents with
+unhashable arguments are always performed by the provider. Use
+:func:`get_cache` to inspect or clear a cache.
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+from threading import Lock
+
+from pyrsistent import PClass, field
+from six import iteritems
+
+import ziffect
+from ziffect import _clock
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+__all__ = [
+    'cached',
+    'invalidates',
+    'get_cache',
+    'CachePolicy',
+    'CacheStats',
+    'MethodCache',
+]
+
+
+class CachePolicy(PClass):
+    """
+    How the results of a method are cached.
+
+    :ivar maxsize: The largest number of results to keep. The least recently
+        used result is evicted when the cache is full.
+    :ivar ttl: The number of seconds a result is served for, or ``None`` to
+        serve it until it is evicted or invalidated.
+    """
+    maxsize = field(type=int, initial=128)
+    ttl = field(initial=None)
+
+
+class CacheStats(PClass):
+    """
+    Statistics of a :class:`MethodCache`.
+    """
+    hits = field(type=int, initial=0)
+    misses = field(type=int, initial=0)
+    evictions = field(type=int, initial=0)
+    invalidations = field(type=int, initial=0)
+    size = field(type=int, initial=0)
+
+
+def cached(maxsize=128, ttl=None):
+    """
+    Decorator for methods of a ziffect interface, that makes dispatchers
+    cache the results of the method.
+
+    :param maxsize: The largest number of results to keep.
+    :param ttl: The number of seconds a result is served for, or ``None``.
+
+    :returns: decorator for the interface method.
+    """
+    def _cached_decorator(method):
+        method._ziffect_cache = CachePolicy(maxsize=maxsize, ttl=ttl)
+        return method
+    return _cached_decorator
+
+
+def invalidates(method_name, *argument_names):
+    """
+    Decorator for methods of a ziffect interface, that makes performing the
+    method invalidate cached results of another method of the interface.
+
+    May be applied more than once to invalidate several methods.
+
+    :param method_name: The name of the cached method.
+    :param argument_names: Names of arguments shared by both methods. Only
+        the cached results whose arguments equal those of the performed intent
+        are invalidated. If no names are given the whole cache is cleared.
+
+    :returns: decorator for the interface method.
+    """
+    def _invalidates_decorator(method):
+        method._ziffect_invalidates = (
+            getattr(method, '_ziffect_invalidates', ()) +
+            ((method_name, tuple(argument_names)),))
+        return method
+    return _invalidates_decorator
+
+
+class MethodCache(object):
+    """
+    A bounded cache of the results of one method, keyed by intent.
+
+    Concurrent misses for the same intent are coalesced into one call of the
+    provider.
+
+    :param policy: The :class:`CachePolicy`.
+    :param index_keys: Tuples of argument names that results will be
+        invalidated by.
+    """
+    def __init__(self, policy, index_keys=()):
+        self._policy = policy
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._indexes = dict((names, {}) for names in index_keys)
+        self._pending = {}
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def stats(self):
+        """
+        :returns: The current :class:`CacheStats`.
+        """
+        with self._lock:
+            return CacheStats(
+                hits=self._hits, misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                size=len(self._entries))
+
+    def clear(self):
+        """
+        Invalidate every cached result.
+        """
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            for index in self._indexes.values():
+                index.clear()
+            self._forget_pending()
+
+    def invalidate(self, argument_names, values):
+        """
+        Invalidate the cached results whose arguments named ``argument_names``
+        equal ``values``.
+        """
+        with self._lock:
+            intents = self._indexes[argument_names].get(values, ())
+            for intent in list(intents):
+                self._remove(intent)
+                self._invalidations += 1
+            self._forget_pending()
+
+    def _forget_pending(self):
+        # Results of calls that started before an invalidation may be stale,
+        # so they are not stored, and new intents do not wait on them.
+        self._generation += 1
+        self._pending = {}
+
+    def _remove(self, intent):
+        del self._entries[intent]
+        for names, index in iteritems(self._indexes):
+            values = tuple(getattr(intent, name) for name in names)
+            intents = index[values]
+            intents.discard(intent)
+            if not intents:
+                del index[values]
+
+    def _begin(self, intent, box):
+        """
+        Look up ``intent``.
+
+        :returns: ``(True, result)`` on a hit, ``(False, waiters)`` when the
+            caller must call the provider and settle ``waiters``, or
+            ``(False, None)`` when ``box`` is waiting on a call in flight.
+        """
+        with self._lock:
+            entry = self._entries.get(intent)
+            if entry is not None:
+                expires, result = entry
+                if expires is None or expires > _clock():
+                    self._hits += 1
+                    del self._entries[intent]
+                    self._entries[intent] = entry
+                    return True, result
+                self._remove(intent)
+            self._misses += 1
+            waiters = self._pending.get(intent)
+            if waiters is not None:
+                waiters.append(box)
+                return False, None
+            waiters = self._pending[intent] = [box]
+            return False, (waiters, self._generation)
+
+    def _finish(self, intent, flight, result):
+        waiters, generation = flight
+        with self._lock:
+            if self._pending.get(intent) is waiters:
+                del self._pending[intent]
+            if generation != self._generation:
+                return
+            if intent in self._entries:
+                self._remove(intent)
+            ttl = self._policy.ttl
+            self._entries[intent] = (
+                None if ttl is None else _clock() + ttl, result)
+            for names, index in iteritems(self._indexes):
+                values = tuple(getattr(intent, name) for name in names)
+                index.setdefault(values, set()).add(intent)
+            while len(self._entries) > self._policy.maxsize:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _abandon(self, intent, flight):
+        waiters, generation = flight
+        with self._lock:
+            if self._pending.get(intent) is waiters:
+                del self._pending[intent]
+
+
+class _CachingBox(object):
+    """
+    A box that stores a successful result in a :class:`MethodCache`, and
+    provides the outcome to every box waiting on the intent.
+    """
+    def __init__(self, cache, intent, flight):
+        self._cache = cache
+        self._intent = intent
+        self._flight = flight
+
+    def succeed(self, result):
+        self._cache._finish(self._intent, self._flight, result)
+        for box in self._flight[0]:
+            box.succeed(result)
+
+    def fail(self, exc_info):
+        self._cache._abandon(self._intent, self._flight)
+        for box in self._flight[0]:
+            box.fail(exc_info)
+
+
+def _make_caching_performer(performer, cache):
+    """
+    Constructs a performer that serves intents from ``cache``, and otherwise
+    performs them with ``performer``.
+    """
+    def _perform(dispatcher, intent, box):
+        try:
+            hit, result = cache._begin(intent, box)
+        except TypeError:
+            # The intent has unhashable arguments.
+            performer(dispatcher, intent, box)
+            return
+        if hit:
+            box.succeed(result)
+        elif result is not None:
+            performer(dispatcher, intent,
+                      _CachingBox(cache, intent, result))
+    _perform.ziffect_wrapped = performer
+    _perform.ziffect_cache = cache
+    return _perform
+
+
+class _InvalidatingBox(object):
+    """
+    A box that invalidates cached results once the intent has been performed.
+    """
+    def __init__(self, box, invalidate):
+        self._box = box
+        self._invalidate = invalidate
+
+    def succeed(self, result):
+        self._invalidate()
+        self._box.succeed(result)
+
+    def fail(self, exc_info):
+        self._invalidate()
+        self._box.fail(exc_info)
+
+
+def _make_invalidating_performer(performer, targets):
+    """
+    Constructs a performer that invalidates cached results before and after
+    performing an intent with ``performer``.
+
+    :param targets: A list of ``(cache, argument_names)`` tuples.
+    """
+    def _perform(dispatcher, intent, box):
+        def invalidate():
+            for cache, names in targets:
+                if names:
+                    cache.invalidate(
+                        names, tuple(getattr(intent, name) for name in names))
+                else:
+                    cache.clear()
+        invalidate()
+        performer(dispatcher, intent, _InvalidatingBox(box, invalidate))
+    _perform.ziffect_wrapped = performer
+    return _perform
+
+
+def _add_caching(interface, performers):
+    """
+    Wraps the performers of the methods of ``interface`` that are marked with
+    :func:`cached` or :func:`invalidates`.
+
+    :param performers: A dict from method name to performer.
+
+    :returns: A new dict from method name to performer.
+    """
+    index_keys = defaultdict(set)
+    invalidations = {}
+    for method_name in performers:
+        invalidations[method_name] = ziffect._method_metadata(
+            interface, method_name, '_ziffect_invalidates', ())
+        for target, names in invalidations[method_name]:
+            if names:
+                index_keys[target].add(names)
+
+    result = {}
+    caches = {}
+    for method_name, performer in iteritems(performers):
+        policy = ziffect._method_metadata(
+            interface, method_name, '_ziffect_cache')
+        if policy is not None:
+            caches[method_name] = MethodCache(policy, index_keys[method_name])
+            performer = _make_caching_performer(
+                performer, caches[method_name])
+        result[method_name] = performer
+
+    for method_name, performer in iteritems(result):
+        targets = [(caches[target], names)
+                   for target, names in invalidations[method_name]
+                   if target in caches]
+        if targets:
+            result[method_name] = _make_invalidating_performer(
+                performer, targets)
+    return result
+
+
+def get_cache(dispatcher, interface, method_name):
+    """
+    Get the cache of a method in a dispatcher.
+
+    :param dispatcher: A dispatcher returned by :func:`ziffect.dispatcher` or
+        :func:`ziffect.compile_dispatcher`.
+    :param interface: The ziffect interface.
+    :param method_name: The name of a method marked with :func:`cached`.
+
+    :returns: The :class:`MethodCache`, or ``None`` if the method is not
+        cached by the dispatcher.
+    """
+    caches = ziffect._wrapped_attributes(
+        dispatcher, interface, method_name, 'ziffect_cache')
+    return caches[0] if caches else None
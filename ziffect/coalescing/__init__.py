@@ -0,0 +1,238 @@
+"""
+The ziffect.coalescing module, for combining concurrent read-modify-write
+updates of the same key into a single read and write.
+
+The usual way to apply a pure function to a document is to read it, apply the
+function, and write it back if nobody else wrote it in between, starting over
+on a conflict. When many programs update the same document at once most of
+those attempts conflict. An :class:`UpdateCoalescer` instead queues the
+functions of each key, and applies all the functions that queued up while
+the previous round was in flight in one round of a read and a write::
+
+    db_effects = ziffect.effects(DBInterface)
+    documents = ziffect.coalescing.UpdateCoalescer(
+        read=lambda doc_id: db_effects.get(doc_id=doc_id),
+        write=lambda doc_id, original, doc: db_effects.update(
+            doc_id=doc_id, rev=original.rev, doc=doc),
+        value=lambda response: response.doc,
+        conflict=lambda response: response.status == DBStatus.CONFLICT,
+    )
+
+    @do
+    def execute_function(doc_id, pure_function):
+        yield documents.update(doc_id, pure_function)
+
+Dispatchers that perform :class:`CoalescedUpdate` are composed with
+:obj:`coalescing_dispatcher`. Rounds are only shared by updates that are
+performed concurrently, for instance by programs performed on an executor
+(see :mod:`ziffect.threads`) or an event loop (see :mod:`ziffect.aio`).
+Writes by others still conflict, and the round is then started over with the
+functions of the same updates.
+
+A round is performed with the dispatcher of the update that started it, and
+without the deadline of any of them (see :mod:`ziffect.deadlines`).
+"""
+
+from __future__ import absolute_import
+
+import sys
+from functools import partial
+from threading import Lock
+
+from effect import Effect, TypeDispatcher, perform
+from effect.do import do, do_return
+from pyrsistent import PClass, field
+
+import ziffect
+
+__all__ = [
+    'UpdateCoalescer',
+    'CoalescerStats',
+    'CoalescedUpdate',
+    'perform_coalesced_update',
+    'coalescing_dispatcher',
+]
+
+
+class CoalescerStats(PClass):
+    """
+    Statistics of an :class:`UpdateCoalescer`.
+
+    :ivar updates: The number of updates that have completed.
+    :ivar rounds: The number of rounds that have completed, each of which
+        wrote the results of one or more updates.
+    :ivar conflicts: The number of writes that conflicted.
+    """
+    updates = field(type=int, initial=0)
+    rounds = field(type=int, initial=0)
+    conflicts = field(type=int, initial=0)
+
+
+class _Key(object):
+    """
+    The updates of a key that are waiting for a round.
+    """
+    __slots__ = ('pending',)
+
+    def __init__(self):
+        self.pending = []
+
+
+def _identity(value):
+    return value
+
+
+class UpdateCoalescer(object):
+    """
+    Applies pure functions to the values of keys, combining the updates of
+    the same key that are performed concurrently.
+
+    :param read: A function that takes a key, and returns an Effect of its
+        current state.
+    :param write: A function that takes a key, the state that was read and
+        the new value, and returns an Effect of writing the value if the key
+        has not been written since the state was read.
+    :param value: A function that gets the value from a state returned by
+        ``read``. Defaults to the state itself.
+    :param conflict: A function that takes the result of ``write``, and
+        returns whether it conflicted, in which case the round is started
+        over.
+    :param max_batch: The largest number of functions applied in one round,
+        or ``None`` for no limit.
+    """
+    def __init__(self, read, write, conflict, value=_identity,
+                 max_batch=None):
+        self._read = read
+        self._write = write
+        self._conflict = conflict
+        self._value = value
+        self._max_batch = max_batch
+        self._lock = Lock()
+        self._keys = {}
+        self._updates = 0
+        self._rounds = 0
+        self._conflicts = 0
+
+    def update(self, key, function):
+        """
+        Apply a pure function to the value of a key.
+
+        :param key: The key, which must be hashable.
+        :param function: A function that takes the current value and returns
+            the new value. It may be called more than once, and is called
+            with the value left by the functions of the updates before it in
+            the same round.
+
+        :returns: An Effect of the value returned by ``function`` in the
+            round that was written. If ``function`` raises, the Effect fails
+            with its exception and the other updates of the round are still
+            written.
+        """
+        return Effect(CoalescedUpdate(
+            coalescer=self, key=key, function=function))
+
+    def stats(self):
+        """
+        :returns: The current :class:`CoalescerStats`.
+        """
+        with self._lock:
+            return CoalescerStats(updates=self._updates,
+                                  rounds=self._rounds,
+                                  conflicts=self._conflicts)
+
+    def _submit(self, dispatcher, key, function, box):
+        """
+        Queue an update of a key, and start a round if none is in flight.
+        """
+        # Rounds complete on whatever thread their last effect does, so each
+        # program continues in its own context.
+        box = ziffect._context_box(box)
+        with self._lock:
+            waiting = self._keys.get(key)
+            if waiting is not None:
+                # A round is in flight, and the next one applies this update.
+                waiting.pending.append((function, box))
+                return
+            self._keys[key] = _Key()
+        self._start(dispatcher, key, [(function, box)])
+
+    def _start(self, dispatcher, key, batch):
+        ziffect._run_with(
+            ziffect._deadline, None, perform, dispatcher,
+            self._round(key, [function for function, _ in batch]).on(
+                success=partial(self._finish, dispatcher, key, batch),
+                error=partial(self._failed, dispatcher, key, batch)))
+
+    @do
+    def _round(self, key, functions):
+        while True:
+            original = yield self._read(key)
+            value = self._value(original)
+            outcomes = []
+            for function in functions:
+                try:
+                    value = function(value)
+                except:
+                    outcomes.append((True, sys.exc_info()))
+                else:
+                    outcomes.append((False, value))
+            if all(is_error for is_error, _ in outcomes):
+                yield do_return(outcomes)
+            result = yield self._write(key, original, value)
+            if not self._conflict(result):
+                yield do_return(outcomes)
+            with self._lock:
+                self._conflicts += 1
+
+    def _finish(self, dispatcher, key, batch, outcomes):
+        for (_, box), (is_error, value) in zip(batch, outcomes):
+            if is_error:
+                box.fail(value)
+            else:
+                box.succeed(value)
+        self._next(dispatcher, key, len(batch))
+
+    def _failed(self, dispatcher, key, batch, exc_info):
+        for _, box in batch:
+            box.fail(exc_info)
+        self._next(dispatcher, key, len(batch))
+
+    def _next(self, dispatcher, key, completed):
+        """
+        Start a round with the updates that queued up during the last one.
+        """
+        with self._lock:
+            self._updates += completed
+            self._rounds += 1
+            waiting = self._keys[key]
+            if not waiting.pending:
+                del self._keys[key]
+                return
+            if self._max_batch is None:
+                batch, waiting.pending = waiting.pending, []
+            else:
+                batch = waiting.pending[:self._max_batch]
+                del waiting.pending[:self._max_batch]
+        self._start(dispatcher, key, batch)
+
+
+class CoalescedUpdate(PClass):
+    """
+    An intent to apply ``function`` to the value of ``key`` with an
+    :class:`UpdateCoalescer`. Its result is the value returned by
+    ``function``.
+    """
+    coalescer = field(type=UpdateCoalescer, mandatory=True)
+    key = field(mandatory=True)
+    function = field(mandatory=True)
+
+
+def perform_coalesced_update(dispatcher, intent, box):
+    """
+    Perform a :class:`CoalescedUpdate`.
+    """
+    intent.coalescer._submit(dispatcher, intent.key, intent.function, box)
+
+
+coalescing_dispatcher = TypeDispatcher(
+    {CoalescedUpdate: perform_coalesced_update})
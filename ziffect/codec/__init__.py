@@ -0,0 +1,429 @@
+"""
+The ziffect.codec module, for encoding intents and results as compact bytes,
+so that they can be queued, logged and sent to other processes.
+
+Every intent type of an interface has a name that is the same in every
+process, given by :func:`intent_name`. An encoded intent holds that name and
+the values of its arguments. Arguments declared with one of the types
+``int``, ``float``, ``bool``, ``text_type``, ``bytes`` or ``UUID`` are encoded
+without any type information, other arguments and results are encoded with
+a one byte tag before each value::
+
+    data = ziffect.codec.encode(ziffect.intents(DBInterface).get(doc_id=id))
+    intent = ziffect.codec.decode(data)
+
+The module of an interface is imported to decode its intents if it has not
+been used in the decoding process. Intents can also be pickled, by name.
+
+Values of the types above, ``None``, lists, tuples, dicts, pyrsistent maps
+and vectors, and intents can be encoded.
+"""
+
+from __future__ import absolute_import
+
+import codecs
+import struct
+from uuid import UUID
+
+from pyrsistent import PMap, PVector, pmap, pvector
+from six import PY2, text_type, binary_type, integer_types, iteritems
+
+import ziffect
+
+__all__ = [
+    'encode',
+    'encode_into',
+    'decode',
+    'decode_from',
+    'intent_name',
+    'intent_type',
+    'DecodeError',
+]
+
+
+class DecodeError(ValueError):
+    """
+    Raised when bytes are not a value encoded by :func:`encode`.
+    """
+
+
+def intent_name(intent_type):
+    """
+    :param intent_type: An intent type of a ziffect interface.
+
+    :returns: The name of the intent type, ``'module:Interface.method'``.
+    """
+    return intent_type._ziffect_name
+
+
+def intent_type(name):
+    """
+    :param name: A name returned by :func:`intent_name`.
+
+    :raises LookupError: if there is no such intent type.
+
+    :returns: The intent type.
+    """
+    return ziffect._intent_type(name)
+
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_TEXT = 5
+_BYTES = 6
+_LIST = 7
+_TUPLE = 8
+_DICT = 9
+_UUID = 10
+_INTENT = 11
+_PVECTOR = 12
+_PMAP = 13
+
+_DOUBLE = struct.Struct(str('<d'))
+_utf_8_decode = codecs.utf_8_decode
+
+
+def _write_varint(out, number):
+    while number > 0x7f:
+        out.append((number & 0x7f) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def _read_varint(view, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = view[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_int(out, number):
+    _write_varint(out, number << 1 if number >= 0 else (-number << 1) - 1)
+
+
+def _read_int(view, pos):
+    number, pos = _read_varint(view, pos)
+    return (number >> 1) ^ -(number & 1), pos
+
+
+def _write_float(out, number):
+    out += _DOUBLE.pack(number)
+
+
+def _read_float(view, pos):
+    return _DOUBLE.unpack_from(view, pos)[0], pos + 8
+
+
+def _write_bool(out, value):
+    out.append(1 if value else 0)
+
+
+def _read_bool(view, pos):
+    return view[pos] != 0, pos + 1
+
+
+def _write_text(out, text):
+    data = text.encode('utf-8')
+    _write_varint(out, len(data))
+    out += data
+
+
+def _read_text(view, pos):
+    length, pos = _read_varint(view, pos)
+    end = pos + length
+    if end > len(view):
+        raise DecodeError('Truncated data')
+    return _utf_8_decode(view[pos:end], 'strict', True)[0], end
+
+
+def _write_bytes(out, data):
+    _write_varint(out, len(data))
+    out += data
+
+
+def _read_bytes(view, pos):
+    length, pos = _read_varint(view, pos)
+    end = pos + length
+    if end > len(view):
+        raise DecodeError('Truncated data')
+    return bytes(view[pos:end]), end
+
+
+def _write_uuid(out, uuid):
+    out += uuid.bytes
+
+
+def _read_uuid(view, pos):
+    end = pos + 16
+    if end > len(view):
+        raise DecodeError('Truncated data')
+    return UUID(bytes=bytes(view[pos:end])), end
+
+
+_RAW = {
+    bool: (_write_bool, _read_bool),
+    float: (_write_float, _read_float),
+    text_type: (_write_text, _read_text),
+    binary_type: (_write_bytes, _read_bytes),
+    UUID: (_write_uuid, _read_uuid),
+}
+for _int_type in integer_types:
+    _RAW[_int_type] = (_write_int, _read_int)
+
+
+class _Plan(object):
+    """
+    How the values of an intent type are encoded, derived from the types of
+    its arguments.
+    """
+    def __init__(self, intent):
+        self.intent = intent
+        self.args = intent._ziffect_args
+        name = intent._ziffect_name
+        if name is None:
+            raise TypeError(
+                "Can't encode intents that do not belong to an interface")
+        self.header = bytearray([_INTENT])
+        _write_text(self.header, name)
+        self.writers = []
+        self.readers = []
+        for name, arg in zip(self.args, intent._ziffect_arguments):
+            raw = _RAW.get(arg.type)
+            if raw is not None and (arg.default is ziffect._TOKEN or
+                                    isinstance(arg.default, arg.type)):
+                self.writers.append(_checked_writer(name, arg.type, raw[0]))
+                self.readers.append(raw[1])
+            else:
+                self.writers.append(_write_value)
+                self.readers.append(_read_value)
+
+
+def _checked_writer(name, expected, write):
+    def _write(out, value):
+        if not isinstance(value, expected):
+            raise TypeError(
+                'Invalid type for field {0}, was {1}'.format(
+                    name, type(value).__name__))
+        write(out, value)
+    return _write
+
+
+_plans = {}
+
+
+def _plan(intent):
+    plan = _plans.get(intent)
+    if plan is None:
+        plan = _plans[intent] = _Plan(intent)
+    return plan
+
+
+def _write_intent(out, intent):
+    plan = _plan(type(intent))
+    out += plan.header
+    for write, value in zip(plan.writers, intent._ziffect_values):
+        write(out, value)
+
+
+def _read_intent(view, pos):
+    name, pos = _read_text(view, pos)
+    plan = _plan(ziffect._intent_type(name))
+    values = []
+    for read in plan.readers:
+        value, pos = read(view, pos)
+        values.append(value)
+    return plan.intent(**dict(zip(plan.args, values))), pos
+
+
+def _write_items(out, tag, items):
+    out.append(tag)
+    _write_varint(out, len(items))
+    for item in items:
+        _write_value(out, item)
+
+
+def _write_mapping(out, tag, mapping):
+    out.append(tag)
+    _write_varint(out, len(mapping))
+    for key, value in iteritems(mapping):
+        _write_value(out, key)
+        _write_value(out, value)
+
+
+def _tagged(tag, write):
+    def _write(out, value):
+        out.append(tag)
+        write(out, value)
+    return _write
+
+
+_WRITERS = {
+    type(None): lambda out, value: out.append(_NONE),
+    bool: lambda out, value: out.append(_TRUE if value else _FALSE),
+    float: _tagged(_FLOAT, _write_float),
+    text_type: _tagged(_TEXT, _write_text),
+    binary_type: _tagged(_BYTES, _write_bytes),
+    UUID: _tagged(_UUID, _write_uuid),
+    list: lambda out, value: _write_items(out, _LIST, value),
+    tuple: lambda out, value: _write_items(out, _TUPLE, value),
+    dict: lambda out, value: _write_mapping(out, _DICT, value),
+}
+for _int_type in integer_types:
+    _WRITERS[_int_type] = _tagged(_INT, _write_int)
+
+
+def _write_value(out, value):
+    write = _WRITERS.get(type(value))
+    if write is not None:
+        write(out, value)
+    elif isinstance(value, ziffect._IntentBase):
+        _write_intent(out, value)
+    elif isinstance(value, PMap):
+        _write_mapping(out, _PMAP, value)
+    elif isinstance(value, PVector):
+        _write_items(out, _PVECTOR, value)
+    elif isinstance(value, dict):
+        _write_mapping(out, _DICT, value)
+    elif isinstance(value, (list, tuple)):
+        _write_items(out, _LIST if isinstance(value, list) else _TUPLE, value)
+    else:
+        raise TypeError(
+            "Can't encode values of type {0}".format(type(value).__name__))
+
+
+def _read_items(view, pos):
+    length, pos = _read_varint(view, pos)
+    items = []
+    for _ in range(length):
+        item, pos = _read_value(view, pos)
+        items.append(item)
+    return items, pos
+
+
+def _read_dict(view, pos):
+    length, pos = _read_varint(view, pos)
+    result = {}
+    for _ in range(length):
+        key, pos = _read_value(view, pos)
+        result[key], pos = _read_value(view, pos)
+    return result, pos
+
+
+def _read_tuple(view, pos):
+    items, pos = _read_items(view, pos)
+    return tuple(items), pos
+
+
+def _read_pvector(view, pos):
+    items, pos = _read_items(view, pos)
+    return pvector(items), pos
+
+
+def _read_pmap(view, pos):
+    result, pos = _read_dict(view, pos)
+    return pmap(result), pos
+
+
+_READERS = {
+    _NONE: lambda view, pos: (None, pos),
+    _FALSE: lambda view, pos: (False, pos),
+    _TRUE: lambda view, pos: (True, pos),
+    _INT: _read_int,
+    _FLOAT: _read_float,
+    _TEXT: _read_text,
+    _BYTES: _read_bytes,
+    _LIST: _read_items,
+    _TUPLE: _read_tuple,
+    _DICT: _read_dict,
+    _UUID: _read_uuid,
+    _INTENT: _read_intent,
+    _PVECTOR: _read_pvector,
+    _PMAP: _read_pmap,
+}
+
+
+def _read_value(view, pos):
+    read = _READERS.get(view[pos])
+    if read is None:
+        raise DecodeError('Unknown tag {0} at {1}'.format(view[pos], pos))
+    return read(view, pos + 1)
+
+
+def encode_into(out, value):
+    """
+    Encode a value at the end of a ``bytearray``.
+
+    :param out: The ``bytearray``.
+    :param value: An intent, or a result of an intent.
+
+    :raises TypeError: if the value cannot be encoded.
+    """
+    _write_value(out, value)
+
+
+def encode(value):
+    """
+    Encode a value.
+
+    :param value: An intent, or a result of an intent.
+
+    :raises TypeError: if the value cannot be encoded.
+
+    :returns: The encoded bytes.
+    """
+    out = bytearray()
+    _write_value(out, value)
+    return bytes(out)
+
+
+def decode(data, offset=0):
+    """
+    Decode a value encoded by :func:`encode`.
+
+    :param data: A bytes-like object, which is not copied.
+    :param offset: Where the value starts in ``data``.
+
+    :raises DecodeError: if ``data`` does not hold an encoded value, or holds
+        more than one.
+    :raises LookupError: if it holds an intent of an unknown type.
+
+    :returns: The value.
+    """
+    value, end = decode_from(data, offset)
+    if end != len(data):
+        raise DecodeError('Extra data after the value')
+    return value
+
+
+def decode_from(data, offset=0):
+    """
+    Decode one of several values encoded one after the other, for instance by
+    :func:`encode_into`.
+
+    :param data: A bytes-like object, which is not copied.
+    :param offset: Where the value starts in ``data``.
+
+    :raises DecodeError: if ``data`` does not hold an encoded value at
+        ``offset``.
+    :raises LookupError: if it holds an intent of an unknown type.
+
+    :returns: A tuple of the value, and the offset after it.
+    """
+    if PY2:
+        view = bytearray(data)
+    else:
+        view = memoryview(data)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+    try:
+        return _read_value(view, offset)
+    except (IndexError, struct.error, UnicodeDecodeError) as error:
+        raise DecodeError('Invalid data: {0}'.format(error))
@@ -0,0 +1,327 @@
+"""
+The ziffect.deadlines module, for bounding how long effect programs take.
+
+An effect program is given a deadline with :func:`within`::
+
+    @do
+    def handle(doc_id):
+        document = yield ziffect.deadlines.within(
+            0.5, execute_function(doc_id, add_field))
+        yield do_return(document)
+
+Dispatchers that perform :class:`WithDeadline` are composed with
+:obj:`deadline_dispatcher`::
+
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({DBInterface: ZiffectDB(db)}, executor=pool),
+        ziffect.deadlines.deadline_dispatcher,
+        threaded_base_dispatcher,
+    ])
+
+Every effect of a ziffect interface that the program performs, directly or
+through the programs it performs, is checked against the deadline before its
+provider is called, and fails with :class:`DeadlineExceeded` once it has
+passed. If the deadline passes while an effect is running on an executor it
+is cancelled, if it has not started, and a coroutine method of an asynchronous
+provider (see :mod:`ziffect.aio`) is cancelled. In either case the effect of
+:func:`within` fails with :class:`DeadlineExceeded` as soon as the deadline
+passes, on the thread of the event loop for programs performed by
+:func:`ziffect.aio.asyncio_perform`, and otherwise on a thread that keeps the
+time. Providers that block the performing thread cannot be interrupted, so a
+program performed synchronously fails at the first effect after its deadline.
+
+A deadline nested in another only applies if it is sooner. Provider methods
+marked with :func:`takes_deadline` are passed the deadline, for instance to
+set the timeout of a network call. The deadline is held in a context variable
+(see ``contextvars``), so it follows programs that continue on other threads
+or asyncio tasks.
+"""
+
+from __future__ import absolute_import
+
+from threading import Lock
+
+from effect import Effect, TypeDispatcher, perform
+from pyrsistent import PClass, field
+
+import ziffect
+from ziffect import _clock
+
+__all__ = [
+    'Deadline',
+    'DeadlineExceeded',
+    'WithDeadline',
+    'perform_with_deadline',
+    'deadline_dispatcher',
+    'within',
+    'current_deadline',
+    'takes_deadline',
+]
+
+
+class DeadlineExceeded(Exception):
+    """
+    The failure of an effect whose deadline passed before it completed.
+    """
+
+
+class Deadline(object):
+    """
+    The time by which the effects of a program must complete.
+
+    :ivar timeout: The number of seconds the program was given.
+    :ivar expires_at: When the deadline passes, in seconds of
+        ``time.perf_counter``.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = _clock() + timeout
+        self._lock = Lock()
+        self._futures = set()
+        self._expired = False
+
+    def remaining(self):
+        """
+        :returns: The number of seconds until the deadline passes, or ``0``
+            if it has passed.
+        """
+        return max(0.0, self.expires_at - _clock())
+
+    def expired(self):
+        """
+        :returns: Whether the deadline has passed.
+        """
+        return self._expired or _clock() >= self.expires_at
+
+    def _exceeded(self):
+        """
+        :returns: The ``exc_info`` of a :class:`DeadlineExceeded`.
+        """
+        error = DeadlineExceeded(
+            'The deadline of {0} seconds has passed'.format(self.timeout))
+        return (DeadlineExceeded, error, None)
+
+    def _fail_if_expired(self, box):
+        """
+        Fail ``box`` if the deadline has passed.
+
+        :returns: Whether it has.
+        """
+        if self.expired():
+            box.fail(self._exceeded())
+            return True
+        return False
+
+    def _call(self, call, intent):
+        """
+        Call ``call(intent)``, unless the deadline has passed while it was
+        waiting for a thread of an executor.
+        """
+        if self.expired():
+            raise self._exceeded()[1]
+        return call(intent)
+
+    def _cancel_on_expiry(self, future):
+        """
+        Cancel a ``concurrent.futures.Future`` when the deadline passes, if
+        it is not done by then.
+        """
+        with self._lock:
+            expired = self._expired
+            if not expired:
+                self._futures.add(future)
+        if expired:
+            future.cancel()
+        else:
+            future.add_done_callback(self._forget)
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _settle(self, box, future):
+        """
+        Provide the outcome of a finished future to a box, failing it with
+        :class:`DeadlineExceeded` if the future was cancelled.
+        """
+        if future.cancelled():
+            box.fail(self._exceeded())
+        else:
+            ziffect._settle(box, future)
+
+    def _expire(self):
+        """
+        Mark the deadline as passed, and cancel the futures waiting on it.
+        """
+        with self._lock:
+            self._expired = True
+            futures, self._futures = self._futures, set()
+        for future in futures:
+            future.cancel()
+
+
+_watchdog = ziffect._Scheduler('ziffect deadlines')
+
+
+def _running_loop():
+    """
+    :returns: The asyncio event loop running on the current thread, or
+        ``None``.
+    """
+    try:
+        from asyncio import get_running_loop
+    except ImportError:
+        return None
+    try:
+        return get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _DeadlineBox(object):
+    """
+    The box of a :class:`WithDeadline` intent, that fails with
+    :class:`DeadlineExceeded` when the deadline passes first.
+    """
+    __slots__ = ('_deadline', '_box', '_lock', '_settled', '_cancel_timer')
+
+    def __init__(self, deadline, box):
+        self._deadline = deadline
+        self._box = box
+        self._lock = Lock()
+        self._settled = False
+        self._cancel_timer = None
+
+    def _take(self):
+        """
+        :returns: Whether the box may be settled, which is only once.
+        """
+        with self._lock:
+            if self._settled:
+                return False
+            self._settled = True
+            cancel_timer, self._cancel_timer = self._cancel_timer, None
+        if cancel_timer is not None:
+            cancel_timer()
+        return True
+
+    def succeed(self, result):
+        if self._take():
+            self._box.succeed(result)
+
+    def fail(self, exc_info):
+        if self._take():
+            self._box.fail(exc_info)
+
+    def expire(self):
+        if self._take():
+            self._deadline._expire()
+            self._box.fail(self._deadline._exceeded())
+
+    def start_timer(self):
+        """
+        Fail the box when the deadline passes, unless it is settled by then.
+        Only needed once the program is waiting on an asynchronous effect.
+        """
+        with self._lock:
+            if self._settled:
+                return
+            loop = _running_loop()
+            if loop is not None:
+                self._cancel_timer = loop.call_later(
+                    self._deadline.remaining(), self.expire).cancel
+            else:
+                self._cancel_timer = _watchdog.schedule(
+                    self._deadline.expires_at, self.expire)
+
+
+class WithDeadline(PClass):
+    """
+    An intent to perform an Effect that must complete within ``timeout``
+    seconds. Its result is the result of the Effect.
+    """
+    effect = field(type=Effect, mandatory=True)
+    timeout = field(type=(int, float), mandatory=True)
+
+
+def perform_with_deadline(dispatcher, intent, box):
+    """
+    Perform a :class:`WithDeadline`.
+    """
+    outer = ziffect._deadline.get()
+    deadline = Deadline(intent.timeout)
+    if outer is not None and outer.expires_at <= deadline.expires_at:
+        perform(dispatcher,
+                intent.effect.on(success=box.succeed, error=box.fail))
+        return
+    deadline_box = _DeadlineBox(deadline, ziffect._context_box(box))
+    ziffect._run_with(
+        ziffect._deadline, deadline, perform, dispatcher,
+        intent.effect.on(success=deadline_box.succeed,
+                         error=deadline_box.fail))
+    deadline_box.start_timer()
+
+
+deadline_dispatcher = TypeDispatcher({WithDeadline: perform_with_deadline})
+
+
+def within(timeout, effect):
+    """
+    Give an Effect a deadline.
+
+    :param timeout: The number of seconds the Effect, and everything it
+        performs, has to complete.
+    :param effect: The Effect, typically of a ``@do`` program.
+
+    :returns: An Effect of the result of ``effect``, which fails with
+        :class:`DeadlineExceeded` if the deadline passes first.
+    """
+    return Effect(WithDeadline(effect=effect, timeout=timeout))
+
+
+def current_deadline():
+    """
+    :returns: The :class:`Deadline` of the effects performed in the current
+        context, or ``None``.
+    """
+    return ziffect._deadline.get()
+
+
+def takes_deadline(method):
+    """
+    Decorator for methods of a provider, that makes dispatchers pass the
+    :class:`Deadline` of the intent, or ``None``, as the ``deadline`` keyword
+    argument::
+
+        @ziffect.implements(DBInterface)
+        class ZiffectDB(object):
+
+            @ziffect.deadlines.takes_deadline
+            def get(self, doc_id, deadline=None):
+                timeout = deadline.remaining() if deadline else None
+                return self.db.get(doc_id, timeout=timeout)
+
+    :param method: The provider method.
+
+    :returns: The same method.
+    """
+    method._ziffect_takes_deadline = True
+    return method
+
+
+def _make_deadline_call(method, arg_keys):
+    """
+    Constructs a function that calls a method marked with
+    :func:`takes_deadline` with the arguments held in an intent and the
+    deadline of the current context.
+    """
+    get_deadline = ziffect._deadline.get
+    if ziffect._accepts_positionally(method, arg_keys):
+        def _call(intent):
+            return method(*intent._ziffect_values, deadline=get_deadline())
+    else:
+        def _call(intent):
+            kwargs = dict(zip(arg_keys, intent._ziffect_values))
+            kwargs['deadline'] = get_deadline()
+            return method(**kwargs)
+    return _call
@@ -6,10 +6,17 @@ import testtools.run
 
 import json
 import hashlib
+import mmap
+import os
+import struct
+import zlib
+from threading import Lock
 from uuid import UUID
-from pyrsistent import PClass, field
+from pyrsistent import PClass, field, freeze, pmap, pvector, thaw
 from six import text_type, int2byte, StringIO
 
+from ziffect import _clock
+
 
 def cleanup(lines):
     result = []
@@ -149,33 +156,208 @@ class DBResponse(PClass):
         if self.rev is not None:
             result += " rev=" + text_type(self.rev)
         if self.doc:
-            result += u" " + json.dumps(self.doc, sort_keys=True)
+            result += u" " + json.dumps(thaw(self.doc), sort_keys=True)
         return u'DB Response<' + text_type(result) + u'>'
 
 
+_RECORD_HEADER = struct.Struct(str('<II'))
+_LOG_CHUNK = 1 << 20
+
+
+def _encode_doc_id(doc_id):
+    if isinstance(doc_id, UUID):
+        return ['uuid', doc_id.hex]
+    return ['json', doc_id]
+
+
+def _decode_doc_id(encoded):
+    kind, value = encoded
+    if kind == 'uuid':
+        return UUID(hex=value)
+    return value
+
+
+class _Log(object):
+    """
+    An append-only, memory-mapped log of JSON records.
+
+    Each record is a length and a CRC32 of the payload, followed by the
+    payload. The file is grown in chunks, and the unused tail is zeroes, so
+    the end of the log is the first record with zero length or a bad CRC.
+
+    :param path: The path of the log file.
+    :param sync_every: The number of appends after which the log is synced
+        to disk.
+    :param sync_interval: The number of seconds after which an append syncs
+        the log to disk, even if fewer than ``sync_every`` have happened.
+    """
+    def __init__(self, path, sync_every, sync_interval):
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            size = _LOG_CHUNK
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._offset = 0
+        self._unsynced = 0
+        self._synced_at = _clock()
+
+    def replay(self):
+        """
+        Read the records of the log, from the start.
+        """
+        offset = 0
+        header_size = _RECORD_HEADER.size
+        while offset + header_size <= len(self._map):
+            length, crc = _RECORD_HEADER.unpack_from(self._map, offset)
+            start = offset + header_size
+            payload = self._map[start:start + length]
+            if (length == 0 or len(payload) != length or
+                    zlib.crc32(payload) & 0xffffffff != crc):
+                break
+            offset = start + length
+            yield json.loads(payload.decode('utf-8'))
+        self._offset = offset
+
+    def append(self, record):
+        """
+        Append a record to the log, syncing the log if enough appends or time
+        have passed since the last sync.
+        """
+        payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        end = self._offset + _RECORD_HEADER.size + len(payload)
+        if end > len(self._map):
+            self._grow(end)
+        _RECORD_HEADER.pack_into(
+            self._map, self._offset, len(payload),
+            zlib.crc32(payload) & 0xffffffff)
+        self._map[self._offset + _RECORD_HEADER.size:end] = payload
+        self._offset = end
+        self._unsynced += 1
+        if (self._unsynced >= self._sync_every or
+                _clock() - self._synced_at >= self._sync_interval):
+            self.sync()
+
+    def _grow(self, end):
+        size = len(self._map)
+        while size < end:
+            size += max(size, _LOG_CHUNK)
+        self._map.flush()
+        self._map.close()
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def sync(self):
+        """
+        Write appended records to disk.
+        """
+        if self._unsynced:
+            self._map.flush()
+            os.fsync(self._fd)
+            self._unsynced = 0
+        self._synced_at = _clock()
+
+    def close(self):
+        self.sync()
+        self._map.close()
+        os.close(self._fd)
+
+
+def _freeze(value):
+    """
+    Recursively convert dicts and lists into pyrsistent maps and vectors.
+    Values that are already pyrsistent are assumed to be frozen, so documents
+    built from documents got from a :class:`DB` are frozen cheaply.
+    """
+    kind = type(value)
+    if kind is dict:
+        return pmap(dict((key, _freeze(item)) for key, item in value.items()))
+    if kind is list or kind is tuple:
+        return pvector([_freeze(item) for item in value])
+    if isinstance(value, (dict, list, set)):
+        return freeze(value)
+    return value
+
+
 class DB(object):
-    def __init__(self):
+    """
+    A document store with revisions.
+
+    Documents are frozen into pyrsistent structures when they are put, and
+    ``get`` returns the frozen document without copying it. Responses are
+    built once and shared, as they are immutable too.
+
+    :param path: An optional path of a log file to keep the documents in. The
+        documents in the log are loaded when the store is created, and every
+        ``put`` is appended to it. Without a path, documents are only kept in
+        memory.
+    :param sync_every: The number of ``put`` s after which the log is synced
+        to disk.
+    :param sync_interval: The number of seconds after which a ``put`` syncs
+        the log to disk. Puts since the last sync may be lost if the process
+        crashes. Call :meth:`sync` to make every put durable.
+    """
+    def __init__(self, path=None, sync_every=64, sync_interval=0.05):
         self._data = {}
+        self._put_responses = {}
+        self._lock = Lock()
+        self._log = None
+        if path is not None:
+            self._log = _Log(path, sync_every, sync_interval)
+            for doc_id, rev, doc in self._log.replay():
+                self._data.setdefault(_decode_doc_id(doc_id), []).append(
+                    [_freeze(doc), None])
 
     def get(self, doc_id, rev=LATEST):
-        docs = self._data.get(doc_id)
-        if not docs:
+        revisions = self._data.get(doc_id)
+        if not revisions:
             return DBResponse(status=DBStatus.NOT_FOUND)
-        if rev >= len(docs):
+        if rev >= len(revisions):
             return DBResponse(status=DBStatus.NOT_FOUND)
         if rev < LATEST:
             return DBResponse(status=DBStatus.BAD_REQUEST)
-        if rev < 0:
-            rev = len(docs) + rev
-        return DBResponse(
-            status=DBStatus.OK, rev=rev, doc=json.loads(docs[rev]))
+        revision = revisions[rev]
+        response = revision[1]
+        if response is None:
+            if rev < 0:
+                rev = len(revisions) + rev
+            response = revision[1] = DBResponse(
+                status=DBStatus.OK, rev=rev, doc=revision[0])
+        return response
 
     def put(self, doc_id, rev, doc):
-        docs = self._data.get(doc_id, [])
-        if rev != len(docs):
-            return DBResponse(status=DBStatus.CONFLICT)
-        docs.append(json.dumps(doc))
-        self._data[doc_id] = docs
-        return DBResponse(status=DBStatus.OK, rev=rev)
+        frozen = _freeze(doc)
+        with self._lock:
+            revisions = self._data.get(doc_id, [])
+            if rev != len(revisions):
+                return DBResponse(status=DBStatus.CONFLICT)
+            if self._log is not None:
+                self._log.append([_encode_doc_id(doc_id), rev, thaw(frozen)])
+            revisions.append([frozen, None])
+            self._data[doc_id] = revisions
+            response = self._put_responses.get(rev)
+            if response is None:
+                response = self._put_responses[rev] = DBResponse(
+                    status=DBStatus.OK, rev=rev)
+        return response
+
+    def sync(self):
+        """
+        Write every ``put`` to disk.
+        """
+        if self._log is not None:
+            with self._lock:
+                self._log.sync()
+
+    def close(self):
+        """
+        Sync and close the log.
+        """
+        if self._log is not None:
+            with self._lock:
+                self._log.close()
+                self._log = None
 
 InMemoryDB = DB
@@ -0,0 +1,125 @@
+"""
+The ziffect.fanout module, for provider methods that are implemented by
+performing other effects concurrently.
+
+Provider methods are normally called with just the arguments of the intent,
+so they cannot perform other effects. A provider method marked with
+:func:`fans_out` is also passed a :class:`FanOut` handle, and may return an
+Effect, which is performed with the dispatcher that is performing the intent.
+Its result is the result of the method::
+
+    @ziffect.implements(ShardedDBInterface)
+    class ShardedDB(object):
+
+        @ziffect.fanout.fans_out
+        def get_all(self, fanout, doc_id):
+            return fanout.gather([
+                shard_effects.get(shard=shard, doc_id=doc_id)
+                for shard in range(10)
+            ]).on(merge_documents)
+
+The child effects are started together, so when their performers are
+asynchronous (see :mod:`ziffect.aio` and :mod:`ziffect.threads`) the method
+completes in the time of the slowest child, rather than the sum of them.
+"""
+
+from __future__ import absolute_import
+
+import sys
+
+from effect import (
+    ComposedDispatcher, Effect, ParallelEffects, TypeDispatcher, parallel,
+    perform)
+
+from ziffect import _deadline, perform_parallel_async
+
+__all__ = [
+    'fans_out',
+    'FanOut',
+]
+
+
+def fans_out(method):
+    """
+    Decorator for methods of a provider, that makes dispatchers pass a
+    :class:`FanOut` handle to the method before the arguments of the intent,
+    and perform the Effect it returns.
+
+    Such methods are always called on the thread performing the intent, even
+    if an executor is passed to :func:`ziffect.dispatcher`. The effects they
+    return are performed by the dispatcher, so the executor still applies to
+    them.
+
+    :param method: The provider method.
+
+    :returns: The same method.
+    """
+    method._ziffect_fans_out = True
+    return method
+
+
+_parallel_dispatcher = TypeDispatcher({
+    ParallelEffects: perform_parallel_async,
+})
+
+
+class FanOut(object):
+    """
+    The handle passed to provider methods marked with :func:`fans_out`.
+
+    :ivar dispatcher: The dispatcher that is performing the intent.
+    """
+    __slots__ = ('dispatcher',)
+
+    def __init__(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def gather(self, effects):
+        """
+        Combine effects into one that performs them concurrently.
+
+        :param effects: The child Effects.
+
+        :returns: An Effect whose result is the list of the results of
+            ``effects``, in the same order. If a child fails, the Effect fails
+            with ``effect.FirstError``.
+        """
+        return parallel(effects)
+
+
+def _make_fanout_performer(method, arg_keys):
+    """
+    Constructs a performer that calls a method marked with :func:`fans_out`,
+    and performs the Effect it returns.
+
+    ``ParallelEffects`` are performed with ``perform_parallel_async`` if the
+    dispatcher has no performer for them. Like other methods, the method is
+    not called once the deadline of the intent has passed, and is passed the
+    deadline if it is marked with :func:`ziffect.deadlines.takes_deadline`.
+
+    :param method: The provider method.
+    :param arg_keys: The names of the arguments of the intent, in the order
+        they are declared on the interface.
+    """
+    arg_keys = tuple(arg_keys)
+    get_deadline = _deadline.get
+    takes_deadline = getattr(method, '_ziffect_takes_deadline', False)
+
+    def _perform(dispatcher, intent, box):
+        deadline = get_deadline()
+        if deadline is not None and deadline._fail_if_expired(box):
+            return
+        kwargs = dict(zip(arg_keys, intent._ziffect_values))
+        if takes_deadline:
+            kwargs['deadline'] = deadline
+        try:
+            result = method(FanOut(dispatcher), **kwargs)
+        except:
+            box.fail(sys.exc_info())
+            return
+        if isinstance(result, Effect):
+            perform(ComposedDispatcher([dispatcher, _parallel_dispatcher]),
+                    result.on(success=box.succeed, error=box.fail))
+        else:
+            box.succeed(result)
+    return _perform
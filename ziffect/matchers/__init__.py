@@ -1,14 +1,82 @@
-
 """
 The ziffect.matchers module, filled with convenient testtools matchers for use
 with ziffect.
 """
 
-from testtools.matchers import Not, Is
+from __future__ import absolute_import
+
+from funcsigs import signature
+from testtools.matchers import Matcher, Mismatch
+
+import ziffect
+
+__all__ = [
+    'Provides',
+]
+
+
+_PLACEHOLDER = object()
+
+
+class Provides(Matcher):
+    """
+    Matches if interface is provided by the matchee, that is if it has a
+    method for each method of the interface that can be called with the
+    arguments of its intents.
+
+    Methods marked with :func:`ziffect.fanout.fans_out` must also take the
+    fan out handle first, and methods marked with
+    :func:`ziffect.deadlines.takes_deadline` a ``deadline`` keyword argument.
+    Providers that make their own performers, such as those of
+    :mod:`ziffect.processes` and :mod:`ziffect.scoped`, are taken to provide
+    any interface.
+    """
+    def __init__(self, interface):
+        self.interface = interface
+
+    def __str__(self):
+        return 'Provides({0})'.format(self.interface.__name__)
+
+    def match(self, matchee):
+        if (getattr(matchee, '_ziffect_make_performer', None) is not None or
+                getattr(matchee, '_ziffect_make_performers', None)
+                is not None):
+            return None
+        intents = ziffect.intents(self.interface)
+        problems = []
+        for method_name in ziffect._iterate_methods(self.interface):
+            problem = _method_problem(
+                getattr(matchee, method_name, None),
+                getattr(intents, method_name)._ziffect_args)
+            if problem is not None:
+                problems.append('{0}: {1}'.format(method_name, problem))
+        if problems:
+            return Mismatch('{0!r} does not provide {1}: {2}'.format(
+                matchee, self.interface.__name__, '; '.join(problems)))
+        return None
 
 
-def Provides(interface):
+def _method_problem(method, arg_keys):
     """
-    Matches if interface is provided by the matchee.
+    :returns: Why ``method`` cannot be called with the arguments named
+        ``arg_keys``, or ``None`` if it can.
     """
-    return Not(Is(None))
+    if method is None:
+        return 'missing'
+    if not callable(method):
+        return 'not callable'
+    try:
+        method_signature = signature(method)
+    except (TypeError, ValueError):
+        return None
+    args = ()
+    kwargs = dict.fromkeys(arg_keys, _PLACEHOLDER)
+    if getattr(method, '_ziffect_fans_out', False):
+        args = (_PLACEHOLDER,)
+    if getattr(method, '_ziffect_takes_deadline', False):
+        kwargs['deadline'] = None
+    try:
+        method_signature.bind(*args, **kwargs)
+    except TypeError as e:
+        return str(e)
+    return None
@@ -0,0 +1,205 @@
+"""
+The ziffect.metrics module, for recording how often, how slowly and how
+unsuccessfully the methods of ziffect interfaces are performed.
+
+Pass a :class:`MetricsCollector` to :func:`ziffect.dispatcher`::
+
+    metrics = ziffect.metrics.MetricsCollector()
+    dispatcher = ziffect.dispatcher({DBInterface: ZiffectDB(db)},
+                                    instrument=metrics)
+
+and read the metrics with :meth:`MetricsCollector.snapshot` or
+:meth:`MetricsCollector.prometheus_text`. Dispatchers built without an
+``instrument`` do not time anything.
+"""
+
+from __future__ import absolute_import
+
+import sys
+from bisect import bisect_left
+from threading import Lock
+
+from pyrsistent import PClass, field, pvector_field
+
+from ziffect import _clock, _interface_name
+
+__all__ = [
+    'MetricsCollector',
+    'MethodMetrics',
+    'DEFAULT_BUCKETS',
+]
+
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+
+
+class MethodMetrics(PClass):
+    """
+    A snapshot of the metrics of one interface method.
+
+    :ivar interface: The name of the interface, qualified by its module as
+        in ``'module:Interface'``.
+    :ivar method: The name of the method.
+    :ivar calls: The number of effects of the method that completed.
+    :ivar errors: How many of those failed.
+    :ivar total_seconds: The sum of their durations.
+    :ivar buckets: The upper bounds of the latency histogram, in seconds.
+    :ivar counts: The number of effects whose duration fell in each bucket,
+        with one more entry for durations above the last bound.
+    """
+    interface = field(type=str)
+    method = field(type=str)
+    calls = field(type=int, initial=0)
+    errors = field(type=int, initial=0)
+    total_seconds = field(type=float, initial=0.0)
+    buckets = pvector_field(float)
+    counts = pvector_field(int)
+
+
+class _MethodRecorder(object):
+    """
+    Accumulates the metrics of one interface method.
+    """
+    def __init__(self, interface_name, method_name, buckets):
+        self._interface_name = interface_name
+        self._method_name = method_name
+        self._buckets = buckets
+        self._lock = Lock()
+        self._calls = 0
+        self._errors = 0
+        self._total = 0.0
+        self._counts = [0] * (len(buckets) + 1)
+
+    def __call__(self, seconds, failed):
+        bucket = bisect_left(self._buckets, seconds)
+        with self._lock:
+            self._calls += 1
+            self._errors += failed
+            self._total += seconds
+            self._counts[bucket] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return MethodMetrics(
+                interface=self._interface_name,
+                method=self._method_name,
+                calls=self._calls,
+                errors=self._errors,
+                total_seconds=self._total,
+                buckets=self._buckets,
+                counts=self._counts)
+
+
+class MetricsCollector(object):
+    """
+    An in-process collector of call counts, error counts and latency
+    histograms for each ``(interface, method)``.
+
+    :param buckets: The upper bounds of the latency histogram buckets, in
+        seconds, in increasing order.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = tuple(float(bound) for bound in buckets)
+        self._lock = Lock()
+        self._recorders = {}
+
+    def recorder(self, interface, method_name):
+        """
+        Get the function that records the metrics of a method. This is the
+        ``instrument`` hook of :func:`ziffect.dispatcher`.
+
+        :param interface: The ziffect interface.
+        :param method_name: The name of the method.
+
+        :returns: A function that takes the duration in seconds, and whether
+            the effect failed.
+        """
+        key = (str(_interface_name(interface)), method_name)
+        with self._lock:
+            recorder = self._recorders.get(key)
+            if recorder is None:
+                recorder = self._recorders[key] = _MethodRecorder(
+                    key[0], key[1], self._buckets)
+            return recorder
+
+    def snapshot(self):
+        """
+        :returns: A list of :class:`MethodMetrics`, sorted by interface and
+            method name.
+        """
+        with self._lock:
+            recorders = sorted(self._recorders.items())
+        return [recorder.snapshot() for _, recorder in recorders]
+
+    def prometheus_text(self, prefix='ziffect'):
+        """
+        Export the metrics in the Prometheus text exposition format.
+
+        :param prefix: The prefix of the metric names.
+
+        :returns: The metrics as text.
+        """
+        lines = [
+            '# TYPE {0}_calls_total counter'.format(prefix),
+            '# TYPE {0}_errors_total counter'.format(prefix),
+            '# TYPE {0}_duration_seconds histogram'.format(prefix),
+        ]
+        for metrics in self.snapshot():
+            labels = 'interface="{0}",method="{1}"'.format(
+                metrics.interface, metrics.method)
+            lines.append('{0}_calls_total{{{1}}} {2}'.format(
+                prefix, labels, metrics.calls))
+            lines.append('{0}_errors_total{{{1}}} {2}'.format(
+                prefix, labels, metrics.errors))
+            cumulative = 0
+            bounds = [repr(bound) for bound in metrics.buckets] + ['+Inf']
+            for bound, count in zip(bounds, metrics.counts):
+                cumulative += count
+                lines.append(
+                    '{0}_duration_seconds_bucket{{{1},le="{2}"}} {3}'.format(
+                        prefix, labels, bound, cumulative))
+            lines.append('{0}_duration_seconds_sum{{{1}}} {2!r}'.format(
+                prefix, labels, metrics.total_seconds))
+            lines.append('{0}_duration_seconds_count{{{1}}} {2}'.format(
+                prefix, labels, metrics.calls))
+        return '\n'.join(lines) + '\n'
+
+
+class _TimingBox(object):
+    """
+    A box that records the duration and outcome of an effect.
+    """
+    __slots__ = ('_box', '_record', '_start')
+
+    def __init__(self, box, record, start):
+        self._box = box
+        self._record = record
+        self._start = start
+
+    def succeed(self, result):
+        self._record(_clock() - self._start, False)
+        self._box.succeed(result)
+
+    def fail(self, exc_info):
+        self._record(_clock() - self._start, True)
+        self._box.fail(exc_info)
+
+
+def _make_instrumented_performer(performer, record):
+    """
+    Constructs a performer that times ``performer``.
+
+    :param record: A function that takes the duration in seconds and whether
+        the effect failed.
+    """
+    def _perform(dispatcher, intent, box):
+        timing_box = _TimingBox(box, record, _clock())
+        try:
+            performer(dispatcher, intent, timing_box)
+        except:
+            timing_box.fail(sys.exc_info())
+    _perform.ziffect_wrapped = performer
+    return _perform
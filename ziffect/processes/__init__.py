@@ -0,0 +1,120 @@
+"""
+The ziffect.processes module, for running CPU-bound providers in a pool of
+worker processes.
+
+Instead of a provider, map an interface to a :class:`ProcessProvider`, which
+builds a provider in each worker process by calling a factory::
+
+    hashing = ziffect.processes.ProcessProvider(make_hasher, max_workers=4)
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({HasherInterface: hashing}),
+        ziffect.threads.threaded_base_dispatcher,
+    ])
+    ziffect.threads.blocking_perform(dispatcher, effect)
+
+The factory must be picklable, such as a function defined at the top level of
+a module, and so must the arguments and results of the methods. Effects of
+the interface complete asynchronously, from a thread of the pool, so they are
+performed like those of providers run on an executor (see
+:mod:`ziffect.threads`), and the programs that issue them do not change.
+
+Deadlines (see :mod:`ziffect.deadlines`) are checked before intents are
+submitted to the pool, and intents still waiting for a worker are cancelled
+when they pass. Methods are not passed the deadline, even if they are marked
+with :func:`ziffect.deadlines.takes_deadline`.
+"""
+
+from __future__ import absolute_import
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from uuid import uuid4
+
+import ziffect
+
+__all__ = [
+    'ProcessProvider',
+]
+
+
+# The provider of each ProcessProvider in this worker process, keyed by its
+# token, and the functions that call its methods.
+_providers = {}
+
+
+def _call_provider(token, factory, method_name, arg_keys, values):
+    """
+    Call a method of the provider that ``factory`` builds in a worker
+    process, with the values of an intent. The provider is built by the
+    first call in each worker process, and kept under ``token``, since the
+    factory is unpickled anew for every call.
+    """
+    provider = _providers.get(token)
+    if provider is None:
+        provider = _providers[token] = (factory(), {})
+    instance, calls = provider
+    call = calls.get(method_name)
+    if call is None:
+        method = getattr(instance, method_name)
+        if ziffect._accepts_positionally(method, arg_keys):
+            call = method
+        else:
+            def call(*values):
+                return method(**dict(zip(arg_keys, values)))
+        call = calls[method_name] = call
+    return call(*values)
+
+
+class ProcessProvider(object):
+    """
+    A provider of an interface whose methods are called in a pool of worker
+    processes.
+
+    :param factory: A picklable function with no arguments that returns a
+        provider of the interface. It is called once in each worker process,
+        when the first method is called there.
+    :param max_workers: The number of worker processes, defaulting to the
+        number of processors.
+    """
+    def __init__(self, factory, max_workers=None):
+        # Providers are built lazily rather than by an initializer of the
+        # pool, which needs Python 3.7.
+        self._factory = factory
+        self._token = uuid4().hex
+        self._pool = ProcessPoolExecutor(max_workers=max_workers)
+
+    def _ziffect_make_performer(self, interface, method_name, arg_keys):
+        """
+        Constructs the performer of a method of the interface, that submits
+        intents to the pool. Called by :func:`ziffect.dispatcher`.
+        """
+        submit = partial(self._pool.submit, _call_provider, self._token,
+                         self._factory, method_name, tuple(arg_keys))
+        get_deadline = ziffect._deadline.get
+
+        def _perform(dispatcher, intent, box):
+            deadline = get_deadline()
+            if deadline is None:
+                submit(intent._ziffect_values).add_done_callback(
+                    partial(ziffect._settle, ziffect._context_box(box)))
+            elif not deadline._fail_if_expired(box):
+                future = submit(intent._ziffect_values)
+                deadline._cancel_on_expiry(future)
+                future.add_done_callback(
+                    partial(deadline._settle, ziffect._context_box(box)))
+        return _perform
+
+    def shutdown(self, wait=True):
+        """
+        Stop the worker processes.
+
+        :param wait: Whether to wait for the intents that have been submitted
+            to be performed first.
+        """
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
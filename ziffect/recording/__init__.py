@@ -0,0 +1,463 @@
+"""
+The ziffect.recording module, for providers generated from an interface that
+record the calls made to them, for use in tests.
+
+:func:`recorder` creates a provider of any interface whose methods record
+their arguments and return ``None``, and :func:`stub` one whose methods also
+return canned responses::
+
+    db = ziffect.recording.stub(DBInterface, {
+        'get': DBResponse(status=DBStatus.OK, rev=0, doc={}),
+        'update': DBResponse(status=DBStatus.OK, rev=1),
+    })
+    sync_perform(ziffect.compile_dispatcher([{DBInterface: db},
+                                             base_dispatcher]),
+                 execute_function(doc_id, add_field))
+    assert db.calls['update'].count(doc_id=doc_id) == 1
+
+The calls of each method are kept in a :class:`CallLog`, which stores them a
+column per argument rather than a tuple per call. Ints and floats are stored
+in arrays, and other values as indexes into a table of the distinct values,
+so millions of calls with repeated arguments take a few bytes each. With
+``max_calls`` only the most recent calls are kept.
+"""
+
+from __future__ import absolute_import
+
+from array import array
+from threading import Lock
+
+from six import iteritems
+
+import ziffect
+
+__all__ = [
+    'CallLog',
+    'RecordingProvider',
+    'recorder',
+    'stub',
+]
+
+
+_INTS = 'q'
+_FLOATS = 'd'
+_CODES = 'L'
+
+
+class _Column(object):
+    """
+    The values of one argument of the calls in a :class:`CallLog`.
+
+    Ints and floats are stored in arrays. Other values are stored as codes
+    in an array, that index a table of the distinct values, keyed by type
+    and value so that equal values of different types are kept apart. Once
+    a value does not fit, the column changes to a representation that fits
+    it, ending with a list of the values.
+    """
+    __slots__ = ('data', 'kind', 'table', 'index')
+
+    def __init__(self, declared_type):
+        if declared_type is int:
+            self.kind = _INTS
+        elif declared_type is float:
+            self.kind = _FLOATS
+        else:
+            self.kind = _CODES
+        self.data = array(self.kind)
+        self.table = []
+        self.index = {}
+
+    def _encode(self, value):
+        kind = self.kind
+        if kind == _CODES:
+            key = (type(value), value)
+            code = self.index.get(key)
+            if code is None:
+                code = self.index[key] = len(self.table)
+                self.table.append(value)
+            return code
+        if kind is None or type(value) is (int if kind == _INTS else float):
+            return value
+        raise TypeError(value)
+
+    def decode(self, stored):
+        if self.kind == _CODES:
+            return self.table[stored]
+        return stored
+
+    def values(self):
+        """
+        :returns: A list of the values, in the order they are stored.
+        """
+        if self.kind == _CODES:
+            table = self.table
+            return [table[code] for code in self.data]
+        return list(self.data)
+
+    def put(self, position, value):
+        """
+        Store a value at a position, or after the last one if ``position``
+        is the number of values stored.
+        """
+        try:
+            stored = self._encode(value)
+            if position == len(self.data):
+                self.data.append(stored)
+            else:
+                self.data[position] = stored
+        except (TypeError, OverflowError):
+            self._widen()
+            self.put(position, value)
+
+    def _widen(self):
+        """
+        Change to the next representation that fits more values.
+        """
+        values = self.values()
+        if self.kind == _CODES:
+            self.kind, self.data = None, values
+            self.table, self.index = [], {}
+        else:
+            self.kind, self.data = _CODES, array(_CODES)
+            for value in values:
+                self.data.append(self._encode(value))
+
+    def compact(self):
+        """
+        Drop the values of the table that are no longer stored.
+        """
+        if self.kind != _CODES or len(self.table) <= 2 * len(self.data) + 64:
+            return
+        values = self.values()
+        self.table = []
+        self.index = {}
+        self.data = array(_CODES, [self._encode(value) for value in values])
+
+    def positions(self, value):
+        """
+        :returns: A function that takes a stored value and returns whether
+            it is ``value``, or ``None`` if no stored value can be.
+        """
+        if self.kind == _CODES:
+            try:
+                code = self.index.get((type(value), value))
+            except TypeError:
+                return None
+            if code is None:
+                return None
+            return code.__eq__
+        if self.kind is None:
+            return lambda stored: type(stored) is type(value) and (
+                stored == value)
+        if type(value) is not (int if self.kind == _INTS else float):
+            return None
+        return value.__eq__
+
+    def count(self, value):
+        """
+        :returns: The number of stored values that are ``value``.
+        """
+        if self.kind == _CODES:
+            try:
+                code = self.index.get((type(value), value))
+            except TypeError:
+                return 0
+            return 0 if code is None else self.data.count(code)
+        matches = self.positions(value)
+        if matches is None:
+            return 0
+        if self.kind is None:
+            return sum(1 for stored in self.data if matches(stored))
+        return self.data.count(value)
+
+
+class CallLog(object):
+    """
+    The calls of one method of a :class:`RecordingProvider`, oldest first.
+
+    Iterating gives a tuple of the arguments of each call, in the order they
+    are declared on the interface, and indexing gives the tuple of one call.
+
+    :ivar names: The names of the arguments.
+    :ivar total: The number of calls recorded, including those no longer
+        kept because of ``max_calls``.
+    """
+    def __init__(self, names, types, max_calls=None):
+        self.names = tuple(names)
+        self.total = 0
+        self._types = tuple(types)
+        self._max_calls = max_calls
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forget every call.
+        """
+        with self._lock:
+            self._columns = [_Column(t) for t in self._types]
+            self._size = 0
+            self._start = 0
+
+    def _append(self, values):
+        with self._lock:
+            self.total += 1
+            max_calls = self._max_calls
+            if max_calls is None or self._size < max_calls:
+                position = self._size
+                self._size += 1
+            else:
+                position = self._start
+                self._start = (position + 1) % max_calls
+            for column, value in zip(self._columns, values):
+                column.put(position, value)
+            if max_calls is not None and position == max_calls - 1:
+                for column in self._columns:
+                    column.compact()
+
+    def __len__(self):
+        return self._size
+
+    def _positions(self):
+        """
+        The positions of the calls in the columns, oldest first.
+        """
+        start, size = self._start, self._size
+        if not start:
+            return range(size)
+        return list(range(start, size)) + list(range(start))
+
+    def __getitem__(self, index):
+        with self._lock:
+            size = self._size
+            if index < 0:
+                index += size
+            if not 0 <= index < size:
+                raise IndexError('call log index out of range')
+            position = (self._start + index) % size
+            return tuple(column.decode(column.data[position])
+                         for column in self._columns)
+
+    def __iter__(self):
+        with self._lock:
+            columns = [column.values() for column in self._columns]
+            positions = self._positions()
+        if not columns:
+            return iter([()] * len(positions))
+        return iter([tuple(column[position] for column in columns)
+                     for position in positions])
+
+    def __repr__(self):
+        return '<CallLog of {0} calls of ({1})>'.format(
+            self._size, ', '.join(self.names))
+
+    def column(self, name):
+        """
+        :param name: The name of an argument.
+
+        :returns: A list of the values of the argument in each call, oldest
+            first.
+        """
+        column_index = self.names.index(name)
+        with self._lock:
+            values = self._columns[column_index].values()
+            positions = self._positions()
+        if not self._start:
+            return values
+        return [values[position] for position in positions]
+
+    def _matching(self, values):
+        """
+        :returns: A list of the positions of the calls whose arguments are
+            ``values``, a dict of argument names to values, oldest first.
+        """
+        tests = []
+        for name, value in iteritems(values):
+            column = self._columns[self.names.index(name)]
+            matches = column.positions(value)
+            if matches is None:
+                return []
+            tests.append((column.data, matches))
+        return [position for position in self._positions()
+                if all(matches(data[position]) for data, matches in tests)]
+
+    def count(self, **values):
+        """
+        Count the calls with the given arguments.
+
+        :param values: The values of some arguments, by name. Values match
+            equal values of the same type.
+
+        :returns: The number of calls whose arguments have the given values.
+        """
+        with self._lock:
+            if len(values) == 1:
+                (name, value), = values.items()
+                return self._columns[self.names.index(name)].count(value)
+            if not values:
+                return self._size
+            return len(self._matching(values))
+
+    def where(self, **values):
+        """
+        Find the calls with the given arguments.
+
+        :param values: The values of some arguments, by name. Values match
+            equal values of the same type.
+
+        :returns: A list of the tuples of arguments of the calls whose
+            arguments have the given values, oldest first.
+        """
+        with self._lock:
+            positions = self._matching(values)
+            return [tuple(column.decode(column.data[position])
+                          for column in self._columns)
+                    for position in positions]
+
+
+class RecordingProvider(object):
+    """
+    Base class of the providers created by :func:`recorder` and
+    :func:`stub`. They have a method for each method of their interface,
+    which records the call and returns its response.
+
+    :ivar calls: A dict of the :class:`CallLog` of each method, by name.
+    """
+    def __init__(self, interface, responses=None, max_calls=None):
+        responses = dict(responses or {})
+        intents = ziffect.intents(interface)
+        self.calls = {}
+        logs = []
+        respond = []
+        for method_name in self._ziffect_methods:
+            intent = getattr(intents, method_name)
+            log = CallLog(intent._ziffect_args,
+                          [arg.type for arg in intent._ziffect_arguments],
+                          max_calls=max_calls)
+            self.calls[method_name] = log
+            logs.append(log._append)
+            respond.append(_responder(
+                intent._ziffect_args, responses.pop(method_name, None)))
+        if responses:
+            raise ValueError('{0} has no methods {1}'.format(
+                interface.__name__, ', '.join(sorted(responses))))
+        self._ziffect_logs = tuple(logs)
+        self._ziffect_respond = tuple(respond)
+
+    def clear(self):
+        """
+        Forget the calls of every method.
+        """
+        for log in self.calls.values():
+            log.clear()
+
+
+def _responder(names, response):
+    """
+    Turn a canned response into a function of the tuple of the arguments of
+    a call, or ``None`` for no response.
+    """
+    if response is None:
+        return None
+    if isinstance(response, list):
+        responses = [_responder(names, each) for each in response]
+        remaining = iter(responses[:-1])
+
+        def _next(values):
+            each = next(remaining, responses[-1])
+            return None if each is None else each(values)
+        return _next
+    if isinstance(response, BaseException):
+        def _raise(values):
+            raise response
+        return _raise
+    if callable(response):
+        return lambda values: response(**dict(zip(names, values)))
+    return lambda values: response
+
+
+_RECORDING_METHOD_TEMPLATE = """
+def {name}(_ziffect_self, {params}):
+    _ziffect_values = ({values})
+    _ziffect_self._ziffect_logs[{index}](_ziffect_values)
+    _ziffect_respond = _ziffect_self._ziffect_respond[{index}]
+    if _ziffect_respond is not None:
+        return _ziffect_respond(_ziffect_values)
+"""
+
+_classes = {}
+_classes_lock = Lock()
+
+
+def _recording_class(interface):
+    """
+    Get the subclass of :class:`RecordingProvider` for an interface, whose
+    methods are generated code that take the arguments of the interface
+    in the order they are declared.
+    """
+    with _classes_lock:
+        cls = _classes.get(interface)
+        if cls is not None:
+            return cls
+        intents = ziffect.intents(interface)
+        method_names = tuple(ziffect._iterate_methods(interface))
+        attributes = {'_ziffect_methods': method_names}
+        for index, method_name in enumerate(method_names):
+            intent = getattr(intents, method_name)
+            namespace = {}
+            required = []
+            optional = []
+            for name, arg in zip(intent._ziffect_args,
+                                 intent._ziffect_arguments):
+                if arg.default is ziffect._TOKEN:
+                    required.append(name)
+                else:
+                    namespace['_default_' + name] = arg.default
+                    optional.append('{0}=_default_{0}'.format(name))
+            source = _RECORDING_METHOD_TEMPLATE.format(
+                name=method_name, index=index,
+                params=', '.join(required + optional),
+                values=''.join(name + ', '
+                               for name in intent._ziffect_args),
+            )
+            exec(compile(source, '<ziffect recording>', 'exec'), namespace)
+            attributes[method_name] = namespace[method_name]
+        cls = _classes[interface] = type(
+            str('Recording' + interface.__name__), (RecordingProvider,),
+            attributes)
+        return cls
+
+
+def recorder(interface, max_calls=None):
+    """
+    Create a provider of an interface that records the calls to its methods,
+    and returns ``None`` from them.
+
+    :param interface: The ziffect interface.
+    :param max_calls: The largest number of calls kept for each method, or
+        ``None`` to keep every call.
+
+    :returns: A :class:`RecordingProvider`.
+    """
+    return _recording_class(interface)(interface, max_calls=max_calls)
+
+
+def stub(interface, responses, max_calls=None):
+    """
+    Create a provider of an interface that records the calls to its methods,
+    and returns canned responses from them.
+
+    :param interface: The ziffect interface.
+    :param responses: A dict of the response of each method, by name.
+        Methods without a response return ``None``. A response that is an
+        exception instance is raised, a callable is called with the arguments
+        as keyword arguments and its result returned, and a list gives the
+        responses of successive calls, its last one being repeated. Other
+        responses are returned as they are.
+    :param max_calls: The largest number of calls kept for each method, or
+        ``None`` to keep every call.
+
+    :returns: A :class:`RecordingProvider`.
+    """
+    return _recording_class(interface)(
+        interface, responses=responses, max_calls=max_calls)
@@ -0,0 +1,270 @@
+"""
+The ziffect.replay module, for recording the intents performed by a
+dispatcher and their results, and replaying them against effect programs.
+
+Wrap a dispatcher with a :class:`Recorder` to append every intent of a
+ziffect interface and its outcome to a log file::
+
+    with ziffect.replay.Recorder('traffic.log') as recorder:
+        sync_perform(recorder.wrap(dispatcher), program())
+
+Then perform the same program against the log, without the providers::
+
+    ziffect.replay.replay('traffic.log', program())
+
+Records are written in the order the intents complete, so effects that
+overlap, such as those of parallel programs or of providers run on an
+executor, are in the log in whatever order they finished. By default they are
+matched in any order against a window of the next records, which are read as
+intents are matched, so captures of any size are replayed in bounded memory.
+Logs of programs that perform one effect at a time can also be replayed with
+``ordered=True``. :func:`read_log` yields the records in the form taken by
+:func:`ziffect.perform_sequence_destructed_args`.
+
+Intents and results are encoded with :mod:`ziffect.codec`. Those it cannot
+encode, and exceptions, are pickled.
+"""
+
+from __future__ import absolute_import
+
+import io
+import pickle
+import struct
+from threading import Lock
+
+import ziffect
+from ziffect.codec import encode_into, decode_from
+
+__all__ = [
+    'Recorder',
+    'read_log',
+    'replay',
+]
+
+
+_MAGIC = b'ZFXLOG1\n'
+_LENGTH = struct.Struct(str('<I'))
+_RESULT = 0
+_PICKLED_RESULT = 1
+_PICKLED_ERROR = 2
+_PICKLED_INTENT = 4
+
+
+def _record(intent, kind, value):
+    """
+    Encode a record, including its length.
+
+    :raises Exception: if the intent or the value can neither be encoded nor
+        pickled.
+    """
+    out = bytearray(_LENGTH.size)
+    out.append(kind)
+    try:
+        encode_into(out, intent)
+    except TypeError:
+        # The intent has arguments the codec cannot encode.
+        del out[_LENGTH.size + 1:]
+        if kind == _RESULT:
+            kind = _PICKLED_RESULT
+        out[_LENGTH.size] = kind | _PICKLED_INTENT
+        out += pickle.dumps((intent, value), protocol=2)
+    else:
+        if kind == _RESULT:
+            start = len(out)
+            try:
+                encode_into(out, value)
+            except TypeError:
+                del out[start:]
+                out[_LENGTH.size] = kind = _PICKLED_RESULT
+        if kind != _RESULT:
+            out += pickle.dumps(value, protocol=2)
+    _LENGTH.pack_into(out, 0, len(out) - _LENGTH.size)
+    return out
+
+
+class _RecordingBox(object):
+    """
+    A box that records the outcome of an intent before providing it.
+    """
+    __slots__ = ('_recorder', '_intent', '_box')
+
+    def __init__(self, recorder, intent, box):
+        self._recorder = recorder
+        self._intent = intent
+        self._box = box
+
+    def succeed(self, result):
+        try:
+            self._recorder._append(self._intent, _RESULT, result)
+        finally:
+            self._box.succeed(result)
+
+    def fail(self, exc_info):
+        try:
+            self._recorder._append(self._intent, _PICKLED_ERROR, exc_info[1])
+        finally:
+            self._box.fail(exc_info)
+
+
+class Recorder(object):
+    """
+    Appends the intents performed by dispatchers, and their outcomes, to a log
+    file.
+
+    Intents that the codec cannot encode are pickled. Exceptions that cannot
+    be pickled are recorded as a ``RuntimeError`` of their ``repr``. Records
+    that cannot be written either way are dropped, and counted in
+    :attr:`dropped`, without changing the outcome of the intent.
+
+    :param path: The path of the log file, which is overwritten.
+    :param buffer_size: The number of bytes buffered before they are written
+        to the file.
+
+    :ivar dropped: The number of records that have been dropped.
+    """
+    def __init__(self, path, buffer_size=1 << 20):
+        self._file = io.open(path, 'wb', buffering=buffer_size)
+        self._file.write(_MAGIC)
+        self._lock = Lock()
+        self.dropped = 0
+
+    def wrap(self, dispatcher):
+        """
+        Wrap a dispatcher so that intents of ziffect interfaces that it
+        performs are recorded.
+
+        :param dispatcher: An Effect dispatcher.
+
+        :returns: An Effect dispatcher.
+        """
+        def _dispatch(intent):
+            performer = dispatcher(intent)
+            if performer is None or getattr(
+                    intent, '_ziffect_name', None) is None:
+                return performer
+
+            def _perform(dispatcher, intent, box):
+                performer(dispatcher, intent, _RecordingBox(self, intent, box))
+            return _perform
+        return _dispatch
+
+    def _append(self, intent, kind, value):
+        """
+        Write the record of the outcome of an intent, or count it as dropped
+        if it cannot be encoded.
+        """
+        try:
+            record = _record(intent, kind, value)
+        except Exception:
+            record = None
+            if kind == _PICKLED_ERROR:
+                try:
+                    record = _record(intent, kind, RuntimeError(repr(value)))
+                except Exception:
+                    pass
+        with self._lock:
+            if record is None:
+                self.dropped += 1
+            else:
+                self._file.write(record)
+
+    def close(self):
+        """
+        Write any buffered records, and close the log file.
+        """
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _returning(result):
+    """
+    A function of the arguments of an intent that returns a recorded result.
+    """
+    def _function(**_):
+        return result
+    return _function
+
+
+def _raising(error):
+    """
+    A function of the arguments of an intent that raises a recorded
+    exception.
+    """
+    def _function(**_):
+        raise error
+    return _function
+
+
+def read_log(path):
+    """
+    Read a log written by a :class:`Recorder`, one record at a time.
+
+    :param path: The path of the log file.
+
+    :returns: An iterator of ``(intent, function)`` tuples, where the function
+        takes the arguments of the intent as keyword arguments, and returns
+        the recorded result or raises the recorded exception.
+    """
+    with io.open(path, 'rb') as log:
+        if log.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError('{0!r} is not a ziffect log'.format(path))
+        while True:
+            header = log.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return
+            length, = _LENGTH.unpack(header)
+            payload = log.read(length)
+            if len(payload) < length:
+                return
+            kind = bytearray(payload[:1])[0]
+            if kind & _PICKLED_INTENT:
+                intent, value = pickle.loads(payload[1:])
+                kind &= ~_PICKLED_INTENT
+            else:
+                intent, offset = decode_from(payload, 1)
+                if kind == _RESULT:
+                    value, _ = decode_from(payload, offset)
+                else:
+                    value = pickle.loads(payload[offset:])
+            if kind == _PICKLED_ERROR:
+                yield intent, _raising(value)
+            else:
+                yield intent, _returning(value)
+
+
+def replay(path, effect, ordered=False, fallback_dispatcher=None,
+           window=1000):
+    """
+    Perform an effect, with the intents and results of a log in place of the
+    providers, with :func:`ziffect.perform_sequence_destructed_args`.
+
+    :param path: The path of a log written by a :class:`Recorder`.
+    :param effect: The Effect to perform.
+    :param ordered: Whether the intents must be performed in the order of the
+        log.
+    :param fallback_dispatcher: A dispatcher for intents that are not in the
+        log, defaulting to ``effect.base_dispatcher`` and a performer of
+        ``effect.ParallelEffects``.
+    :param window: If ``ordered`` is false, the number of records of the log
+        that intents are matched against, read ahead as they are matched, or
+        ``None`` to read the whole log first.
+
+    :raises AssertionError: if an intent does not match the log, or is
+        further ahead in it than the window, or not every record is
+        performed.
+
+    :returns: The result of the effect.
+    """
+    records = read_log(path)
+    try:
+        return ziffect.perform_sequence_destructed_args(
+            records, effect, ordered=ordered,
+            fallback_dispatcher=fallback_dispatcher, window=window)
+    finally:
+        records.close()
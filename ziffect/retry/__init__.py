@@ -0,0 +1,273 @@
+"""
+The ziffect.retry module, for retrying the methods of ziffect interfaces with
+backoff, and failing fast while a backend is unhealthy.
+
+Pass a :class:`RetryPolicy` to :func:`ziffect.dispatcher`, either for every
+method or for some of them::
+
+    policy = ziffect.retry.RetryPolicy(
+        max_attempts=5,
+        retry_result=lambda response: (
+            response.status == DBStatus.NETWORK_ERROR),
+        circuit_breaker=ziffect.retry.CircuitBreakerPolicy(
+            failure_threshold=10, reset_timeout=30),
+    )
+    dispatcher = ziffect.dispatcher({DBInterface: ZiffectDB(db)},
+                                    retry={DBInterface: policy})
+
+Failed attempts are retried after a jittered, exponentially growing delay.
+The delay is an ``effect.Delay`` effect performed with the dispatcher, so
+tests can perform it without sleeping. Dispatchers that have no performer for
+``Delay`` sleep on the performing thread. A failed attempt is not retried
+if the deadline of the program (see :mod:`ziffect.deadlines`) would pass
+before the delay is over.
+
+With a circuit breaker, once ``failure_threshold`` attempts in a row have
+failed the method fails with :class:`CircuitOpenError` without calling the
+provider, until ``reset_timeout`` seconds have passed. Then a single trial
+attempt is let through, which closes the circuit if it succeeds.
+"""
+
+from __future__ import absolute_import
+
+import random
+import sys
+from threading import Lock
+
+from effect import (
+    ComposedDispatcher, Delay, Effect, TypeDispatcher,
+    perform, perform_delay_with_sleep)
+from pyrsistent import PClass, field
+
+import ziffect
+from ziffect import _clock
+
+__all__ = [
+    'RetryPolicy',
+    'CircuitBreakerPolicy',
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'get_circuit_breaker',
+]
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised in place of performing an intent whose method's circuit is open.
+    """
+
+
+class CircuitBreakerPolicy(PClass):
+    """
+    When to stop calling a provider method.
+
+    :ivar failure_threshold: The number of failed attempts in a row that open
+        the circuit.
+    :ivar reset_timeout: The number of seconds the circuit stays open before
+        a trial attempt is allowed.
+    """
+    failure_threshold = field(type=int, initial=5)
+    reset_timeout = field(initial=30.0)
+
+
+class RetryPolicy(PClass):
+    """
+    How a method is retried.
+
+    :ivar max_attempts: The largest number of times the provider is called
+        for one intent, including the first.
+    :ivar base_delay: The number of seconds to wait before the first retry.
+    :ivar multiplier: How much the delay grows with each retry.
+    :ivar max_delay: The longest delay, in seconds.
+    :ivar jitter: The fraction of each delay that is randomized, between
+        ``0`` and ``1``, so that clients do not retry in lockstep.
+    :ivar retry_on: The exception types that are retried.
+    :ivar retry_result: An optional function that takes the result of the
+        provider, and returns whether it is a failure that should be retried.
+        If all attempts fail this way, the last result is provided.
+    :ivar circuit_breaker: An optional :class:`CircuitBreakerPolicy`.
+    :ivar random: The function that returns random numbers in ``[0, 1)`` for
+        the jitter.
+    """
+    max_attempts = field(type=int, initial=3)
+    base_delay = field(initial=0.1)
+    multiplier = field(initial=2.0)
+    max_delay = field(initial=10.0)
+    jitter = field(initial=0.5)
+    retry_on = field(initial=(Exception,))
+    retry_result = field(initial=None)
+    circuit_breaker = field(initial=None)
+    random = field(initial=lambda: random.random)
+
+    def delay(self, attempt):
+        """
+        :param attempt: The number of the attempt that failed, starting at 1.
+
+        :returns: The number of seconds to wait before the next attempt.
+        """
+        delay = min(self.max_delay,
+                    self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 - self.jitter * self.random())
+
+
+class CircuitBreaker(object):
+    """
+    The state of the circuit of one method in a dispatcher.
+
+    :param policy: The :class:`CircuitBreakerPolicy`.
+    """
+    def __init__(self, policy):
+        self._policy = policy
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        """
+        ``'closed'``, ``'open'`` or ``'half-open'``.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if (self._trial or
+                    _clock() - self._opened_at < self._policy.reset_timeout):
+                return 'open'
+            return 'half-open'
+
+    def allow(self):
+        """
+        Whether an attempt may call the provider. While half-open, only one
+        attempt is allowed until its outcome is known.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if (self._trial or
+                    _clock() - self._opened_at < self._policy.reset_timeout):
+                return False
+            self._trial = True
+            return True
+
+    def succeeded(self):
+        """
+        Record that an attempt succeeded, which closes the circuit.
+        """
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failed(self):
+        """
+        Record that an attempt failed.
+        """
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if (self._opened_at is not None or
+                    self._failures >= self._policy.failure_threshold):
+                self._opened_at = _clock()
+
+
+_delay_dispatcher = TypeDispatcher({Delay: perform_delay_with_sleep})
+
+
+class _Attempt(object):
+    """
+    A box for one attempt at performing an intent, that retries failed
+    attempts.
+    """
+    def __init__(self, performer, policy, breaker, dispatcher, intent, box,
+                 number):
+        self._performer = performer
+        self._policy = policy
+        self._breaker = breaker
+        self._dispatcher = dispatcher
+        self._intent = intent
+        self._box = box
+        self._number = number
+
+    def start(self):
+        if self._breaker is not None and not self._breaker.allow():
+            try:
+                raise CircuitOpenError(self._intent)
+            except CircuitOpenError:
+                self._box.fail(sys.exc_info())
+            return
+        try:
+            self._performer(self._dispatcher, self._intent, self)
+        except:
+            self.fail(sys.exc_info())
+
+    def succeed(self, result):
+        retry_result = self._policy.retry_result
+        if retry_result is not None and retry_result(result):
+            self._retry(lambda: self._box.succeed(result))
+            return
+        if self._breaker is not None:
+            self._breaker.succeeded()
+        self._box.succeed(result)
+
+    def fail(self, exc_info):
+        if isinstance(exc_info[1], self._policy.retry_on):
+            self._retry(lambda: self._box.fail(exc_info))
+            return
+        # The provider answered, so the backend is not unhealthy.
+        if self._breaker is not None:
+            self._breaker.succeeded()
+        self._box.fail(exc_info)
+
+    def _retry(self, give_up):
+        if self._breaker is not None:
+            self._breaker.failed()
+        if self._number >= self._policy.max_attempts:
+            give_up()
+            return
+        delay = self._policy.delay(self._number)
+        deadline = ziffect._deadline.get()
+        if deadline is not None and deadline.remaining() <= delay:
+            give_up()
+            return
+        following = _Attempt(
+            self._performer, self._policy, self._breaker, self._dispatcher,
+            self._intent, self._box, self._number + 1)
+        delay = Effect(Delay(delay))
+        perform(ComposedDispatcher([self._dispatcher, _delay_dispatcher]),
+                delay.on(success=lambda _: following.start(),
+                         error=self._box.fail))
+
+
+def _make_retrying_performer(performer, policy):
+    """
+    Constructs a performer that retries ``performer`` according to
+    ``policy``.
+    """
+    breaker = None
+    if policy.circuit_breaker is not None:
+        breaker = CircuitBreaker(policy.circuit_breaker)
+
+    def _perform(dispatcher, intent, box):
+        _Attempt(performer, policy, breaker, dispatcher, intent, box,
+                 1).start()
+    _perform.ziffect_wrapped = performer
+    _perform.ziffect_circuit_breaker = breaker
+    return _perform
+
+
+def get_circuit_breaker(dispatcher, interface, method_name):
+    """
+    Get the circuit breaker of a method in a dispatcher.
+
+    :param dispatcher: A dispatcher returned by :func:`ziffect.dispatcher` or
+        :func:`ziffect.compile_dispatcher`.
+    :param interface: The ziffect interface.
+    :param method_name: The name of the method.
+
+    :returns: The :class:`CircuitBreaker`, or ``None`` if the method has no
+        circuit breaker in the dispatcher.
+    """
+    breakers = ziffect._wrapped_attributes(
+        dispatcher, interface, method_name, 'ziffect_circuit_breaker')
+    return breakers[0] if breakers else None
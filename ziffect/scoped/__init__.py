@@ -0,0 +1,176 @@
+"""
+The ziffect.scoped module, for dispatchers that are built once and perform
+intents with providers bound for the duration of a request.
+
+Map an interface to a :class:`ScopedProvider` instead of a provider, and
+build the dispatcher once::
+
+    db_provider = ziffect.scoped.ScopedProvider(DBInterface)
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({DBInterface: db_provider}),
+        base_dispatcher,
+    ])
+
+Then bind the provider of each request around performing its effects::
+
+    def handle(request):
+        with db_provider.bound(ZiffectDB(request.db)):
+            return sync_perform(dispatcher, execute_function(...))
+
+Binding a provider takes constant time, whatever the number of methods and
+interfaces. Providers are bound in a context variable (see ``contextvars``),
+so requests handled concurrently by threads or asyncio tasks each see their
+own provider, and effects that complete on the threads of an executor
+continue in the context of their program. Without ``contextvars``, providers
+are bound per thread.
+"""
+
+from __future__ import absolute_import
+
+import ziffect
+
+__all__ = [
+    'ScopedProvider',
+    'UnboundProviderError',
+]
+
+
+class UnboundProviderError(LookupError):
+    """
+    The failure of an intent performed by a :class:`ScopedProvider` that has
+    no provider bound.
+    """
+
+
+class _Bound(object):
+    """
+    A provider bound in a context, and the performers of its methods for
+    each dispatcher, which are built the first time they are performed.
+    """
+    __slots__ = ('provider', 'performers')
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.performers = {}
+
+
+class _Binding(object):
+    """
+    Context manager that binds a provider.
+    """
+    def __init__(self, variable, provider):
+        self._variable = variable
+        self._provider = provider
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(self._variable.set(_Bound(self._provider)))
+        return self._provider
+
+    def __exit__(self, *exc_info):
+        self._variable.reset(self._tokens.pop())
+
+
+class ScopedProvider(object):
+    """
+    A stand-in for the provider of an interface, that performs each intent
+    with the provider bound in the current context.
+
+    The performers of a :func:`ziffect.dispatcher` for a scoped provider are
+    built once. Each of them performs intents with a performer of the method
+    of the bound provider, built the first time a method is performed while
+    the provider is bound, as :func:`ziffect.dispatcher` would build it, so
+    methods marked with :func:`ziffect.streams.streaming`,
+    :func:`ziffect.fanout.fans_out`, :func:`ziffect.batching.batched` or
+    :func:`ziffect.deadlines.takes_deadline` work as they do with a provider.
+
+    Caches (see :mod:`ziffect.caching`) and circuit breakers (see
+    :mod:`ziffect.retry`) are built with them, so the results and failures
+    of one bound provider never reach another, and last only as long as the
+    binding. Bulkheads and metrics are shared by every binding.
+
+    :param interface: The ziffect interface.
+    :param executor: An optional ``concurrent.futures.Executor`` to call the
+        methods of the providers on, or a dict keyed like the ``executor`` of
+        :func:`ziffect.dispatcher`.
+    :param batch: An optional :class:`ziffect.batching.BatchPolicy`, or a
+        dict keyed like ``executor``, for the methods marked with
+        :func:`ziffect.batching.batched`. Only intents performed with the
+        same bound provider are batched together.
+    """
+    def __init__(self, interface, executor=None, batch=None):
+        self._interface = interface
+        self._executor = executor
+        self._batch = batch
+        self._variable = ziffect._context_variable(
+            'ziffect provider of {0}'.format(interface.__name__))
+
+    def bound(self, provider):
+        """
+        Bind a provider of the interface in the current context.
+
+        :param provider: A provider of the interface.
+
+        :returns: A context manager, during which intents performed by this
+            scoped provider are performed with ``provider``.
+        """
+        return _Binding(self._variable, provider)
+
+    def current(self):
+        """
+        :returns: The provider bound in the current context, or ``None``.
+        """
+        bound = self._variable.get()
+        return None if bound is None else bound.provider
+
+    def _ziffect_make_performers(self, interface, wrap):
+        """
+        Constructs the performers of the methods of the interface, that
+        perform intents with the performers of the bound provider. Called by
+        :func:`ziffect.dispatcher`.
+
+        :param wrap: The function that wraps the performers of a provider
+            with the bulkheads, retries and caches of the dispatcher.
+
+        :returns: A dict from method name to performer.
+        """
+        get = self._variable.get
+        executor = self._executor
+        batch = self._batch
+        method_names = list(ziffect._iterate_methods(interface))
+        # Invalidations reach the caches of other methods, so the performers
+        # of interfaces with caches are built together.
+        together = any(
+            ziffect._method_metadata(interface, method_name, name)
+            for method_name in method_names
+            for name in ('_ziffect_cache', '_ziffect_invalidates'))
+
+        def build(provider, names):
+            performers = wrap(dict(
+                (method_name, ziffect._make_method_performer(
+                    interface, provider, method_name, executor=executor,
+                    batch=batch))
+                for method_name in names))
+            return dict(((build, method_name), performer)
+                        for method_name, performer in performers.items())
+
+        def make_performer(method_name):
+            key = (build, method_name)
+            names = method_names if together else [method_name]
+
+            def _perform(dispatcher, intent, box):
+                bound = get()
+                if bound is None:
+                    error = UnboundProviderError(
+                        'No provider of {0} is bound'.format(
+                            interface.__name__))
+                    box.fail((UnboundProviderError, error, None))
+                    return
+                performer = bound.performers.get(key)
+                if performer is None:
+                    bound.performers.update(build(bound.provider, names))
+                    performer = bound.performers[key]
+                performer(dispatcher, intent, box)
+            return _perform
+        return dict((method_name, make_performer(method_name))
+                    for method_name in method_names)
@@ -0,0 +1,339 @@
+"""
+The ziffect.streams module, for interface methods that produce their results
+a chunk at a time.
+
+A method of an interface is marked as streaming with :func:`streaming`::
+
+    @ziffect.interface
+    class DBInterface(object):
+
+        @ziffect.streams.streaming(buffer=1000)
+        def scan(prefix=ziffect.argument(type=text_type)):
+            pass
+
+Providers implement it by returning an iterable, such as a generator, or an
+asynchronous iterator, such as an ``async def`` generator::
+
+    @ziffect.implements(DBInterface)
+    class ZiffectDB(object):
+        def scan(self, prefix):
+            for doc_id in self.db.keys(prefix):
+                yield self.db.get(doc_id)
+
+The result of the effect is a :class:`Stream`, which programs read with
+:func:`read` or :func:`for_each`::
+
+    @do
+    def count_documents(prefix):
+        documents = yield db_effects.scan(prefix=prefix)
+        count = 0
+        while True:
+            chunk = yield ziffect.streams.read(documents, 100)
+            if not chunk:
+                break
+            count += len(chunk)
+        yield do_return(count)
+
+Dispatchers built by :func:`ziffect.dispatcher` for an interface with
+streaming methods also perform :class:`ReadStream`. Other dispatchers can be
+composed with :obj:`stream_dispatcher`.
+
+Items are only taken from the provider when they are read, plus at most
+``buffer`` items read ahead, so streams of any length flow through programs in
+bounded memory. Reading ahead overlaps the provider with the program when the
+method runs on an executor (see :func:`ziffect.dispatcher`) or is
+asynchronous (see :mod:`ziffect.aio`), in which case the stream is read with
+:func:`ziffect.aio.asyncio_perform`.
+"""
+
+from __future__ import absolute_import
+
+import sys
+from collections import deque
+from concurrent.futures import Future
+from itertools import islice
+from threading import Lock
+
+from effect import Effect, TypeDispatcher
+from effect.do import do
+from pyrsistent import PClass, field
+
+import ziffect
+
+__all__ = [
+    'streaming',
+    'read',
+    'for_each',
+    'perform_read',
+    'stream_dispatcher',
+    'ReadStream',
+    'Stream',
+]
+
+
+def streaming(method=None, buffer=0):
+    """
+    Decorator for methods of a ziffect interface, whose providers return an
+    iterable or an asynchronous iterator of results. Effects of the method
+    provide a :class:`Stream` of the results.
+
+    Use it either as ``@ziffect.streams.streaming`` or with arguments, as
+    ``@ziffect.streams.streaming(buffer=1000)``.
+
+    :param buffer: The number of items that may be taken from the provider
+        before they are read.
+
+    :returns: decorator for the interface method.
+    """
+    if method is None:
+        return lambda method: streaming(method, buffer=buffer)
+    if buffer < 0:
+        raise ValueError('buffer must not be negative, not {0!r}'.format(
+            buffer))
+    method._ziffect_stream_buffer = buffer
+    return method
+
+
+def _done_future(function, *args):
+    """
+    Call ``function`` and return a finished future of its outcome.
+    """
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except:
+        future.set_exception(sys.exc_info()[1])
+    return future
+
+
+class Stream(object):
+    """
+    The results of an effect of a streaming method, which are read with
+    :func:`read`. Each read provides as many items as it asks for, except at
+    the end of the stream.
+
+    Only one read of a stream may be in progress at a time.
+
+    :param iterable: An iterable, or an asynchronous iterator, of results.
+    :param buffer: The number of items to take from ``iterable`` before they
+        are read.
+    :param executor: An optional ``concurrent.futures.Executor`` to take the
+        items of an iterable on.
+    """
+    def __init__(self, iterable, buffer=0, executor=None):
+        if hasattr(iterable, '__anext__'):
+            from ziffect.aio import _take_async
+            self._take = lambda count: _take_async(iterable, count)
+            self._close = lambda: _close_async(iterable)
+            self._threaded = False
+        else:
+            iterator = iter(iterable)
+
+            def take(count):
+                return list(islice(iterator, count))
+            if executor is None:
+                self._take = lambda count: _done_future(take, count)
+            else:
+                self._take = lambda count: executor.submit(take, count)
+            self._close = getattr(iterator, 'close', lambda: None)
+            self._threaded = executor is not None
+        self._buffer = buffer
+        self._lock = Lock()
+        self._items = deque()
+        self._taking = False
+        self._exhausted = False
+        self._closed = False
+        self._error = None
+        self._reader = None
+
+    def _read(self, max_items, box):
+        """
+        Provide up to ``max_items`` items to ``box``, or an empty list at the
+        end of the stream.
+        """
+        if self._threaded:
+            box = ziffect._context_box(box)
+        with self._lock:
+            if self._reader is not None:
+                error = RuntimeError('The stream is already being read')
+                outcome = (box, False, (RuntimeError, error, None))
+            else:
+                self._reader = (max_items, box)
+                outcome = self._take_for_reader()
+            count = self._start_taking()
+        self._settle(outcome)
+        if count:
+            self._take(count).add_done_callback(
+                lambda future: self._taken(count, future))
+
+    def _take_for_reader(self):
+        """
+        Take the items for the pending read if there are enough of them, or
+        the stream has ended. Called with the lock held.
+
+        :returns: ``None`` if the read must wait, otherwise a tuple of the box
+            of the read, whether it succeeded, and its result or exc_info.
+        """
+        max_items, box = self._reader
+        finished = self._exhausted or self._error is not None
+        if len(self._items) >= max_items or (self._items and finished):
+            count = min(max_items, len(self._items))
+            outcome = (True, [self._items.popleft() for _ in range(count)])
+        elif self._error is not None:
+            outcome = (False, self._error)
+        elif self._exhausted:
+            outcome = (True, [])
+        else:
+            return None
+        self._reader = None
+        return (box,) + outcome
+
+    def _start_taking(self):
+        """
+        Decide whether to take more items from the iterable. Called with the
+        lock held.
+
+        :returns: The number of items to take, or ``0``.
+        """
+        if self._taking or self._exhausted or self._error is not None:
+            return 0
+        count = self._buffer
+        if self._reader is not None:
+            count = max(count, self._reader[0])
+        count -= len(self._items)
+        if count > 0:
+            self._taking = True
+            return count
+        return 0
+
+    def _taken(self, count, future):
+        """
+        Add the items taken from the iterable, and provide them to the pending
+        read.
+        """
+        with self._lock:
+            self._taking = False
+            try:
+                items = future.result()
+            except:
+                self._error = sys.exc_info()
+            else:
+                if not self._closed:
+                    self._items.extend(items)
+                    self._exhausted = len(items) < count
+            close = self._closed
+            outcome = None
+            if self._reader is not None:
+                outcome = self._take_for_reader()
+            count = self._start_taking()
+        if close:
+            self._close()
+        self._settle(outcome)
+        if count:
+            self._take(count).add_done_callback(
+                lambda future: self._taken(count, future))
+
+    @staticmethod
+    def _settle(outcome):
+        if outcome is None:
+            return
+        box, succeeded, value = outcome
+        if succeeded:
+            box.succeed(value)
+        else:
+            box.fail(value)
+
+    def close(self):
+        """
+        Stop taking items from the iterable, closing it if it is a generator.
+        Reads that follow find the end of the stream.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = self._exhausted = True
+            self._items.clear()
+            taking = self._taking
+        if not taking:
+            self._close()
+
+
+def _close_async(iterator):
+    """
+    Close an asynchronous generator on the running event loop.
+    """
+    aclose = getattr(iterator, 'aclose', None)
+    if aclose is not None:
+        from asyncio import ensure_future
+        ensure_future(aclose())
+
+
+class ReadStream(PClass):
+    """
+    An intent to read the next items of a :class:`Stream`. Its result is a
+    list of at most ``max_items`` items, which is empty at the end of the
+    stream.
+    """
+    stream = field(type=Stream, mandatory=True)
+    max_items = field(type=int, mandatory=True)
+
+
+def perform_read(dispatcher, intent, box):
+    """
+    Perform a :class:`ReadStream`.
+    """
+    intent.stream._read(intent.max_items, box)
+
+
+stream_dispatcher = TypeDispatcher({ReadStream: perform_read})
+
+
+def read(stream, max_items):
+    """
+    Read the next items of a stream.
+
+    :param stream: A :class:`Stream`.
+    :param max_items: The largest number of items to read.
+
+    :returns: An Effect of a list of at most ``max_items`` items, which is
+        empty at the end of the stream.
+    """
+    return Effect(ReadStream(stream=stream, max_items=max_items))
+
+
+@do
+def for_each(stream, function, chunk_size=100):
+    """
+    Read a stream to the end, a chunk at a time.
+
+    :param stream: A :class:`Stream`.
+    :param function: A function called with each list of items. If it returns
+        an Effect, the Effect is performed before the next chunk is read.
+    :param chunk_size: The largest number of items in each chunk.
+
+    :returns: An Effect of ``None``. If ``function`` or its Effect fails, the
+        stream is closed and the Effect fails.
+    """
+    while True:
+        chunk = yield read(stream, chunk_size)
+        if not chunk:
+            break
+        try:
+            result = function(chunk)
+            if isinstance(result, Effect):
+                yield result
+        except:
+            stream.close()
+            raise
+
+
+def _make_streaming_performer(method, arg_keys, buffer, executor=None):
+    """
+    Constructs a performer for a streaming method, that provides a
+    :class:`Stream` of the items returned by the method.
+    """
+    call = ziffect._make_call(method, arg_keys)
+
+    def _open(intent):
+        return Stream(call(intent), buffer=buffer, executor=executor)
+    return ziffect._make_call_performer(_open, executor=executor)
@@ -0,0 +1,96 @@
+from __future__ import unicode_literals
+
+import asyncio
+
+from testtools import TestCase
+from testtools.matchers import Equals, LessThan, Raises, MatchesException
+from effect import parallel, Delay, Effect
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.aio import asyncio_perform, async_dispatcher
+
+
+@ziffect.interface
+class KeyValue(object):
+
+    def get(key=ziffect.argument(type=str)):
+        pass
+
+    def fail(key=ziffect.argument(type=str)):
+        pass
+
+
+@ziffect.implements(KeyValue)
+class SlowKeyValue(object):
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def get(self, key):
+        await asyncio.sleep(self.delay)
+        return key.upper()
+
+    async def fail(self, key):
+        raise KeyError(key)
+
+
+@do
+def get_both(first, second):
+    kv = ziffect.effects(KeyValue)
+    a = yield kv.get(key=first)
+    b = yield kv.get(key=second)
+    yield do_return(a + b)
+
+
+class AsyncioPerformTests(TestCase):
+    """
+    Tests for performing effects with coroutine providers.
+    """
+
+    def setUp(self):
+        super(AsyncioPerformTests, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def perform(self, dispatcher, effect):
+        return self.loop.run_until_complete(
+            asyncio_perform(dispatcher, effect, loop=self.loop))
+
+    def test_program(self):
+        """
+        ``@do`` programs yielding effects of coroutine providers run to
+        completion.
+        """
+        dispatcher = async_dispatcher({KeyValue: SlowKeyValue(0)})
+        self.expectThat(
+            self.perform(dispatcher, get_both('a', 'b')), Equals('AB'))
+
+    def test_error(self):
+        """
+        Exceptions raised by coroutine providers fail the effect.
+        """
+        dispatcher = async_dispatcher({KeyValue: SlowKeyValue(0)})
+        self.expectThat(
+            lambda: self.perform(
+                dispatcher, ziffect.effects(KeyValue).fail(key='a')),
+            Raises(MatchesException(KeyError)))
+
+    def test_concurrent(self):
+        """
+        Many programs wait on their providers at the same time.
+        """
+        dispatcher = async_dispatcher({KeyValue: SlowKeyValue(0.05)})
+        start = self.loop.time()
+        result = self.perform(
+            dispatcher,
+            parallel([get_both('a', str(i)) for i in range(1000)]))
+        self.expectThat(result[7], Equals('A7'))
+        self.expectThat(self.loop.time() - start, LessThan(5))
+
+    def test_delay(self):
+        """
+        ``Delay`` is performed on the event loop.
+        """
+        dispatcher = async_dispatcher({})
+        self.expectThat(
+            self.perform(dispatcher, Effect(Delay(0.01))), Equals(None))
@@ -0,0 +1,131 @@
+from __future__ import unicode_literals
+
+import asyncio
+import threading
+
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import parallel, parallel_all_errors
+
+import ziffect
+from ziffect.aio import asyncio_perform, async_dispatcher, schedule_on_loop
+from ziffect.batching import batched, BatchPolicy
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Documents(object):
+
+    @batched('get_many')
+    def get(doc_id=ziffect.argument(type=int)):
+        pass
+
+
+@ziffect.implements(Documents)
+class RecordingDocuments(object):
+    def __init__(self):
+        self.bulk_calls = []
+
+    def get(self, doc_id):
+        raise AssertionError('get should be batched')
+
+    def get_many(self, intents):
+        self.bulk_calls.append([intent.doc_id for intent in intents])
+        return [
+            KeyError(intent.doc_id) if intent.doc_id < 0
+            else 'doc-%d' % (intent.doc_id,)
+            for intent in intents
+        ]
+
+
+class BatchingTests(TestCase):
+    """
+    Tests for coalescing intents into bulk method calls.
+    """
+
+    def setUp(self):
+        super(BatchingTests, self).setUp()
+        self.documents = RecordingDocuments()
+        self.get = ziffect.effects(Documents).get
+
+    def perform(self, effect, **policy):
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Documents: self.documents},
+                               batch=BatchPolicy(**policy)),
+            threaded_base_dispatcher,
+        ])
+        return blocking_perform(dispatcher, effect, timeout=5)
+
+    def test_coalesces(self):
+        """
+        Concurrent intents are performed with one bulk call, and identical
+        intents are only passed once.
+        """
+        result = self.perform(
+            parallel([self.get(doc_id=i % 3) for i in range(6)]))
+        self.expectThat(
+            result, Equals(['doc-0', 'doc-1', 'doc-2'] * 2))
+        self.expectThat(self.documents.bulk_calls, Equals([[0, 1, 2]]))
+
+    def test_max_size(self):
+        """
+        Batches are performed as soon as they are full.
+        """
+        self.perform(
+            parallel([self.get(doc_id=i) for i in range(5)]), max_size=2)
+        self.expectThat(
+            self.documents.bulk_calls, Equals([[0, 1], [2, 3], [4]]))
+
+    def test_exception_result(self):
+        """
+        Exceptions in the results of the bulk method fail only their intent.
+        """
+        result = self.perform(
+            parallel_all_errors([self.get(doc_id=-1), self.get(doc_id=1)]))
+        self.expectThat(result[0][0], Equals(True))
+        self.expectThat(result[0][1][0], Equals(KeyError))
+        self.expectThat(result[1], Equals((False, 'doc-1')))
+
+    def test_single(self):
+        """
+        A lone intent is performed once the delay passes.
+        """
+        self.expectThat(self.perform(self.get(doc_id=4)), Equals('doc-4'))
+
+    def test_one_thread(self):
+        """
+        The batches of the default scheduler are performed by one long-lived
+        thread, rather than a thread per batch.
+        """
+        for i in range(5):
+            self.perform(self.get(doc_id=i))
+        names = [thread.name for thread in threading.enumerate()]
+        self.expectThat(names.count('ziffect batches'), Equals(1))
+        self.expectThat(len(self.documents.bulk_calls), Equals(5))
+
+    def test_without_policy(self):
+        """
+        Without a policy the method itself is called.
+        """
+        dispatcher = ziffect.dispatcher({Documents: self.documents})
+        self.expectThat(
+            lambda: blocking_perform(dispatcher, self.get(doc_id=1)),
+            Raises(MatchesException(AssertionError)))
+
+    def test_asyncio(self):
+        """
+        Batches can be scheduled on an asyncio event loop.
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher(
+                {Documents: self.documents},
+                batch=BatchPolicy(scheduler=schedule_on_loop)),
+            async_dispatcher({}),
+        ])
+        result = loop.run_until_complete(asyncio_perform(
+            dispatcher, parallel([self.get(doc_id=i) for i in range(3)]),
+            loop=loop))
+        self.expectThat(result, Equals(['doc-0', 'doc-1', 'doc-2']))
+        self.expectThat(self.documents.bulk_calls, Equals([[0, 1, 2]]))
@@ -0,0 +1,222 @@
+from __future__ import unicode_literals
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import perform, parallel
+from pyrsistent import InvariantException
+
+import ziffect
+from ziffect.bulkheads import (
+    BulkheadPolicy, BulkheadFullError, get_bulkheads, FAIL, SHED)
+from ziffect.deadlines import DeadlineExceeded, deadline_dispatcher, within
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Backend(object):
+
+    def get(key=ziffect.argument(type=text_type)):
+        pass
+
+    def scan(key=ziffect.argument(type=text_type)):
+        pass
+
+
+class GatedBackend(object):
+    """
+    A backend whose methods wait for their key to be released.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.gates = {}
+        self.running = 0
+        self.max_running = 0
+
+    def gate(self, key):
+        with self.lock:
+            return self.gates.setdefault(key, threading.Event())
+
+    def get(self, key):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.gate(key).wait(10)
+        with self.lock:
+            self.running -= 1
+        return key
+
+    scan = get
+
+
+class BulkheadTests(TestCase):
+    """
+    Tests for limiting how many effects are performed at once.
+    """
+
+    def setUp(self):
+        super(BulkheadTests, self).setUp()
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.addCleanup(self.executor.shutdown)
+        self.backend = GatedBackend()
+        self.addCleanup(self.release_all)
+        self.outcomes = {}
+
+    def release_all(self):
+        for key in ['a', 'b', 'c', 'd', 's1', 's2', 's3']:
+            self.backend.gate(key).set()
+
+    def make_dispatcher(self, bulkhead):
+        return ziffect.compile_dispatcher([
+            ziffect.dispatcher({Backend: self.backend},
+                               executor=self.executor, bulkhead=bulkhead),
+            threaded_base_dispatcher])
+
+    def start(self, dispatcher, method, key):
+        """
+        Start performing an effect, recording its outcome when it completes.
+        """
+        done = threading.Event()
+
+        def record(outcome):
+            self.outcomes[key] = outcome
+            done.set()
+        perform(dispatcher, getattr(ziffect.effects(Backend), method)(
+            key=key).on(success=record, error=lambda e: record(e[0])))
+        return done
+
+    def test_wait(self):
+        """
+        Intents over the limit wait in the queue, and fail when it is full.
+        """
+        dispatcher = self.make_dispatcher(
+            BulkheadPolicy(max_concurrent=2, max_queued=1))
+        done = [self.start(dispatcher, 'get', key) for key in 'abcd']
+        bulkhead, = get_bulkheads(dispatcher, Backend, 'get')
+        stats = bulkhead.stats()
+        self.expectThat((stats.active, stats.queued, stats.rejected),
+                        Equals((2, 1, 1)))
+        self.expectThat(self.outcomes, Equals({'d': BulkheadFullError}))
+        self.release_all()
+        for event in done:
+            event.wait(10)
+        self.expectThat(self.outcomes, Equals(
+            {'a': 'a', 'b': 'b', 'c': 'c', 'd': BulkheadFullError}))
+        self.expectThat(self.backend.max_running, Equals(2))
+        stats = bulkhead.stats()
+        self.expectThat((stats.active, stats.queued, stats.admitted),
+                        Equals((0, 0, 3)))
+        self.expectThat(stats.max_wait_seconds > 0, Equals(True))
+
+    def test_fail_and_shed(self):
+        """
+        Intents over the limit fail at once with ``fail``, and make the
+        longest waiting intent fail with ``shed``.
+        """
+        dispatcher = self.make_dispatcher(
+            BulkheadPolicy(max_concurrent=1, overflow=FAIL))
+        done = self.start(dispatcher, 'get', 'a')
+        self.start(dispatcher, 'get', 'b')
+        self.expectThat(self.outcomes, Equals({'b': BulkheadFullError}))
+        self.release_all()
+        done.wait(10)
+
+        self.outcomes.clear()
+        self.backend.gates.clear()
+        dispatcher = self.make_dispatcher(
+            BulkheadPolicy(max_concurrent=1, max_queued=1, overflow=SHED))
+        done = [self.start(dispatcher, 'get', key) for key in 'abc']
+        self.expectThat(self.outcomes, Equals({'b': BulkheadFullError}))
+        self.release_all()
+        for event in done:
+            event.wait(10)
+        self.expectThat(self.outcomes, Equals(
+            {'a': 'a', 'b': BulkheadFullError, 'c': 'c'}))
+        stats = get_bulkheads(dispatcher, Backend, 'get')[0].stats()
+        self.expectThat((stats.shed, stats.admitted), Equals((1, 2)))
+
+    def test_interface_and_method(self):
+        """
+        Methods limited on their own also count towards the limit of their
+        interface, so they cannot take all of it, and intents waiting for
+        their method do not hold a place in the limit of the interface.
+        """
+        dispatcher = self.make_dispatcher({
+            Backend: BulkheadPolicy(max_concurrent=3),
+            (Backend, 'scan'): BulkheadPolicy(max_concurrent=1),
+        })
+        done = [self.start(dispatcher, 'scan', key)
+                for key in ('s1', 's2', 's3')]
+        gets = [self.start(dispatcher, 'get', key) for key in 'ab']
+        scan, interface = get_bulkheads(dispatcher, Backend, 'scan')
+        self.expectThat(get_bulkheads(dispatcher, Backend, 'get'),
+                        Equals([interface]))
+        self.expectThat((scan.stats().active, scan.stats().queued),
+                        Equals((1, 2)))
+        self.expectThat((interface.stats().active, interface.stats().queued),
+                        Equals((3, 0)))
+        for key in 'ab':
+            self.backend.gate(key).set()
+        for event in gets:
+            event.wait(10)
+        self.expectThat(self.outcomes, Equals({'a': 'a', 'b': 'b'}))
+        self.release_all()
+        for event in done:
+            event.wait(10)
+        self.expectThat(len(self.outcomes), Equals(5))
+
+    def test_parallel_program(self):
+        """
+        Programs that issue more effects in parallel than the limit complete,
+        with at most the limit performed at once.
+        """
+        self.release_all()
+        dispatcher = self.make_dispatcher(BulkheadPolicy(max_concurrent=2))
+        effects = ziffect.effects(Backend)
+        self.expectThat(
+            blocking_perform(
+                dispatcher,
+                parallel([effects.get(key=key) for key in 'abcd'] * 5),
+                timeout=10),
+            Equals(list('abcd') * 5))
+        self.expectThat(self.backend.max_running <= 2, Equals(True))
+
+    def test_long_queue(self):
+        """
+        Long queues of intents that complete as soon as they are started are
+        drained without exhausting the stack.
+        """
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Backend: self.backend},
+                               executor=self.executor,
+                               bulkhead=BulkheadPolicy(max_concurrent=1)),
+            deadline_dispatcher,
+            threaded_base_dispatcher])
+        done = self.start(dispatcher, 'get', 'a')
+        outcomes = []
+        effect = within(0, ziffect.effects(Backend).get(key='b'))
+        for _ in range(3000):
+            perform(dispatcher, effect.on(
+                success=outcomes.append,
+                error=lambda e: outcomes.append(e[0])))
+        self.expectThat(
+            get_bulkheads(dispatcher, Backend, 'get')[0].stats().queued,
+            Equals(3000))
+        self.release_all()
+        done.wait(10)
+        self.expectThat(outcomes, Equals([DeadlineExceeded] * 3000))
+        stats = get_bulkheads(dispatcher, Backend, 'get')[0].stats()
+        self.expectThat((stats.active, stats.queued), Equals((0, 0)))
+
+    def test_invalid_policy(self):
+        """
+        Policies must have a positive limit, and a queue limit to shed.
+        """
+        self.expectThat(lambda: BulkheadPolicy(max_concurrent=0),
+                        Raises(MatchesException(InvariantException)))
+        self.expectThat(
+            lambda: BulkheadPolicy(max_concurrent=1, overflow=SHED),
+            Raises(MatchesException(InvariantException)))
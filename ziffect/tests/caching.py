@@ -0,0 +1,126 @@
+from __future__ import unicode_literals
+
+from testtools import TestCase
+from testtools.matchers import Equals, Is
+from effect import sync_perform
+
+import ziffect
+import ziffect.caching
+from ziffect.caching import cached, invalidates, get_cache, CacheStats
+
+
+@ziffect.interface
+class Documents(object):
+
+    @cached(maxsize=2, ttl=10)
+    def get(doc_id=ziffect.argument(type=int)):
+        pass
+
+    @invalidates('get', 'doc_id')
+    def update(doc_id=ziffect.argument(type=int),
+               doc=ziffect.argument(type=dict)):
+        pass
+
+    @invalidates('get')
+    def reset():
+        pass
+
+
+@ziffect.implements(Documents)
+class CountingDocuments(object):
+    def __init__(self):
+        self.gets = 0
+        self.docs = {}
+
+    def get(self, doc_id):
+        self.gets += 1
+        return self.docs.get(doc_id)
+
+    def update(self, doc_id, doc):
+        self.docs[doc_id] = doc
+
+    def reset(self):
+        self.docs = {}
+
+
+class CachingTests(TestCase):
+    """
+    Tests for caching the results of interface methods.
+    """
+
+    def setUp(self):
+        super(CachingTests, self).setUp()
+        self.now = [0]
+        self.patch(ziffect.caching, '_clock', lambda: self.now[0])
+        self.documents = CountingDocuments()
+        self.dispatcher = ziffect.dispatcher({Documents: self.documents})
+        self.effects = ziffect.effects(Documents)
+
+    def get(self, doc_id):
+        return sync_perform(self.dispatcher, self.effects.get(doc_id=doc_id))
+
+    def update(self, doc_id, doc):
+        return sync_perform(
+            self.dispatcher, self.effects.update(doc_id=doc_id, doc=doc))
+
+    def stats(self):
+        return get_cache(self.dispatcher, Documents, 'get').stats()
+
+    def test_repeat_served_from_cache(self):
+        """
+        Repeated intents are only performed by the provider once.
+        """
+        self.update(1, {'a': 1})
+        self.expectThat([self.get(1), self.get(1)],
+                        Equals([{'a': 1}, {'a': 1}]))
+        self.expectThat(self.documents.gets, Equals(1))
+        self.expectThat(
+            self.stats(), Equals(CacheStats(hits=1, misses=1, size=1)))
+
+    def test_invalidated_by_argument(self):
+        """
+        Performing an invalidating method drops results with the same
+        arguments only.
+        """
+        self.get(1)
+        self.get(2)
+        self.update(1, {'a': 2})
+        self.expectThat(self.get(1), Equals({'a': 2}))
+        self.get(2)
+        self.expectThat(self.documents.gets, Equals(3))
+
+    def test_invalidate_all(self):
+        """
+        Invalidating without argument names clears the cache.
+        """
+        self.get(1)
+        sync_perform(self.dispatcher, self.effects.reset())
+        self.expectThat(self.stats().size, Equals(0))
+
+    def test_ttl(self):
+        """
+        Results are not served after their ttl.
+        """
+        self.get(1)
+        self.now[0] = 11
+        self.get(1)
+        self.expectThat(self.documents.gets, Equals(2))
+
+    def test_maxsize(self):
+        """
+        The least recently used result is evicted when the cache is full.
+        """
+        self.get(1)
+        self.get(2)
+        self.get(1)
+        self.get(3)
+        self.get(1)
+        self.expectThat(self.stats().evictions, Equals(1))
+        self.expectThat(self.documents.gets, Equals(3))
+
+    def test_uncached_method(self):
+        """
+        Methods that are not cached have no cache.
+        """
+        self.expectThat(
+            get_cache(self.dispatcher, Documents, 'update'), Is(None))
@@ -0,0 +1,218 @@
+from __future__ import unicode_literals
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+from testtools import TestCase
+from testtools.matchers import Equals
+from effect import parallel, perform, sync_perform, base_dispatcher
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.coalescing import UpdateCoalescer, coalescing_dispatcher
+from ziffect.doc import DB, DBStatus, LATEST, uuid4
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class DBInterface(object):
+
+    def get(doc_id=ziffect.argument(type=UUID),
+            rev=ziffect.argument(type=int, default=LATEST)):
+        pass
+
+    def update(doc_id=ziffect.argument(type=UUID),
+               rev=ziffect.argument(type=int),
+               doc=ziffect.argument(type=dict)):
+        pass
+
+
+class GatedDB(object):
+    """
+    A provider whose first ``get`` waits until it is released, so that the
+    updates performed in the meantime queue up, and then optionally fails.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.gate = threading.Event()
+        self.gets = 0
+        self.updates = 0
+        self.fail_first = False
+
+    def get(self, doc_id, rev):
+        self.gets += 1
+        if self.gets == 1:
+            self.gate.wait(10)
+            if self.fail_first:
+                raise RuntimeError('unavailable')
+        return self.db.get(doc_id, rev)
+
+    def update(self, doc_id, rev, doc):
+        self.updates += 1
+        return self.db.put(doc_id, rev + 1, doc)
+
+
+db_effects = ziffect.effects(DBInterface)
+
+
+def make_coalescer(**kwargs):
+    return UpdateCoalescer(
+        read=lambda doc_id: db_effects.get(doc_id=doc_id),
+        write=lambda doc_id, original, doc: db_effects.update(
+            doc_id=doc_id, rev=original.rev, doc=dict(doc)),
+        value=lambda response: response.doc,
+        conflict=lambda response: response.status == DBStatus.CONFLICT,
+        **kwargs)
+
+
+def increment(doc):
+    return dict(doc, count=doc['count'] + 1)
+
+
+class UpdateCoalescerTests(TestCase):
+    """
+    Tests for ``ziffect.coalescing.UpdateCoalescer``.
+    """
+
+    def setUp(self):
+        super(UpdateCoalescerTests, self).setUp()
+        self.db = DB()
+        self.doc_id = uuid4()
+        self.db.put(self.doc_id, 0, {'count': 0})
+        self.provider = GatedDB(self.db)
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(self.provider.gate.set)
+        self.dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({DBInterface: self.provider},
+                               executor=self.executor),
+            coalescing_dispatcher,
+            threaded_base_dispatcher])
+
+    def perform_concurrently(self, effects):
+        """
+        Start performing effects in parallel, and release the provider once
+        all of them have been performed.
+        """
+        outcome = []
+        done = threading.Event()
+
+        def record(result):
+            outcome.append(result)
+            done.set()
+        perform(self.dispatcher, parallel(effects).on(
+            success=record, error=lambda exc_info: record(exc_info[1])))
+        self.provider.gate.set()
+        done.wait(10)
+        return outcome[0]
+
+    def test_coalesced(self):
+        """
+        Updates performed while a round is in flight are applied together in
+        the next round, in the order they were performed.
+        """
+        coalescer = make_coalescer()
+        results = self.perform_concurrently(
+            [coalescer.update(self.doc_id, increment) for _ in range(20)])
+        self.expectThat([result['count'] for result in results],
+                        Equals(list(range(1, 21))))
+        self.expectThat(self.db.get(self.doc_id).doc['count'], Equals(20))
+        self.expectThat(
+            (self.provider.gets, self.provider.updates), Equals((2, 2)))
+        stats = coalescer.stats()
+        self.expectThat((stats.updates, stats.rounds, stats.conflicts),
+                        Equals((20, 2, 0)))
+
+    def test_max_batch(self):
+        """
+        Rounds apply at most ``max_batch`` updates.
+        """
+        coalescer = make_coalescer(max_batch=5)
+        self.perform_concurrently(
+            [coalescer.update(self.doc_id, increment) for _ in range(16)])
+        self.expectThat(self.db.get(self.doc_id).doc['count'], Equals(16))
+        self.expectThat(coalescer.stats().rounds, Equals(4))
+
+    def test_failing_function(self):
+        """
+        A function that raises fails its update, and the others of its round
+        are still written.
+        """
+        coalescer = make_coalescer()
+
+        def fail(doc):
+            raise ValueError(doc['count'])
+
+        @do
+        def catching(effect):
+            try:
+                result = yield effect
+            except ValueError as e:
+                result = e.args
+            yield do_return(result)
+
+        results = self.perform_concurrently([
+            coalescer.update(self.doc_id, increment),
+            catching(coalescer.update(self.doc_id, increment)),
+            catching(coalescer.update(self.doc_id, fail)),
+            catching(coalescer.update(self.doc_id, increment)),
+        ])
+        self.expectThat(
+            [result.get('count') if isinstance(result, dict) else result
+             for result in results],
+            Equals([1, 2, (2,), 3]))
+        self.expectThat(self.db.get(self.doc_id).doc['count'], Equals(3))
+
+    def test_conflict(self):
+        """
+        Rounds whose write conflicts with another writer are started over.
+        """
+        self.provider.gate.set()
+        writes = []
+
+        def write(doc_id, original, doc):
+            if not writes:
+                self.db.put(doc_id, original.rev + 1, {'count': 10})
+            writes.append(doc)
+            return db_effects.update(doc_id=doc_id, rev=original.rev,
+                                     doc=dict(doc))
+        coalescer = UpdateCoalescer(
+            read=lambda doc_id: db_effects.get(doc_id=doc_id),
+            write=write, value=lambda response: response.doc,
+            conflict=lambda response: response.status == DBStatus.CONFLICT)
+        dispatcher = ziffect.compile_dispatcher([
+            {DBInterface: self.provider}, coalescing_dispatcher,
+            base_dispatcher])
+        self.expectThat(
+            sync_perform(dispatcher,
+                         coalescer.update(self.doc_id, increment)),
+            Equals({'count': 11}))
+        self.expectThat(coalescer.stats().conflicts, Equals(1))
+
+    def test_round_error(self):
+        """
+        If a round fails, every update of the round fails, and the updates
+        queued during it get their own round.
+        """
+        self.provider.fail_first = True
+        coalescer = make_coalescer()
+
+        @do
+        def catching(effect):
+            try:
+                result = yield effect
+            except RuntimeError as e:
+                result = e.args
+            yield do_return(result)
+
+        results = self.perform_concurrently([
+            catching(coalescer.update(self.doc_id, increment))
+            for _ in range(3)])
+        self.expectThat(results, Equals([
+            ('unavailable',), {'count': 1}, {'count': 2}]))
+        self.expectThat(
+            blocking_perform(self.dispatcher,
+                             coalescer.update(self.doc_id, increment),
+                             timeout=10),
+            Equals({'count': 3}))
@@ -0,0 +1,113 @@
+from __future__ import unicode_literals
+
+import pickle
+from uuid import UUID
+
+from pyrsistent import pmap, pvector
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, LessThan, Raises, MatchesException
+
+import ziffect
+from ziffect.codec import (
+    encode, encode_into, decode, decode_from, intent_name, intent_type,
+    DecodeError)
+
+
+@ziffect.interface
+class Documents(object):
+
+    def get(doc_id=ziffect.argument(type=UUID),
+            rev=ziffect.argument(type=int, default=-1)):
+        pass
+
+    def put(doc_id=ziffect.argument(type=UUID),
+            rev=ziffect.argument(type=int),
+            doc=ziffect.argument(type=dict)):
+        pass
+
+    def find(name=ziffect.argument(type=text_type)):
+        pass
+
+
+DOC_ID = UUID('8e2f5b4c-9c4f-4e49-a3a4-8a1e2c8b0a31')
+
+
+class CodecTests(TestCase):
+    """
+    Tests for ``ziffect.codec``.
+    """
+
+    def test_names(self):
+        """
+        Intent types have stable names that find them again.
+        """
+        get = ziffect.intents(Documents).get
+        self.expectThat(
+            intent_name(get), Equals(Documents.__module__ + ':Documents.get'))
+        self.expectThat(intent_type(intent_name(get)) is get, Equals(True))
+        self.expectThat(
+            lambda: intent_type(Documents.__module__ + ':Documents.delete'),
+            Raises(MatchesException(LookupError)))
+
+    def test_round_trip(self):
+        """
+        Intents, including nested ones, and results decode to equal values.
+        """
+        intents = ziffect.intents(Documents)
+        values = [
+            intents.get(doc_id=DOC_ID),
+            intents.put(doc_id=DOC_ID, rev=-3,
+                        doc={'a': [1, 2.5, None], 'b': (True, b'\x00')}),
+            intents.find(name='\xe9'),
+            [intents.get(doc_id=DOC_ID, rev=2 ** 80), {'x': -(2 ** 70)}],
+            pmap({'a': pvector([1, 2])}),
+        ]
+        for value in values:
+            self.expectThat(decode(encode(value)), Equals(value))
+
+    def test_compact(self):
+        """
+        Arguments with declared types are encoded without type information.
+        """
+        intent = ziffect.intents(Documents).get(doc_id=DOC_ID, rev=3)
+        name = intent_name(type(intent))
+        self.expectThat(len(encode(intent)),
+                        Equals(1 + 1 + len(name) + 16 + 1))
+        self.expectThat(len(encode(intent)),
+                        LessThan(len(pickle.dumps(intent, protocol=2))))
+
+    def test_pickle(self):
+        """
+        Intents can be pickled.
+        """
+        intent = ziffect.intents(Documents).put(
+            doc_id=DOC_ID, rev=1, doc={'a': 1})
+        self.expectThat(pickle.loads(pickle.dumps(intent)), Equals(intent))
+
+    def test_stream(self):
+        """
+        Values encoded one after another are decoded in turn.
+        """
+        out = bytearray()
+        encode_into(out, 'first')
+        encode_into(out, ziffect.intents(Documents).find(name='x'))
+        first, offset = decode_from(out)
+        second, offset = decode_from(out, offset)
+        self.expectThat((first, second.name, offset),
+                        Equals(('first', 'x', len(out))))
+
+    def test_errors(self):
+        """
+        Unencodable values raise ``TypeError`` and bad data raises
+        ``DecodeError``.
+        """
+        self.expectThat(lambda: encode(object()),
+                        Raises(MatchesException(TypeError)))
+        data = encode(ziffect.intents(Documents).get(doc_id=DOC_ID))
+        self.expectThat(lambda: decode(data[:-3]),
+                        Raises(MatchesException(DecodeError)))
+        self.expectThat(lambda: decode(data + b'\x00'),
+                        Raises(MatchesException(DecodeError)))
+        self.expectThat(lambda: decode(b'\xff'),
+                        Raises(MatchesException(DecodeError)))
@@ -0,0 +1,337 @@
+from __future__ import unicode_literals
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, Is, IsInstance, Raises, MatchesException
+from effect import (
+    ComposedDispatcher, Constant, Effect, Func, TypeDispatcher, Delay,
+    base_dispatcher, parallel, sync_perform, sync_performer)
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.aio import asyncio_perform, asyncio_base_dispatcher
+from ziffect.fanout import fans_out
+from ziffect.deadlines import (
+    Deadline, DeadlineExceeded, current_deadline, deadline_dispatcher,
+    takes_deadline, within)
+from ziffect.processes import ProcessProvider
+from ziffect.retry import RetryPolicy
+from ziffect.scoped import ScopedProvider
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Clock(object):
+
+    def wait(name=ziffect.argument(type=text_type),
+             seconds=ziffect.argument(type=float)):
+        pass
+
+
+class SleepingClock(object):
+    """
+    A provider that sleeps, recording the names of the calls.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def wait(self, name, seconds):
+        self.calls.append(name)
+        time.sleep(seconds)
+        return name
+
+
+class AsyncClock(object):
+
+    def __init__(self):
+        self.cancelled = []
+
+    async def wait(self, name, seconds):
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        return name
+
+
+class DeadlineClock(object):
+
+    def __init__(self):
+        self.deadlines = []
+
+    @takes_deadline
+    def wait(self, name, seconds, deadline=None):
+        self.deadlines.append(deadline)
+        return name
+
+
+class FanOutClock(object):
+
+    def __init__(self):
+        self.calls = []
+
+    @fans_out
+    def wait(self, fanout, name, seconds):
+        self.calls.append(name)
+        return Effect(Constant(name))
+
+
+class TouchingClock(object):
+    """
+    A provider that creates a file at the path it is given as the name, so
+    calls can be seen from outside its process.
+    """
+    def wait(self, name, seconds):
+        open(name, 'w').close()
+        return name
+
+
+def make_touching_clock():
+    return TouchingClock()
+
+
+@do
+def wait_twice(seconds):
+    clock = ziffect.effects(Clock)
+    first = yield clock.wait(name='first', seconds=seconds)
+    second = yield clock.wait(name='second', seconds=seconds)
+    yield do_return([first, second])
+
+
+class DeadlineTests(TestCase):
+    """
+    Tests for giving effect programs deadlines.
+    """
+
+    def make_dispatcher(self, provider, executor=None, **kwargs):
+        return ziffect.compile_dispatcher([
+            ziffect.dispatcher({Clock: provider}, executor=executor,
+                               **kwargs),
+            deadline_dispatcher,
+            threaded_base_dispatcher])
+
+    def test_in_time(self):
+        """
+        Programs that complete in time have their result, and their deadline
+        only applies to what they perform.
+        """
+        provider = DeadlineClock()
+        dispatcher = self.make_dispatcher(provider)
+
+        @do
+        def program():
+            result = yield within(10, wait_twice(0.0))
+            after = yield Effect(Func(current_deadline))
+            yield ziffect.effects(Clock).wait(name='after', seconds=0.0)
+            yield do_return((result, after))
+        self.expectThat(sync_perform(dispatcher, program()),
+                        Equals((['first', 'second'], None)))
+        first, second, after = provider.deadlines
+        self.expectThat(first, IsInstance(Deadline))
+        self.expectThat(second, Is(first))
+        self.expectThat(first.timeout, Equals(10))
+        self.expectThat(after, Is(None))
+
+    def test_checked_before_calling(self):
+        """
+        Effects performed after the deadline has passed fail without calling
+        the provider.
+        """
+        provider = SleepingClock()
+        dispatcher = self.make_dispatcher(provider)
+        self.expectThat(
+            lambda: sync_perform(dispatcher, within(0.05, wait_twice(0.1))),
+            Raises(MatchesException(DeadlineExceeded)))
+        self.expectThat(provider.calls, Equals(['first']))
+        self.expectThat(
+            lambda: sync_perform(dispatcher, within(0, wait_twice(0.0))),
+            Raises(MatchesException(DeadlineExceeded)))
+        self.expectThat(provider.calls, Equals(['first']))
+
+    def test_executor(self):
+        """
+        Programs waiting on an executor fail when the deadline passes, and
+        effects still waiting for a thread are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        provider = SleepingClock()
+        dispatcher = self.make_dispatcher(provider, executor=executor)
+        clock = ziffect.effects(Clock)
+        start = time.time()
+        self.expectThat(
+            lambda: blocking_perform(
+                dispatcher,
+                within(0.05, parallel([clock.wait(name='slow', seconds=0.3),
+                                       clock.wait(name='queued',
+                                                  seconds=0.0)])),
+                timeout=10),
+            Raises(MatchesException(DeadlineExceeded)))
+        self.expectThat(time.time() - start < 0.25, Equals(True))
+        executor.shutdown()
+        self.expectThat(provider.calls, Equals(['slow']))
+
+    def test_asyncio(self):
+        """
+        Coroutine providers are cancelled when the deadline passes.
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        provider = AsyncClock()
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Clock: provider}), deadline_dispatcher,
+            asyncio_base_dispatcher])
+        clock = ziffect.effects(Clock)
+
+        @do
+        def program():
+            try:
+                yield within(0.05, clock.wait(name='slow', seconds=10.0))
+            except DeadlineExceeded:
+                pass
+            result = yield clock.wait(name='fast', seconds=0.0)
+            yield do_return(result)
+        self.expectThat(
+            loop.run_until_complete(
+                asyncio_perform(dispatcher, program(), loop=loop)),
+            Equals('fast'))
+        self.expectThat(provider.cancelled, Equals(['slow']))
+
+    def test_nested(self):
+        """
+        Nested deadlines only apply if they are sooner.
+        """
+        seen = []
+
+        @do
+        def inner():
+            seen.append(current_deadline())
+            yield Effect(Constant(None))
+
+        @do
+        def program():
+            yield within(10, inner())
+            yield within(0.5, inner())
+        dispatcher = ComposedDispatcher([deadline_dispatcher,
+                                         base_dispatcher])
+        sync_perform(dispatcher, within(1, program()))
+        self.expectThat([deadline.timeout for deadline in seen],
+                        Equals([1, 0.5]))
+
+    def test_retry(self):
+        """
+        Failed attempts are not retried if the deadline would pass before the
+        delay is over.
+        """
+        delays = []
+
+        @sync_performer
+        def perform_delay(dispatcher, intent):
+            delays.append(intent.delay)
+
+        class FailingClock(object):
+            def wait(self, name, seconds):
+                raise RuntimeError(name)
+
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher(
+                {Clock: FailingClock()},
+                retry=RetryPolicy(max_attempts=5, base_delay=0.2, jitter=0)),
+            TypeDispatcher({Delay: perform_delay}),
+            deadline_dispatcher,
+            base_dispatcher])
+        effect = ziffect.effects(Clock).wait(name='x', seconds=0.0)
+        self.expectThat(lambda: sync_perform(dispatcher, within(0.5, effect)),
+                        Raises(MatchesException(RuntimeError)))
+        self.expectThat(delays, Equals([0.2, 0.4]))
+
+    def test_threads(self):
+        """
+        Programs performed concurrently on threads have their own deadlines.
+        """
+        executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(executor.shutdown)
+        provider = DeadlineClock()
+        dispatcher = self.make_dispatcher(provider, executor=executor)
+        results = {}
+
+        def handle(timeout):
+            results[timeout] = blocking_perform(
+                dispatcher, within(timeout, wait_twice(0.0)), timeout=10)
+
+        threads = [threading.Thread(target=handle, args=(timeout,))
+                   for timeout in (5, 6, 7)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.expectThat(len(results), Equals(3))
+        self.expectThat(
+            sorted(deadline.timeout for deadline in provider.deadlines),
+            Equals([5, 5, 6, 6, 7, 7]))
+
+    def test_scoped(self):
+        """
+        Methods of providers bound to a ``ScopedProvider`` are passed the
+        deadline, and are not called once it has passed.
+        """
+        provider = DeadlineClock()
+        scoped = ScopedProvider(Clock)
+        dispatcher = self.make_dispatcher(scoped)
+        with scoped.bound(provider):
+            self.expectThat(
+                sync_perform(dispatcher, within(10, wait_twice(0.0))),
+                Equals(['first', 'second']))
+            self.expectThat(
+                lambda: sync_perform(dispatcher, within(0, wait_twice(0.0))),
+                Raises(MatchesException(DeadlineExceeded)))
+        self.expectThat([deadline.timeout for deadline in provider.deadlines],
+                        Equals([10, 10]))
+
+    def test_fans_out(self):
+        """
+        Methods that fan out are not called once the deadline has passed.
+        """
+        provider = FanOutClock()
+        dispatcher = self.make_dispatcher(provider)
+        self.expectThat(sync_perform(dispatcher, within(10, wait_twice(0.0))),
+                        Equals(['first', 'second']))
+        self.expectThat(
+            lambda: sync_perform(dispatcher, within(0, wait_twice(0.0))),
+            Raises(MatchesException(DeadlineExceeded)))
+        self.expectThat(provider.calls, Equals(['first', 'second']))
+
+    def test_processes(self):
+        """
+        Intents of providers run in worker processes are not submitted once
+        the deadline has passed.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        provider = ProcessProvider(make_touching_clock, max_workers=1)
+        self.addCleanup(provider.shutdown)
+        dispatcher = self.make_dispatcher(provider)
+        clock = ziffect.effects(Clock)
+        path = os.path.join(directory, 'in-time')
+        self.expectThat(
+            blocking_perform(dispatcher,
+                             within(10, clock.wait(name=path, seconds=0.0)),
+                             timeout=10),
+            Equals(path))
+        path = os.path.join(directory, 'expired')
+        self.expectThat(
+            lambda: blocking_perform(
+                dispatcher, within(0, clock.wait(name=path, seconds=0.0)),
+                timeout=10),
+            Raises(MatchesException(DeadlineExceeded)))
+        provider.shutdown()
+        self.expectThat(os.path.exists(path), Equals(False))
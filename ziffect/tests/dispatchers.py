@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+import gc
+import weakref
+
+from testtools import TestCase
+from testtools.matchers import Equals, Is, IsInstance
+from effect import (
+    sync_perform, sync_performer, base_dispatcher, ComposedDispatcher,
+    TypeDispatcher, Constant, Effect
+)
+
+import ziffect
+
+
+@ziffect.interface
+class Counter(object):
+
+    def increment(amount=ziffect.argument(type=int)):
+        pass
+
+
+@ziffect.interface
+class Greeter(object):
+
+    def greet(name=ziffect.argument(type=str)):
+        pass
+
+
+@ziffect.implements(Counter)
+class MemoryCounter(object):
+    def __init__(self):
+        self.value = 0
+
+    def increment(self, amount):
+        self.value += amount
+        return self.value
+
+
+@ziffect.implements(Greeter)
+class Greeting(object):
+    def greet(self, name):
+        return 'hello ' + name
+
+
+class DispatcherTests(TestCase):
+    """
+    Tests for ``ziffect.dispatcher``.
+    """
+
+    def test_changed_map(self):
+        """
+        Changing the provider in a map gives a dispatcher of the new provider.
+        """
+        first = MemoryCounter()
+        second = MemoryCounter()
+        interface_map = {Counter: first}
+        ziffect.dispatcher(interface_map)
+        interface_map[Counter] = second
+        sync_perform(ziffect.dispatcher(interface_map),
+                     ziffect.effects(Counter).increment(amount=3))
+        self.expectThat((first.value, second.value), Equals((0, 3)))
+
+    def test_not_retained(self):
+        """
+        Providers are not kept alive once their dispatcher is dropped.
+        """
+        provider = MemoryCounter()
+        reference = weakref.ref(provider)
+        sync_perform(ziffect.dispatcher({Counter: provider}),
+                     ziffect.effects(Counter).increment(amount=1))
+        del provider
+        gc.collect()
+        self.expectThat(reference(), Is(None))
+
+
+class CompileDispatcherTests(TestCase):
+    """
+    Tests for ``ziffect.compile_dispatcher``.
+    """
+
+    def test_flattens(self):
+        """
+        Interface maps, ziffect dispatchers and ``ComposedDispatcher`` s of
+        ``TypeDispatcher`` s are merged into one table.
+        """
+        compiled = ziffect.compile_dispatcher([
+            {Counter: MemoryCounter()},
+            ComposedDispatcher([
+                ziffect.dispatcher({Greeter: Greeting()}),
+                base_dispatcher,
+            ]),
+        ])
+        self.expectThat(compiled, IsInstance(ziffect.CompiledDispatcher))
+        self.expectThat(compiled.fallback, Is(None))
+        self.expectThat(len(compiled.mapping), Equals(5))
+        self.expectThat(
+            sync_perform(compiled, ziffect.effects(Greeter).greet(name='x')),
+            Equals('hello x'))
+        self.expectThat(
+            sync_perform(compiled, ziffect.effects(Counter).increment(
+                amount=2)),
+            Equals(2))
+
+    def test_first_wins(self):
+        """
+        Like ``ComposedDispatcher``, earlier dispatchers take priority.
+        """
+        first = TypeDispatcher({
+            Constant: sync_performer(lambda d, i: 'first')})
+        compiled = ziffect.compile_dispatcher([first, base_dispatcher])
+        self.expectThat(
+            sync_perform(compiled, Effect(Constant('second'))),
+            Equals('first'))
+
+    def test_opaque_fallback(self):
+        """
+        Dispatchers that are not type based are consulted, in order, after
+        the table.
+        """
+        calls = []
+
+        def opaque(intent):
+            calls.append(intent)
+            return sync_performer(lambda d, i: 'opaque')
+
+        compiled = ziffect.compile_dispatcher([
+            {Counter: MemoryCounter()}, opaque, base_dispatcher])
+        self.expectThat(
+            sync_perform(compiled, Effect(Constant('constant'))),
+            Equals('opaque'))
+        self.expectThat(
+            sync_perform(compiled, ziffect.effects(Counter).increment(
+                amount=1)),
+            Equals(1))
+        self.expectThat(calls, Equals([Constant('constant')]))
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+
+from ziffect.doc import DB, DBStatus, LATEST, uuid4
+
+
+class DBTests(TestCase):
+    """
+    Tests for the ``ziffect.doc`` document store.
+    """
+
+    def setUp(self):
+        super(DBTests, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'db.log')
+
+    def test_revisions(self):
+        """
+        Documents are put at the next revision, and got by revision.
+        """
+        db = DB()
+        doc_id = uuid4()
+        self.expectThat(db.get(doc_id).status, Equals(DBStatus.NOT_FOUND))
+        self.expectThat(db.put(doc_id, 0, {'a': 1}).rev, Equals(0))
+        self.expectThat(db.put(doc_id, 0, {'a': 2}).status,
+                        Equals(DBStatus.CONFLICT))
+        db.put(doc_id, 1, {'a': 2})
+        self.expectThat(db.get(doc_id, 0).doc, Equals({'a': 1}))
+        self.expectThat(db.get(doc_id, LATEST).doc, Equals({'a': 2}))
+        self.expectThat(db.get(doc_id, -2).status,
+                        Equals(DBStatus.BAD_REQUEST))
+
+    def test_immutable(self):
+        """
+        Changing a document after putting it does not change the stored
+        document, and stored documents cannot be changed.
+        """
+        db = DB()
+        doc_id = uuid4()
+        doc = {'a': [1]}
+        db.put(doc_id, 0, doc)
+        doc['a'].append(2)
+        stored = db.get(doc_id).doc
+        self.expectThat(stored, Equals({'a': [1]}))
+
+        def change():
+            stored['a'] = 3
+        self.expectThat(change, Raises(MatchesException(TypeError)))
+
+    def test_durable(self):
+        """
+        Documents put with a log path are loaded again from the log, even
+        when the log grows past its initial size.
+        """
+        db = DB(path=self.path, sync_every=10)
+        doc_id = uuid4()
+        big = 'x' * 300000
+        for rev in range(5):
+            db.put(doc_id, rev, {'rev': rev, 'data': big})
+        db.put('other', 0, {'b': None})
+        db.close()
+
+        reopened = DB(path=self.path)
+        self.addCleanup(reopened.close)
+        self.expectThat(reopened.get(doc_id).rev, Equals(4))
+        self.expectThat(reopened.get(doc_id, 2).doc['rev'], Equals(2))
+        self.expectThat(reopened.get('other').doc, Equals({'b': None}))
+        self.expectThat(reopened.put(doc_id, 5, {}).status,
+                        Equals(DBStatus.OK))
+
+    def test_durable_read_modify_write(self):
+        """
+        Documents built from documents got from the store can be put in a
+        log, and are loaded again as they were put.
+        """
+        db = DB(path=self.path)
+        doc_id = uuid4()
+        db.put(doc_id, 0, {'tags': ['a'], 'meta': {'n': 1}})
+        original = db.get(doc_id)
+        db.put(doc_id, 1,
+               dict(original.doc, tags=original.doc['tags'].append('b')))
+        db.put(doc_id, 2, db.get(doc_id).doc.set('n', 2))
+        db.close()
+
+        reopened = DB(path=self.path)
+        self.addCleanup(reopened.close)
+        self.expectThat(
+            reopened.get(doc_id).doc,
+            Equals({'tags': ['a', 'b'], 'meta': {'n': 1}, 'n': 2}))
+
+    def test_torn_record(self):
+        """
+        A record that was only partly written is ignored, and overwritten by
+        the next put.
+        """
+        db = DB(path=self.path)
+        doc_id = uuid4()
+        db.put(doc_id, 0, {'a': 1})
+        db.put(doc_id, 1, {'a': 2})
+        offset = db._log._offset
+        db.close()
+        with open(self.path, 'r+b') as log:
+            log.seek(offset - 3)
+            log.write(b'\0\0\0')
+
+        reopened = DB(path=self.path)
+        self.expectThat(reopened.get(doc_id).rev, Equals(0))
+        reopened.put(doc_id, 1, {'a': 3})
+        reopened.close()
+        self.expectThat(DB(path=self.path).get(doc_id).doc,
+                        Equals({'a': 3}))
@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from testtools import TestCase
+from testtools.matchers import Equals, LessThan, Raises, MatchesException
+from effect import sync_perform, base_dispatcher, FirstError
+
+import ziffect
+from ziffect.fanout import fans_out
+from ziffect.threads import blocking_perform
+
+
+@ziffect.interface
+class Shard(object):
+
+    def get(shard=ziffect.argument(type=int)):
+        pass
+
+
+@ziffect.implements(Shard)
+class SlowShard(object):
+
+    def get(self, shard):
+        time.sleep(0.1)
+        if shard < 0:
+            raise ValueError(shard)
+        return shard * 10
+
+
+@ziffect.interface
+class Cluster(object):
+
+    def get_all(shards=ziffect.argument(type=list)):
+        pass
+
+    def count():
+        pass
+
+
+@ziffect.implements(Cluster)
+class ShardedCluster(object):
+
+    @fans_out
+    def get_all(self, fanout, shards):
+        get = ziffect.effects(Shard).get
+        return fanout.gather(
+            [get(shard=shard) for shard in shards]).on(sum)
+
+    @fans_out
+    def count(self, fanout):
+        return 3
+
+
+class FanOutTests(TestCase):
+    """
+    Tests for provider methods marked with ``fans_out``.
+    """
+
+    def test_gather(self):
+        """
+        The Effect returned by the method is performed with the dispatcher,
+        and its result is the result of the method.
+        """
+        dispatcher = ziffect.compile_dispatcher([
+            {Cluster: ShardedCluster(), Shard: SlowShard()},
+            base_dispatcher,
+        ])
+        self.patch(time, 'sleep', lambda seconds: None)
+        result = sync_perform(
+            dispatcher, ziffect.effects(Cluster).get_all(shards=[1, 2, 3]))
+        self.expectThat(result, Equals(60))
+        self.expectThat(
+            sync_perform(dispatcher, ziffect.effects(Cluster).count()),
+            Equals(3))
+
+    def test_concurrent(self):
+        """
+        Children with asynchronous performers run at the same time.
+        """
+        pool = ThreadPoolExecutor(max_workers=10)
+        self.addCleanup(pool.shutdown)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Shard: SlowShard()}, executor=pool),
+            {Cluster: ShardedCluster()},
+            base_dispatcher,
+        ])
+        start = time.time()
+        result = blocking_perform(
+            dispatcher,
+            ziffect.effects(Cluster).get_all(shards=list(range(10))),
+            timeout=5)
+        self.expectThat(result, Equals(450))
+        self.expectThat(time.time() - start, LessThan(0.5))
+
+    def test_child_fails(self):
+        """
+        If a child fails, the method fails with ``FirstError``.
+        """
+        dispatcher = ziffect.compile_dispatcher([
+            {Cluster: ShardedCluster(), Shard: SlowShard()},
+            base_dispatcher,
+        ])
+        self.patch(time, 'sleep', lambda seconds: None)
+        self.expectThat(
+            lambda: sync_perform(
+                dispatcher,
+                ziffect.effects(Cluster).get_all(shards=[1, -1])),
+            Raises(MatchesException(FirstError)))
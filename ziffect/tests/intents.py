@@ -0,0 +1,315 @@
+from __future__ import unicode_literals
+
+import os
+import threading
+
+from testtools import TestCase
+from testtools.matchers import Equals, NotEquals, Raises, MatchesException
+from pyrsistent import PTypeError
+from six import text_type
+from effect import sync_perform
+
+import ziffect
+
+
+@ziffect.interface
+class Store(object):
+    """
+    A small interface with required and defaulted arguments.
+    """
+
+    def get(key=ziffect.argument(type=text_type),
+            rev=ziffect.argument(type=int, default=-1)):
+        pass
+
+    def update(key=ziffect.argument(type=text_type),
+               rev=ziffect.argument(type=int, default=-1),
+               doc=ziffect.argument(type=dict)):
+        pass
+
+
+@ziffect.implements(Store)
+class OrderedStore(object):
+
+    def get(self, key, rev):
+        return ('ordered', key, rev)
+
+    def update(self, key, rev, doc):
+        return ('ordered', key, rev, doc)
+
+
+@ziffect.implements(Store)
+class ReorderedStore(object):
+
+    def get(self, rev, key):
+        return ('reordered', key, rev)
+
+    def update(self, doc, key, rev):
+        return ('reordered', key, rev, doc)
+
+
+class GeneratedIntentTests(TestCase):
+    """
+    Tests for the intent types generated for interface methods.
+    """
+
+    def setUp(self):
+        super(GeneratedIntentTests, self).setUp()
+        self.intents = ziffect.intents(Store)
+
+    def test_defaults(self):
+        """
+        Arguments that are not passed take their declared default.
+        """
+        intent = self.intents.update(key='a', doc={})
+        self.expectThat(intent.rev, Equals(-1))
+
+    def test_equality(self):
+        """
+        Intents are equal when their arguments are equal.
+        """
+        self.expectThat(
+            self.intents.update(key='a', doc={'x': 1}),
+            Equals(self.intents.update(key='a', rev=-1, doc={'x': 1})))
+        self.expectThat(
+            self.intents.update(key='a', doc={'x': 1}),
+            NotEquals(self.intents.update(key='b', doc={'x': 1})))
+
+    def test_hash(self):
+        """
+        Equal intents hash equally.
+        """
+        self.expectThat(
+            hash(self.intents.get(key='a')),
+            Equals(hash(self.intents.get(key='a', rev=-1))))
+
+    def test_repr(self):
+        """
+        The repr lists the arguments sorted by name.
+        """
+        self.expectThat(
+            repr(self.intents.update(key='a', rev=3, doc={})),
+            Equals("_Intent(doc={}, key=%r, rev=3)" % (text_type('a'),)))
+
+    def test_type_checked(self):
+        """
+        Arguments of the wrong type raise the pyrsistent type error.
+        """
+        self.expectThat(
+            lambda: self.intents.update(key=12, doc={}),
+            Raises(MatchesException(PTypeError)))
+
+    def test_immutable(self):
+        """
+        Attributes of an intent cannot be reassigned.
+        """
+        intent = self.intents.update(key='a', doc={})
+
+        def assign():
+            intent.rev = 3
+        self.expectThat(assign, Raises(MatchesException(AttributeError)))
+
+    def test_positional_provider(self):
+        """
+        Providers that declare arguments in interface order are performed.
+        """
+        result = sync_perform(
+            ziffect.dispatcher({Store: OrderedStore()}),
+            ziffect.effects(Store).update(key='a', rev=2, doc={}))
+        self.expectThat(result, Equals(('ordered', 'a', 2, {})))
+
+    def test_reordered_provider(self):
+        """
+        Providers that declare arguments in another order are called with
+        keyword arguments.
+        """
+        result = sync_perform(
+            ziffect.dispatcher({Store: ReorderedStore()}),
+            ziffect.effects(Store).update(key='a', rev=2, doc={}))
+        self.expectThat(result, Equals(('reordered', 'a', 2, {})))
+
+
+class ValidationTests(TestCase):
+    """
+    Tests for the validation modes of intent construction.
+    """
+
+    def make_interface(self, **kwargs):
+        @ziffect.interface(**kwargs)
+        class Typed(object):
+            def get(key=ziffect.argument(type=text_type)):
+                pass
+        return ziffect.intents(Typed)
+
+    def test_off(self):
+        """
+        With validation off, arguments are not type checked, and intents are
+        still equal and hashable.
+        """
+        intents = self.make_interface(validation='off')
+        self.expectThat(intents.get(key=12), Equals(intents.get(key=12)))
+        self.expectThat(
+            hash(intents.get(key=12)), Equals(hash(intents.get(key=12))))
+
+    def test_sampled(self):
+        """
+        With sampled validation, one in every N intents is type checked.
+        """
+        intents = self.make_interface(validation=3)
+        errors = 0
+        for _ in range(9):
+            try:
+                intents.get(key=12)
+            except PTypeError:
+                errors += 1
+        self.expectThat(errors, Equals(3))
+
+    def test_environment(self):
+        """
+        The validation mode defaults to the ``ZIFFECT_VALIDATION`` environment
+        variable.
+        """
+        self.patch(os, 'environ', dict(os.environ, ZIFFECT_VALIDATION='off'))
+        self.expectThat(
+            self.make_interface().get(key=12).key, Equals(12))
+        self.expectThat(
+            lambda: self.make_interface(validation='full').get(key=12),
+            Raises(MatchesException(PTypeError)))
+
+    def test_invalid_mode(self):
+        """
+        Unknown validation modes are rejected.
+        """
+        self.expectThat(
+            lambda: self.make_interface(validation='sometimes'),
+            Raises(MatchesException(ValueError)))
+
+
+class LazyInterfaceTests(TestCase):
+    """
+    Tests for creating intents and effect functions on first use.
+    """
+
+    def make_interface(self):
+        @ziffect.interface
+        class Lazy(object):
+            def get(key=ziffect.argument(type=text_type)):
+                pass
+
+            def put(key=ziffect.argument(type=text_type)):
+                pass
+        return Lazy
+
+    def test_memoized(self):
+        """
+        Each method's intent type and effect function are created once.
+        """
+        interface = self.make_interface()
+        intents = ziffect.intents(interface)
+        effects = ziffect.effects(interface)
+        self.expectThat(intents.get is intents.get, Equals(True))
+        self.expectThat(effects.get is effects.get, Equals(True))
+        self.expectThat(
+            effects.get(key='a').intent, Equals(intents.get(key='a')))
+
+    def test_threads(self):
+        """
+        Threads that use a method at the same time get the same intent type.
+        """
+        interface = self.make_interface()
+        intents = ziffect.intents(interface)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(intents.put))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.expectThat(len(set(results)), Equals(1))
+
+    def test_unknown_method(self):
+        """
+        Methods not on the interface raise ``AttributeError``, and ``dir``
+        lists the methods of the interface.
+        """
+        intents = ziffect.intents(self.make_interface())
+        self.expectThat(
+            lambda: intents.delete,
+            Raises(MatchesException(AttributeError)))
+        self.expectThat(sorted(dir(intents)), Equals(['get', 'put']))
+
+
+class InternTests(TestCase):
+    """
+    Tests for reusing the intents of effects with the same arguments.
+    """
+
+    def make_interface(self, intern=True):
+        @ziffect.interface(intern=intern)
+        class Interned(object):
+            def get(key=ziffect.argument(type=text_type),
+                    rev=ziffect.argument(type=int, default=-1)):
+                pass
+
+            def update(key=ziffect.argument(type=text_type),
+                       doc=ziffect.argument(type=dict)):
+                pass
+        return ziffect.effects(Interned)
+
+    def test_shared(self):
+        """
+        Effects with the same arguments share an intent, whether defaults
+        are given or not.
+        """
+        effects = self.make_interface()
+        first = effects.get(key='a').intent
+        self.expectThat(effects.get(key='a').intent is first, Equals(True))
+        self.expectThat(
+            effects.get(key='a', rev=-1).intent is first, Equals(True))
+        self.expectThat(effects.get(key='a', rev=1).intent, NotEquals(first))
+
+    def test_types(self):
+        """
+        Equal arguments of different types get different intents, and are
+        type checked.
+        """
+        effects = self.make_interface()
+        self.expectThat(
+            type(effects.get(key='a', rev=True).intent.rev), Equals(bool))
+        self.expectThat(
+            type(effects.get(key='a', rev=1).intent.rev), Equals(int))
+        self.expectThat(lambda: effects.get(key='a', rev=1.0),
+                        Raises(MatchesException(PTypeError)))
+
+    def test_unhashable(self):
+        """
+        Intents with unhashable arguments are created anew.
+        """
+        effects = self.make_interface()
+        first = effects.update(key='a', doc={'a': 1}).intent
+        second = effects.update(key='a', doc={'a': 1}).intent
+        self.expectThat(first, Equals(second))
+        self.expectThat(first is second, Equals(False))
+
+    def test_bounded(self):
+        """
+        The table of intents keeps the recently used ones, up to its size.
+        """
+        effects = self.make_interface(intern=4)
+        first = effects.get(key='first').intent
+        for rev in range(10):
+            self.expectThat(
+                effects.get(key='first').intent is first, Equals(True))
+            effects.get(key='other', rev=rev)
+        self.expectThat(
+            effects.get(key='other', rev=0).intent is
+            effects.get(key='other', rev=0).intent,
+            Equals(True))
+
+    def test_invalid_size(self):
+        """
+        Negative sizes are rejected.
+        """
+        self.expectThat(lambda: self.make_interface(intern=-1),
+                        Raises(MatchesException(ValueError)))
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Contains, Equals, Is, Not
+
+import ziffect
+from ziffect.deadlines import takes_deadline
+from ziffect.fanout import fans_out
+from ziffect.matchers import Provides
+from ziffect.scoped import ScopedProvider
+
+
+@ziffect.interface
+class Greeter(object):
+
+    def greet(name=ziffect.argument(type=text_type)):
+        pass
+
+    def part(greeting=ziffect.argument(type=text_type),
+             name=ziffect.argument(type=text_type, default='world')):
+        pass
+
+
+class Complete(object):
+
+    def greet(self, name):
+        pass
+
+    @fans_out
+    def part(self, fanout, name, greeting):
+        pass
+
+
+class Broken(object):
+    greet = 'hello'
+
+    @takes_deadline
+    def part(self, greeting, name):
+        pass
+
+
+class ProvidesTests(TestCase):
+    """
+    Tests for ``ziffect.matchers.Provides``.
+    """
+
+    def test_matches(self):
+        """
+        Providers with a method for each method of the interface, that takes
+        its arguments in any order, match.
+        """
+        self.expectThat(Complete(), Provides(Greeter))
+        self.expectThat(ScopedProvider(Greeter), Provides(Greeter))
+
+    def test_mismatch(self):
+        """
+        Providers that lack a method, or whose methods cannot be called with
+        the arguments of the interface, do not match.
+        """
+        mismatch = Provides(Greeter).match(Broken())
+        self.expectThat(mismatch, Not(Is(None)))
+        description = mismatch.describe()
+        self.expectThat(description, Contains('greet: not callable'))
+        self.expectThat(description, Contains('part: '))
+        self.expectThat(str(Provides(Greeter)), Equals('Provides(Greeter)'))
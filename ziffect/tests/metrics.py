@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+
+from testtools import TestCase
+from testtools.matchers import Equals, Contains, Raises, MatchesException
+from effect import sync_perform
+
+import ziffect
+import ziffect.metrics
+from ziffect.metrics import MetricsCollector
+
+
+@ziffect.interface
+class Calculator(object):
+
+    def divide(a=ziffect.argument(type=int), b=ziffect.argument(type=int)):
+        pass
+
+
+@ziffect.implements(Calculator)
+class IntegerCalculator(object):
+
+    def divide(self, a, b):
+        return a // b
+
+
+def calculator_in(module):
+    """
+    Create an interface named ``Calculator`` that is declared in ``module``.
+    """
+    class Calculator(object):
+
+        def divide(a=ziffect.argument(type=int),
+                   b=ziffect.argument(type=int)):
+            pass
+    Calculator.__module__ = module
+    Calculator.__qualname__ = str('Calculator')
+    return ziffect.interface(Calculator)
+
+
+class MetricsTests(TestCase):
+    """
+    Tests for instrumenting dispatchers with a ``MetricsCollector``.
+    """
+
+    def setUp(self):
+        super(MetricsTests, self).setUp()
+        self.now = [0.0]
+
+        def clock():
+            self.now[0] += 0.002
+            return self.now[0]
+        self.patch(ziffect.metrics, '_clock', clock)
+        self.metrics = MetricsCollector(buckets=(0.001, 0.01))
+        self.dispatcher = ziffect.dispatcher(
+            {Calculator: IntegerCalculator()}, instrument=self.metrics)
+        self.divide = ziffect.effects(Calculator).divide
+
+    def test_records(self):
+        """
+        Calls, errors and durations are recorded per method.
+        """
+        sync_perform(self.dispatcher, self.divide(a=4, b=2))
+        self.expectThat(
+            lambda: sync_perform(self.dispatcher, self.divide(a=4, b=0)),
+            Raises(MatchesException(ZeroDivisionError)))
+        [metrics] = self.metrics.snapshot()
+        self.expectThat(
+            (metrics.interface, metrics.method, metrics.calls,
+             metrics.errors, list(metrics.counts)),
+            Equals((__name__ + ':Calculator', 'divide', 2, 1, [0, 2, 0])))
+
+    def test_prometheus_text(self):
+        """
+        Metrics are exported in the Prometheus text format.
+        """
+        sync_perform(self.dispatcher, self.divide(a=4, b=2))
+        text = self.metrics.prometheus_text()
+        labels = 'interface="{0}:Calculator",method="divide"'.format(
+            __name__)
+        self.expectThat(
+            text,
+            Contains('ziffect_calls_total{' + labels + '} 1\n'))
+        self.expectThat(
+            text,
+            Contains('ziffect_duration_seconds_bucket{' + labels +
+                     ',le="+Inf"} 1\n'))
+
+    def test_same_name(self):
+        """
+        Interfaces of the same name in different modules are recorded
+        separately.
+        """
+        first = calculator_in('billing')
+        second = calculator_in('shipping')
+        metrics = MetricsCollector()
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({first: IntegerCalculator()},
+                               instrument=metrics),
+            ziffect.dispatcher({second: IntegerCalculator()},
+                               instrument=metrics)])
+        sync_perform(dispatcher, ziffect.effects(first).divide(a=1, b=1))
+        sync_perform(dispatcher, ziffect.effects(second).divide(a=1, b=1))
+        sync_perform(dispatcher, ziffect.effects(second).divide(a=1, b=1))
+        self.expectThat(
+            [(method.interface, method.calls)
+             for method in metrics.snapshot()],
+            Equals([('billing:Calculator', 1), ('shipping:Calculator', 2)]))
@@ -0,0 +1,119 @@
+from __future__ import unicode_literals
+
+import hashlib
+import os
+from functools import partial
+
+from six import binary_type
+from testtools import TestCase
+from testtools.matchers import Equals, NotEquals, Raises, MatchesException
+from effect import parallel
+
+import ziffect
+from ziffect.processes import ProcessProvider
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Hasher(object):
+
+    def digest(data=ziffect.argument(type=binary_type),
+               rounds=ziffect.argument(type=int, default=1)):
+        pass
+
+    def pid():
+        pass
+
+    def instances():
+        pass
+
+
+class SHA256Hasher(object):
+    created = 0
+
+    def __init__(self):
+        SHA256Hasher.created += 1
+
+    def digest(self, rounds, data):
+        for _ in range(rounds):
+            data = hashlib.sha256(data).digest()
+        if not data:
+            raise ValueError('no data')
+        return data
+
+    def pid(self):
+        return os.getpid()
+
+    def instances(self):
+        return SHA256Hasher.created
+
+
+def make_hasher():
+    return SHA256Hasher()
+
+
+class ProcessProviderTests(TestCase):
+    """
+    Tests for running providers in worker processes.
+    """
+
+    def setUp(self):
+        super(ProcessProviderTests, self).setUp()
+        provider = ProcessProvider(make_hasher, max_workers=2)
+        self.addCleanup(provider.shutdown)
+        self.dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Hasher: provider}),
+            threaded_base_dispatcher,
+        ])
+        self.effects = ziffect.effects(Hasher)
+
+    def test_results(self):
+        """
+        Methods are called in worker processes, with the arguments of the
+        intents.
+        """
+        results = blocking_perform(
+            self.dispatcher,
+            parallel([self.effects.digest(data=b'a', rounds=2),
+                      self.effects.pid()]),
+            timeout=30)
+        self.expectThat(
+            results[0],
+            Equals(hashlib.sha256(hashlib.sha256(b'a').digest()).digest()))
+        self.expectThat(results[1], NotEquals(os.getpid()))
+
+    def test_one_provider_per_worker(self):
+        """
+        Each worker process builds its provider once.
+        """
+        results = blocking_perform(
+            self.dispatcher,
+            parallel([self.effects.instances() for _ in range(8)]),
+            timeout=30)
+        self.expectThat(set(results), Equals(set([1])))
+
+    def test_partial_factory(self):
+        """
+        Factories that are not plain functions, such as partials, also build
+        the provider once in each worker process.
+        """
+        provider = ProcessProvider(partial(SHA256Hasher), max_workers=1)
+        self.addCleanup(provider.shutdown)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Hasher: provider}),
+            threaded_base_dispatcher,
+        ])
+        results = [blocking_perform(dispatcher, self.effects.instances(),
+                                    timeout=30)
+                   for _ in range(4)]
+        self.expectThat(results, Equals([1, 1, 1, 1]))
+
+    def test_errors(self):
+        """
+        Exceptions raised by the provider fail the effect.
+        """
+        self.expectThat(
+            lambda: blocking_perform(
+                self.dispatcher, self.effects.digest(data=b'', rounds=0),
+                timeout=30),
+            Raises(MatchesException(ValueError)))
@@ -0,0 +1,133 @@
+from __future__ import unicode_literals
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import sync_perform, base_dispatcher
+
+import ziffect
+from ziffect.matchers import Provides
+from ziffect.recording import CallLog, recorder, stub
+
+
+@ziffect.interface
+class Store(object):
+
+    def get(key=ziffect.argument(type=text_type),
+            rev=ziffect.argument(type=int, default=-1)):
+        pass
+
+    def put(key=ziffect.argument(type=text_type),
+            value=ziffect.argument(type=object)):
+        pass
+
+
+store_effects = ziffect.effects(Store)
+
+
+def perform_all(provider, effects):
+    dispatcher = ziffect.compile_dispatcher([{Store: provider},
+                                             base_dispatcher])
+    return [sync_perform(dispatcher, effect) for effect in effects]
+
+
+class RecordingProviderTests(TestCase):
+    """
+    Tests for ``ziffect.recording.recorder`` and ``ziffect.recording.stub``.
+    """
+
+    def test_recorder(self):
+        """
+        Recorders provide the interface, and record the arguments of each
+        call in the order they are declared, with their defaults.
+        """
+        provider = recorder(Store)
+        self.expectThat(provider, Provides(Store))
+        results = perform_all(provider, [
+            store_effects.get(key='a'),
+            store_effects.put(key='a', value={'x': 1}),
+            store_effects.get(key='b', rev=3),
+        ])
+        self.expectThat(results, Equals([None, None, None]))
+        self.expectThat(list(provider.calls['get']),
+                        Equals([('a', -1), ('b', 3)]))
+        self.expectThat(list(provider.calls['put']),
+                        Equals([('a', {'x': 1})]))
+        provider.clear()
+        self.expectThat(len(provider.calls['get']), Equals(0))
+
+    def test_stub(self):
+        """
+        Stubs return values, raise exceptions, call functions with the
+        arguments, and return successive responses from lists.
+        """
+        provider = stub(Store, {
+            'get': [lambda key, rev: key * 2, ValueError('gone'), 'last'],
+            'put': True,
+        })
+        self.expectThat(perform_all(provider, [
+            store_effects.get(key='a'), store_effects.put(key='a', value=1)]),
+            Equals(['aa', True]))
+        self.expectThat(
+            lambda: perform_all(provider, [store_effects.get(key='b')]),
+            Raises(MatchesException(ValueError('gone'))))
+        self.expectThat(perform_all(provider, [store_effects.get(key='c'),
+                                               store_effects.get(key='d')]),
+                        Equals(['last', 'last']))
+        self.expectThat(provider.calls['get'].column('key'),
+                        Equals(['a', 'b', 'c', 'd']))
+
+    def test_unknown_method(self):
+        """
+        Responses of methods the interface does not have are rejected.
+        """
+        self.expectThat(lambda: stub(Store, {'delete': None}),
+                        Raises(MatchesException(ValueError)))
+
+
+class CallLogTests(TestCase):
+    """
+    Tests for ``ziffect.recording.CallLog``.
+    """
+
+    def test_queries(self):
+        """
+        Calls are counted and found by the values of their arguments, which
+        match equal values of the same type.
+        """
+        log = CallLog(['number', 'name'], [int, text_type])
+        for number, name in [(1, 'a'), (2, 'b'), (1, 'b'), (True, 'a')]:
+            log._append((number, name))
+        self.expectThat(log.count(number=1), Equals(2))
+        self.expectThat(log.count(number=1, name='b'), Equals(1))
+        self.expectThat(log.count(name='c'), Equals(0))
+        self.expectThat(log.count(), Equals(4))
+        self.expectThat(log.where(name='a'), Equals([(1, 'a'), (True, 'a')]))
+        self.expectThat(log[-1], Equals((True, 'a')))
+        self.expectThat(log.column('number'), Equals([1, 2, 1, True]))
+
+    def test_mixed_values(self):
+        """
+        Values of any type are kept, including unhashable ones and ints that
+        do not fit in 64 bits.
+        """
+        log = CallLog(['value'], [int])
+        values = [1, 2 ** 70, 'text', 1.5, [1], {'a': 1}, None, 1]
+        for value in values:
+            log._append((value,))
+        self.expectThat(log.column('value'), Equals(values))
+        self.expectThat(log.count(value=1), Equals(2))
+        self.expectThat(log.where(value=[1]), Equals([([1],)]))
+
+    def test_max_calls(self):
+        """
+        With ``max_calls`` only the most recent calls are kept.
+        """
+        log = CallLog(['key'], [text_type], max_calls=3)
+        for i in range(200):
+            log._append(('key{0}'.format(i),))
+        self.expectThat(list(log),
+                        Equals([('key197',), ('key198',), ('key199',)]))
+        self.expectThat((log.total, len(log)), Equals((200, 3)))
+        self.expectThat(log.count(key='key150'), Equals(0))
+        self.expectThat(log.where(key='key198'), Equals([('key198',)]))
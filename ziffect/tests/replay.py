@@ -0,0 +1,227 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import parallel, sync_perform, base_dispatcher
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.doc import DB, DBResponse, DBStatus
+from ziffect.replay import Recorder, read_log, replay
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Store(object):
+
+    def get(key=ziffect.argument(type=text_type)):
+        pass
+
+    def put(key=ziffect.argument(type=text_type),
+            rev=ziffect.argument(type=int),
+            doc=ziffect.argument(type=dict)):
+        pass
+
+
+@ziffect.implements(Store)
+class DBStore(object):
+
+    def __init__(self):
+        self.db = DB()
+
+    def get(self, key):
+        response = self.db.get(key)
+        if response.status != DBStatus.OK:
+            raise KeyError(key)
+        return response.doc
+
+    def put(self, key, rev, doc):
+        return self.db.put(key, rev, doc)
+
+
+class Token(object):
+    """
+    A value the codec cannot encode, but that can be pickled.
+    """
+    def __eq__(self, other):
+        return isinstance(other, Token)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return 0
+
+
+@do
+def put_all(keys):
+    effects = ziffect.effects(Store)
+    for key in keys:
+        yield effects.put(key=key, rev=0, doc={})
+
+
+@do
+def program(keys):
+    effects = ziffect.effects(Store)
+    found = []
+    for rev, key in enumerate(keys):
+        yield effects.put(key=key, rev=0, doc={'n': rev})
+        doc = yield effects.get(key=key)
+        found.append(doc['n'])
+    try:
+        yield effects.get(key='missing')
+    except KeyError:
+        pass
+    yield do_return(found)
+
+
+class ReplayTests(TestCase):
+    """
+    Tests for recording and replaying intents.
+    """
+
+    def setUp(self):
+        super(ReplayTests, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'traffic.log')
+        dispatcher = ziffect.compile_dispatcher([
+            {Store: DBStore()}, base_dispatcher])
+        with Recorder(self.path) as recorder:
+            self.result = sync_perform(
+                recorder.wrap(dispatcher), program(['a', 'b', 'c']))
+
+    def test_replay(self):
+        """
+        Replaying a log gives the recorded results and exceptions.
+        """
+        self.expectThat(self.result, Equals([0, 1, 2]))
+        self.expectThat(replay(self.path, program(['a', 'b', 'c'])),
+                        Equals([0, 1, 2]))
+
+    def test_records(self):
+        """
+        The log holds the intents, and the results encoded by the codec or
+        pickled.
+        """
+        records = list(read_log(self.path))
+        intents = ziffect.intents(Store)
+        self.expectThat(len(records), Equals(7))
+        intent, function = records[0]
+        self.expectThat(intent, Equals(intents.put(key='a', rev=0,
+                                                   doc={'n': 0})))
+        self.expectThat(function(key='a', rev=0, doc={'n': 0}),
+                        Equals(DBResponse(status=DBStatus.OK, rev=0)))
+        self.expectThat(records[1][1](key='a'), Equals({'n': 0}))
+        self.expectThat(
+            ziffect.perform_sequence_destructed_args(
+                records, program(['a', 'b', 'c'])),
+            Equals([0, 1, 2]))
+
+    def test_ordered(self):
+        """
+        Logs of programs that perform one effect at a time can be replayed in
+        order.
+        """
+        self.expectThat(
+            replay(self.path, program(['a', 'b', 'c']), ordered=True),
+            Equals([0, 1, 2]))
+
+    def test_overlapping(self):
+        """
+        Logs of effects that overlapped, and completed in another order than
+        they were performed, are replayed.
+        """
+        executor = ThreadPoolExecutor(max_workers=3)
+        self.addCleanup(executor.shutdown)
+        store = DBStore()
+        for n, key in enumerate(['a', 'b', 'c']):
+            store.put(key, 0, {'n': n})
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Store: store}, executor=executor),
+            threaded_base_dispatcher])
+        effects = ziffect.effects(Store)
+        gets = parallel([effects.get(key=key) for key in ['c', 'a', 'b']])
+        with Recorder(self.path) as recorder:
+            blocking_perform(recorder.wrap(dispatcher), gets, timeout=10)
+        self.expectThat(
+            replay(self.path, parallel([effects.get(key=key)
+                                        for key in ['c', 'a', 'b']])),
+            Equals([{'n': 2}, {'n': 0}, {'n': 1}]))
+
+    def test_unencodable(self):
+        """
+        Intents the codec cannot encode are pickled, and those that cannot be
+        pickled either are dropped, without changing the outcome of the
+        program.
+        """
+        dispatcher = ziffect.compile_dispatcher([
+            {Store: DBStore()}, base_dispatcher])
+        effects = ziffect.effects(Store)
+        with Recorder(self.path) as recorder:
+            results = [
+                sync_perform(recorder.wrap(dispatcher),
+                             effects.put(key=key, rev=0, doc=doc))
+                for key, doc in [('a', {'token': Token()}),
+                                 ('b', {'function': lambda: None})]]
+        self.expectThat([result.status for result in results],
+                        Equals([DBStatus.OK, DBStatus.OK]))
+        self.expectThat(recorder.dropped, Equals(1))
+        intent, function = list(read_log(self.path))[0]
+        self.expectThat(intent, Equals(ziffect.intents(Store).put(
+            key='a', rev=0, doc={'token': Token()})))
+        self.expectThat(function(), Equals(results[0]))
+
+    def test_window(self):
+        """
+        Unordered logs are read no further ahead than the window of records
+        that intents are matched against, and intents beyond it fail.
+        """
+        keys = ['k{0}'.format(n) for n in range(2000)]
+        dispatcher = ziffect.compile_dispatcher([
+            {Store: DBStore()}, base_dispatcher])
+        with Recorder(self.path) as recorder:
+            sync_perform(recorder.wrap(dispatcher), put_all(keys))
+        read = []
+        read_all = read_log
+
+        def reading(path):
+            for record in read_all(path):
+                read.append(record[0].key)
+                yield record
+
+        @do
+        def checking(keys):
+            ahead = []
+            for n, key in enumerate(keys):
+                ahead.append(len(read) - n)
+                yield put_all([key])
+            yield do_return(max(ahead))
+
+        self.patch(ziffect.replay, 'read_log', reading)
+        swapped = keys[:]
+        swapped[10], swapped[15] = swapped[15], swapped[10]
+        self.expectThat(replay(self.path, checking(swapped), window=10),
+                        Equals(10))
+        del read[:]
+        self.expectThat(
+            lambda: replay(self.path, put_all(keys[::-1]), window=10),
+            Raises(MatchesException(AssertionError, '.*window.*')))
+        self.expectThat(len(read), Equals(10))
+
+    def test_mismatch(self):
+        """
+        Programs that perform other intents than the log fail.
+        """
+        self.expectThat(
+            lambda: replay(self.path, program(['a', 'x', 'c'])),
+            Raises(MatchesException(AssertionError)))
+        self.expectThat(
+            lambda: replay(self.path, program(['a'])),
+            Raises(MatchesException(AssertionError)))
@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import (
+    sync_perform, sync_performer, base_dispatcher, Delay, TypeDispatcher)
+
+import ziffect
+import ziffect.retry
+from ziffect.retry import (
+    RetryPolicy, CircuitBreakerPolicy, CircuitOpenError, get_circuit_breaker)
+
+
+@ziffect.interface
+class Flaky(object):
+
+    def get():
+        pass
+
+    def status():
+        pass
+
+
+class FlakyProvider(object):
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError('network error')
+        return self.calls
+
+    def status(self):
+        self.calls += 1
+        return 'ok' if self.calls > self.failures else 'network error'
+
+
+class RetryTests(TestCase):
+    """
+    Tests for retrying methods with a ``RetryPolicy``.
+    """
+
+    def setUp(self):
+        super(RetryTests, self).setUp()
+        self.delays = []
+
+        @sync_performer
+        def record_delay(dispatcher, intent):
+            self.delays.append(intent.delay)
+        self.delay_dispatcher = TypeDispatcher({Delay: record_delay})
+
+    def perform(self, provider, policy, method_name='get'):
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Flaky: provider}, retry=policy),
+            self.delay_dispatcher,
+            base_dispatcher,
+        ])
+        effect = getattr(ziffect.effects(Flaky), method_name)()
+        return sync_perform(dispatcher, effect)
+
+    def test_backoff(self):
+        """
+        Failed calls are retried after exponentially growing, jittered
+        delays.
+        """
+        policy = RetryPolicy(max_attempts=4, base_delay=1.0, jitter=0.5,
+                             random=lambda: 0.5)
+        self.expectThat(self.perform(FlakyProvider(3), policy), Equals(4))
+        self.expectThat(self.delays, Equals([0.75, 1.5, 3.0]))
+
+    def test_gives_up(self):
+        """
+        The last failure is raised once ``max_attempts`` calls have failed.
+        """
+        provider = FlakyProvider(5)
+        self.expectThat(
+            lambda: self.perform(provider, RetryPolicy(max_attempts=2)),
+            Raises(MatchesException(IOError)))
+        self.expectThat(provider.calls, Equals(2))
+
+    def test_not_retryable(self):
+        """
+        Exceptions not in ``retry_on`` are not retried.
+        """
+        provider = FlakyProvider(5)
+        self.expectThat(
+            lambda: self.perform(
+                provider, RetryPolicy(retry_on=(KeyError,))),
+            Raises(MatchesException(IOError)))
+        self.expectThat(provider.calls, Equals(1))
+
+    def test_retry_result(self):
+        """
+        Results that ``retry_result`` classifies as failures are retried.
+        """
+        policy = RetryPolicy(
+            max_attempts=5,
+            retry_result=lambda result: result == 'network error')
+        self.expectThat(
+            self.perform(FlakyProvider(2), policy, 'status'), Equals('ok'))
+        self.expectThat(len(self.delays), Equals(2))
+
+    def test_circuit_breaker(self):
+        """
+        After ``failure_threshold`` failures in a row the circuit opens, and
+        calls fail without reaching the provider until ``reset_timeout`` has
+        passed.
+        """
+        now = [0.0]
+        self.patch(ziffect.retry, '_clock', lambda: now[0])
+        provider = FlakyProvider(3)
+        policy = RetryPolicy(
+            max_attempts=1,
+            circuit_breaker=CircuitBreakerPolicy(
+                failure_threshold=3, reset_timeout=10))
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Flaky: provider}, retry=policy),
+            base_dispatcher,
+        ])
+        get = ziffect.effects(Flaky).get
+        for _ in range(3):
+            self.assertRaises(IOError, sync_perform, dispatcher, get())
+        breaker = get_circuit_breaker(dispatcher, Flaky, 'get')
+        self.expectThat(breaker.state, Equals('open'))
+        self.expectThat(
+            lambda: sync_perform(dispatcher, get()),
+            Raises(MatchesException(CircuitOpenError)))
+        self.expectThat(provider.calls, Equals(3))
+
+        now[0] = 11.0
+        self.expectThat(breaker.state, Equals('half-open'))
+        self.expectThat(sync_perform(dispatcher, get()), Equals(4))
+        self.expectThat(breaker.state, Equals('closed'))
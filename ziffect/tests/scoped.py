@@ -0,0 +1,283 @@
+from __future__ import unicode_literals
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, IsInstance, Raises, MatchesException
+from effect import parallel, sync_perform, base_dispatcher
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.aio import asyncio_perform, asyncio_base_dispatcher
+from ziffect.batching import BatchPolicy, batched
+from ziffect.caching import cached
+from ziffect.fanout import fans_out
+from ziffect.retry import CircuitBreakerPolicy, RetryPolicy
+from ziffect.scoped import ScopedProvider, UnboundProviderError
+from ziffect.streams import Stream, read, streaming
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Greeter(object):
+
+    def greet(name=ziffect.argument(type=text_type)):
+        pass
+
+
+class PoliteGreeter(object):
+
+    def __init__(self, greeting):
+        self.greeting = greeting
+
+    def greet(self, name):
+        return '{0}, {1}'.format(self.greeting, name)
+
+
+class KeywordGreeter(object):
+
+    def greet(self, **kwargs):
+        return 'Hey ' + kwargs['name']
+
+
+class AsyncGreeter(object):
+
+    def __init__(self, greeting):
+        self.greeting = greeting
+
+    async def greet(self, name):
+        await asyncio.sleep(0.01)
+        return '{0}, {1}'.format(self.greeting, name)
+
+
+@ziffect.interface
+class Shelf(object):
+
+    @streaming
+    def items(limit=ziffect.argument(type=int)):
+        pass
+
+    @batched('lookup_many')
+    def lookup(key=ziffect.argument(type=int)):
+        pass
+
+    def lookup_all(limit=ziffect.argument(type=int)):
+        pass
+
+
+class NamedShelf(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.bulk_calls = []
+
+    def items(self, limit):
+        return iter(range(limit))
+
+    def lookup(self, key):
+        raise AssertionError('lookup should be batched')
+
+    def lookup_many(self, intents):
+        self.bulk_calls.append([intent.key for intent in intents])
+        return ['{0}{1}'.format(self.name, intent.key) for intent in intents]
+
+    @fans_out
+    def lookup_all(self, fanout, limit):
+        shelf = ziffect.effects(Shelf)
+        return fanout.gather([shelf.lookup(key=key) for key in range(limit)])
+
+
+@ziffect.interface
+class Directory(object):
+
+    @cached()
+    def lookup(key=ziffect.argument(type=text_type)):
+        pass
+
+
+class NamedDirectory(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def lookup(self, key):
+        if self.name is None:
+            raise RuntimeError('no directory')
+        return '{0}:{1}'.format(self.name, key)
+
+
+@do
+def greet_twice(name):
+    greeter = ziffect.effects(Greeter)
+    first = yield greeter.greet(name=name)
+    second = yield greeter.greet(name=name + '!')
+    yield do_return([first, second])
+
+
+class ScopedProviderTests(TestCase):
+    """
+    Tests for ``ziffect.scoped.ScopedProvider``.
+    """
+
+    def test_bound(self):
+        """
+        Intents are performed with the provider bound in the current context,
+        and fail when none is bound.
+        """
+        scoped = ScopedProvider(Greeter)
+        dispatcher = ziffect.compile_dispatcher([
+            {Greeter: scoped}, base_dispatcher])
+        with scoped.bound(PoliteGreeter('Hello')):
+            self.expectThat(
+                sync_perform(dispatcher, greet_twice('Ann')),
+                Equals(['Hello, Ann', 'Hello, Ann!']))
+            with scoped.bound(KeywordGreeter()):
+                self.expectThat(
+                    sync_perform(dispatcher, greet_twice('Bob')),
+                    Equals(['Hey Bob', 'Hey Bob!']))
+            self.expectThat(scoped.current().greeting, Equals('Hello'))
+        self.expectThat(scoped.current(), Equals(None))
+        self.expectThat(
+            lambda: sync_perform(dispatcher, greet_twice('Cy')),
+            Raises(MatchesException(UnboundProviderError)))
+
+    def test_per_binding_state(self):
+        """
+        Cached results and open circuits of one bound provider do not apply
+        to other bindings.
+        """
+        scoped = ScopedProvider(Directory)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher(
+                {Directory: scoped},
+                retry=RetryPolicy(
+                    max_attempts=1,
+                    circuit_breaker=CircuitBreakerPolicy(
+                        failure_threshold=1))),
+            base_dispatcher])
+        effect = ziffect.effects(Directory).lookup(key='k')
+        with scoped.bound(NamedDirectory('alice')):
+            self.expectThat(sync_perform(dispatcher, effect),
+                            Equals('alice:k'))
+            self.expectThat(sync_perform(dispatcher, effect),
+                            Equals('alice:k'))
+        with scoped.bound(NamedDirectory('bob')):
+            self.expectThat(sync_perform(dispatcher, effect),
+                            Equals('bob:k'))
+        with scoped.bound(NamedDirectory(None)):
+            self.expectThat(lambda: sync_perform(dispatcher, effect),
+                            Raises(MatchesException(RuntimeError)))
+        with scoped.bound(NamedDirectory('cy')):
+            self.expectThat(sync_perform(dispatcher, effect),
+                            Equals('cy:k'))
+
+    def test_threads(self):
+        """
+        Requests handled by different threads see their own providers, also
+        after effects that complete on the threads of an executor.
+        """
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        scoped = ScopedProvider(Greeter, executor=executor)
+        dispatcher = ziffect.compile_dispatcher([
+            {Greeter: scoped}, threaded_base_dispatcher])
+        results = {}
+
+        def handle(greeting):
+            with scoped.bound(PoliteGreeter(greeting)):
+                results[greeting] = blocking_perform(
+                    dispatcher, greet_twice('Ann'), timeout=10)
+
+        threads = [threading.Thread(target=handle, args=(greeting,))
+                   for greeting in ('Hello', 'Hi', 'Howdy')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.expectThat(results, Equals(dict(
+            (greeting, [greeting + ', Ann', greeting + ', Ann!'])
+            for greeting in ('Hello', 'Hi', 'Howdy'))))
+
+    def test_asyncio(self):
+        """
+        Requests handled by different asyncio tasks see their own providers.
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        scoped = ScopedProvider(Greeter)
+        dispatcher = ziffect.compile_dispatcher([
+            {Greeter: scoped}, asyncio_base_dispatcher])
+
+        async def handle(greeting):
+            with scoped.bound(AsyncGreeter(greeting)):
+                return await asyncio_perform(dispatcher, greet_twice('Ann'))
+
+        async def handle_all():
+            return await asyncio.gather(handle('Hello'), handle('Hi'))
+
+        results = loop.run_until_complete(handle_all())
+        self.expectThat(results, Equals([
+            ['Hello, Ann', 'Hello, Ann!'], ['Hi, Ann', 'Hi, Ann!']]))
+
+
+class ScopedMethodTests(TestCase):
+    """
+    Tests for methods of scoped providers that are performed in other ways
+    than by calling them.
+    """
+
+    def setUp(self):
+        super(ScopedMethodTests, self).setUp()
+        self.scoped = ScopedProvider(Shelf, batch=BatchPolicy())
+        self.dispatcher = ziffect.compile_dispatcher([
+            {Shelf: self.scoped}, threaded_base_dispatcher])
+        self.shelf = ziffect.effects(Shelf)
+
+    def perform(self, effect):
+        return blocking_perform(self.dispatcher, effect, timeout=10)
+
+    def test_streaming(self):
+        """
+        Streaming methods give streams.
+        """
+        @do
+        def program():
+            stream = yield self.shelf.items(limit=5)
+            chunk = yield read(stream, 3)
+            yield do_return((stream, chunk))
+        with self.scoped.bound(NamedShelf('a')):
+            stream, chunk = self.perform(program())
+        self.expectThat(stream, IsInstance(Stream))
+        self.expectThat(chunk, Equals([0, 1, 2]))
+
+    def test_batched(self):
+        """
+        Batched methods are performed with the bulk method of the bound
+        provider, and only intents of the same provider are batched together.
+        """
+        first = NamedShelf('a')
+        second = NamedShelf('b')
+        with self.scoped.bound(first):
+            self.expectThat(
+                self.perform(parallel([self.shelf.lookup(key=key)
+                                       for key in range(3)])),
+                Equals(['a0', 'a1', 'a2']))
+        with self.scoped.bound(second):
+            self.expectThat(self.perform(self.shelf.lookup(key=7)),
+                            Equals('b7'))
+        self.expectThat((first.bulk_calls, second.bulk_calls),
+                        Equals(([[0, 1, 2]], [[7]])))
+
+    def test_fans_out(self):
+        """
+        Methods that fan out are passed the fan out handle, and their effects
+        are performed.
+        """
+        provider = NamedShelf('a')
+        with self.scoped.bound(provider):
+            self.expectThat(self.perform(self.shelf.lookup_all(limit=3)),
+                            Equals(['a0', 'a1', 'a2']))
+        self.expectThat(provider.bulk_calls, Equals([[0, 1, 2]]))
@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+from testtools import TestCase
+from testtools.matchers import (
+    Equals, Raises, MatchesException, LessThan, Contains, Not)
+from effect import Effect, Constant, parallel
+from effect.do import do, do_return
+
+import ziffect
+
+
+@ziffect.interface
+class Counter(object):
+
+    def add(amount=ziffect.argument(type=int)):
+        pass
+
+    def store(values=ziffect.argument(type=list)):
+        pass
+
+
+class Total(object):
+
+    def __init__(self):
+        self.total = 0
+
+    def add(self, amount):
+        self.total += amount
+        return self.total
+
+    def store(self, values):
+        return len(values)
+
+
+@do
+def add_all(amounts):
+    effects = ziffect.effects(Counter)
+    totals = []
+    for amount in amounts:
+        total = yield effects.add(amount=amount)
+        totals.append(total)
+    yield do_return(totals)
+
+
+def add_sequence(amounts, provider):
+    intents = ziffect.intents(Counter)
+    return ((intents.add(amount=amount), provider.add) for amount in amounts)
+
+
+def _raises(message):
+    return Raises(MatchesException(AssertionError, message))
+
+
+class SequenceTests(TestCase):
+    """
+    Tests for ``ziffect.perform_sequence_destructed_args``.
+    """
+
+    def test_lazy(self):
+        """
+        The sequence may be a generator, and intents that are not in it are
+        performed by the fallback dispatcher.
+        """
+        @do
+        def program():
+            totals = yield add_all(range(1000))
+            constant = yield Effect(Constant('c'))
+            yield do_return((totals[-1], constant))
+
+        self.expectThat(
+            ziffect.perform_sequence_destructed_args(
+                add_sequence(range(1000), Total()), program()),
+            Equals((sum(range(1000)), 'c')))
+
+    def test_ordered_mismatch(self):
+        """
+        Intents out of order fail with a message that includes the step and
+        the expected intent, but not the rest of the sequence.
+        """
+        intents = ziffect.intents(Counter)
+        try:
+            ziffect.perform_sequence_destructed_args(
+                add_sequence([1, 2] + list(range(1000)), Total()),
+                add_all([1, 3]))
+        except AssertionError as error:
+            message = str(error)
+        self.expectThat(message, Contains('step 1'))
+        self.expectThat(message, Contains(repr(intents.add(amount=2))))
+        self.expectThat(len(message), LessThan(500))
+
+    def test_not_consumed(self):
+        """
+        Sequences with intents that are not performed fail.
+        """
+        self.expectThat(
+            lambda: ziffect.perform_sequence_destructed_args(
+                add_sequence([1, 2], Total()), add_all([1])),
+            _raises('Not all intents were performed, starting at step 1.*'))
+        self.expectThat(
+            lambda: ziffect.perform_sequence_destructed_args(
+                add_sequence([1, 2], Total()), add_all([1]), ordered=False),
+            _raises('Not all intents were performed: 1 intents left.*'))
+        self.expectThat(
+            lambda: ziffect.perform_sequence_destructed_args(
+                add_sequence([1], Total()), add_all([1, 2])),
+            _raises('.*after the end of the sequence'))
+
+    def test_unordered(self):
+        """
+        Unordered sequences match intents in any order, including those of
+        effects performed in parallel and those with unhashable arguments.
+        """
+        intents = ziffect.intents(Counter)
+        effects = ziffect.effects(Counter)
+        provider = Total()
+        sequence = list(add_sequence([1, 2, 2, 3], provider)) + [
+            (intents.store(values=[1, 2]), provider.store)]
+        result = ziffect.perform_sequence_destructed_args(
+            reversed(sequence),
+            parallel([effects.add(amount=2), effects.store(values=[1, 2]),
+                      effects.add(amount=1), effects.add(amount=2),
+                      effects.add(amount=3)]),
+            ordered=False)
+        self.expectThat(result, Equals([2, 2, 3, 5, 8]))
+
+    def test_unordered_mismatch(self):
+        """
+        Intents that are not in an unordered sequence fail with a message
+        that counts the remaining intents.
+        """
+        try:
+            ziffect.perform_sequence_destructed_args(
+                add_sequence(range(1000), Total()), add_all([5, 5]),
+                ordered=False)
+        except AssertionError as error:
+            message = str(error)
+        self.expectThat(
+            message, Contains('999 intents left, 999 of the same type'))
+        self.expectThat(message, Not(Contains('amount=6')))
@@ -0,0 +1,186 @@
+from __future__ import unicode_literals
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException, LessThan
+from effect import sync_perform, base_dispatcher
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.aio import asyncio_perform, async_dispatcher
+from ziffect.streams import streaming, read, for_each
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Numbers(object):
+
+    @streaming
+    def count(limit=ziffect.argument(type=int)):
+        pass
+
+    @streaming(buffer=10)
+    def count_ahead(limit=ziffect.argument(type=int)):
+        pass
+
+    def total(limit=ziffect.argument(type=int)):
+        pass
+
+
+class CountingNumbers(object):
+
+    def __init__(self):
+        self.taken = 0
+
+    def count(self, limit):
+        for number in range(limit):
+            self.taken += 1
+            yield number
+
+    count_ahead = count
+
+    def total(self, limit):
+        return sum(range(limit))
+
+
+class AsyncNumbers(object):
+
+    async def count(self, limit):
+        for number in range(limit):
+            await asyncio.sleep(0)
+            yield number
+
+    count_ahead = count
+
+    async def total(self, limit):
+        return sum(range(limit))
+
+
+@do
+def read_all(limit, chunk_size, method='count'):
+    stream = yield getattr(ziffect.effects(Numbers), method)(limit=limit)
+    chunks = []
+    while True:
+        chunk = yield read(stream, chunk_size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    yield do_return(chunks)
+
+
+class StreamTests(TestCase):
+    """
+    Tests for streaming methods.
+    """
+
+    def test_chunks(self):
+        """
+        Streams are read a chunk at a time, and only as far as they are read.
+        """
+        provider = CountingNumbers()
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Numbers: provider}), base_dispatcher])
+        self.expectThat(
+            sync_perform(dispatcher, read_all(5, 2)),
+            Equals([[0, 1], [2, 3], [4]]))
+
+        @do
+        def read_some():
+            stream = yield ziffect.effects(Numbers).count(limit=1000)
+            chunk = yield read(stream, 3)
+            yield do_return(chunk)
+        self.expectThat(sync_perform(dispatcher, read_some()),
+                        Equals([0, 1, 2]))
+        self.expectThat(provider.taken, Equals(5 + 3))
+
+    def test_executor(self):
+        """
+        Streams of methods run on an executor are read ahead, by at most the
+        buffer size.
+        """
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        provider = CountingNumbers()
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Numbers: provider}, executor=executor),
+            threaded_base_dispatcher])
+        self.expectThat(
+            blocking_perform(
+                dispatcher, read_all(100, 7, 'count_ahead'), timeout=10),
+            Equals([list(range(start, min(start + 7, 100)))
+                    for start in range(0, 100, 7)]))
+
+        @do
+        def read_one():
+            stream = yield ziffect.effects(Numbers).count_ahead(limit=1000)
+            chunk = yield read(stream, 1)
+            yield do_return(chunk)
+        provider.taken = 0
+        blocking_perform(dispatcher, read_one(), timeout=10)
+        executor.shutdown()
+        self.expectThat(provider.taken, LessThan(1 + 10 + 1))
+
+    def test_async(self):
+        """
+        Providers may return asynchronous iterators.
+        """
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        for method in ('count', 'count_ahead'):
+            self.expectThat(
+                loop.run_until_complete(asyncio_perform(
+                    async_dispatcher({Numbers: AsyncNumbers()}),
+                    read_all(25, 10, method), loop=loop)),
+                Equals([list(range(10)), list(range(10, 20)),
+                        list(range(20, 25))]))
+
+    def test_for_each(self):
+        """
+        ``for_each`` reads a stream to the end, performing the effects
+        returned for each chunk.
+        """
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Numbers: CountingNumbers()}),
+            base_dispatcher])
+        totals = []
+
+        @do
+        def program():
+            stream = yield ziffect.effects(Numbers).count(limit=10)
+            yield for_each(
+                stream,
+                lambda chunk: ziffect.effects(Numbers).total(
+                    limit=len(chunk)).on(totals.append),
+                chunk_size=4)
+        sync_perform(dispatcher, program())
+        self.expectThat(totals, Equals([6, 6, 1]))
+
+    def test_errors(self):
+        """
+        Exceptions raised while taking items fail the read, and exceptions
+        raised by the function given to ``for_each`` fail its effect.
+        """
+        def fail(chunk):
+            raise KeyError(chunk[0])
+
+        @do
+        def program():
+            stream = yield ziffect.effects(Numbers).count(limit=10)
+            yield for_each(stream, fail)
+
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Numbers: CountingNumbers()}),
+            base_dispatcher])
+        self.expectThat(lambda: sync_perform(dispatcher, program()),
+                        Raises(MatchesException(KeyError)))
+
+        class Broken(CountingNumbers):
+            def count(self, limit):
+                yield 1
+                raise ValueError(limit)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Numbers: Broken()}), base_dispatcher])
+        self.expectThat(lambda: sync_perform(dispatcher, read_all(5, 1)),
+                        Raises(MatchesException(ValueError)))
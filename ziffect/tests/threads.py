@@ -0,0 +1,97 @@
+from __future__ import unicode_literals
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import current_thread
+
+from testtools import TestCase
+from testtools.matchers import Equals, LessThan, NotEquals, Raises, \
+    MatchesException
+from effect import parallel
+
+import ziffect
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+
+
+@ziffect.interface
+class Blocking(object):
+
+    def wait(seconds=ziffect.argument(type=float)):
+        pass
+
+    def where():
+        pass
+
+    def fail():
+        pass
+
+
+@ziffect.implements(Blocking)
+class SleepingBlocking(object):
+
+    def wait(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+    def where(self):
+        return current_thread().name
+
+    def fail(self):
+        raise ValueError('failed')
+
+
+class ExecutorTests(TestCase):
+    """
+    Tests for running providers on an executor.
+    """
+
+    def setUp(self):
+        super(ExecutorTests, self).setUp()
+        self.pool = ThreadPoolExecutor(max_workers=10)
+        self.addCleanup(self.pool.shutdown)
+
+    def make_dispatcher(self, executor):
+        return ziffect.compile_dispatcher([
+            ziffect.dispatcher({Blocking: SleepingBlocking()},
+                               executor=executor),
+            threaded_base_dispatcher,
+        ])
+
+    def test_parallel_overlaps(self):
+        """
+        Effects performed with ``effect.parallel`` run at the same time.
+        """
+        dispatcher = self.make_dispatcher(self.pool)
+        blocking = ziffect.effects(Blocking)
+        start = time.time()
+        result = blocking_perform(
+            dispatcher,
+            parallel([blocking.wait(seconds=0.2) for _ in range(10)]))
+        self.expectThat(result, Equals([0.2] * 10))
+        self.expectThat(time.time() - start, LessThan(1.0))
+
+    def test_error(self):
+        """
+        Exceptions raised on the executor fail the effect.
+        """
+        dispatcher = self.make_dispatcher(self.pool)
+        self.expectThat(
+            lambda: blocking_perform(
+                dispatcher, ziffect.effects(Blocking).fail()),
+            Raises(MatchesException(ValueError)))
+
+    def test_per_method(self):
+        """
+        Executors can be chosen per method, other methods are called
+        synchronously.
+        """
+        dispatcher = self.make_dispatcher({(Blocking, 'wait'): self.pool})
+        blocking = ziffect.effects(Blocking)
+        self.expectThat(
+            blocking_perform(dispatcher, blocking.where()),
+            Equals(current_thread().name))
+
+        dispatcher = self.make_dispatcher({Blocking: self.pool})
+        self.expectThat(
+            blocking_perform(dispatcher, blocking.where()),
+            NotEquals(current_thread().name))
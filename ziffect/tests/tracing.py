@@ -0,0 +1,179 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+from testtools import TestCase
+from testtools.matchers import Equals, Raises, MatchesException
+from effect import sync_perform, base_dispatcher, parallel
+from effect.do import do, do_return
+
+import ziffect
+from ziffect.threads import blocking_perform, threaded_base_dispatcher
+from ziffect.tracing import Tracer
+
+
+@ziffect.interface
+class Store(object):
+
+    def get(key=ziffect.argument(type=text_type)):
+        pass
+
+
+class DictStore(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key):
+        return self.values[key]
+
+
+@do
+def get_pair(first, second):
+    effects = ziffect.effects(Store)
+    a = yield effects.get(key=first)
+    b = yield effects.get(key=second)
+    yield do_return((a, b))
+
+
+@do
+def get_pairs():
+    first = yield get_pair('a', 'b')
+    second = yield get_pair('b', 'a')
+    yield do_return([first, second])
+
+
+class TracerTests(TestCase):
+    """
+    Tests for tracing effect programs.
+    """
+
+    def setUp(self):
+        super(TracerTests, self).setUp()
+        self.dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Store: DictStore({'a': 1, 'b': 2})}),
+            base_dispatcher])
+
+    def test_spans(self):
+        """
+        Programs and the effects of interfaces are recorded as spans, with
+        the program that performed them as their parent.
+        """
+        tracer = Tracer()
+        self.expectThat(
+            sync_perform(tracer.wrap(self.dispatcher), get_pairs()),
+            Equals([(1, 2), (2, 1)]))
+        spans = dict((span['id'], span) for span in tracer.spans())
+        names = sorted(
+            (span['name'],
+             spans[span['parent']]['name'] if span['parent'] else None)
+            for span in spans.values())
+        self.expectThat(names, Equals(
+            [('Store.get', 'do_get_pair')] * 4 +
+            [('do_get_pair', 'do_get_pairs')] * 2 +
+            [('do_get_pairs', None)]))
+        for span in spans.values():
+            self.expectThat(span['start'] <= span['end'], Equals(True))
+            if span['parent']:
+                parent = spans[span['parent']]
+                self.expectThat(
+                    parent['start'] <= span['start'] <= span['end'] <=
+                    parent['end'],
+                    Equals(True))
+
+    def test_parallel(self):
+        """
+        Effects performed in parallel on threads have the program that
+        performed them as their parent.
+        """
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        dispatcher = ziffect.compile_dispatcher([
+            ziffect.dispatcher({Store: DictStore({'a': 1, 'b': 2})},
+                               executor=executor),
+            threaded_base_dispatcher])
+        tracer = Tracer()
+
+        @do
+        def program():
+            effects = ziffect.effects(Store)
+            results = yield parallel(
+                [effects.get(key='a'), effects.get(key='b')])
+            yield do_return(results)
+        self.expectThat(
+            blocking_perform(tracer.wrap(dispatcher), program(), timeout=10),
+            Equals([1, 2]))
+        spans = tracer.spans()
+        root, = [span for span in spans if span['parent'] is None]
+        self.expectThat(
+            sorted(span['parent'] for span in spans if span is not root),
+            Equals([root['id'], root['id']]))
+
+    def test_failures(self):
+        """
+        Spans of failed effects are marked as failed.
+        """
+        tracer = Tracer()
+        self.expectThat(
+            lambda: sync_perform(tracer.wrap(self.dispatcher),
+                                 get_pair('a', 'c')),
+            Raises(MatchesException(KeyError)))
+        self.expectThat(
+            sorted((span['name'], span['failed'])
+                   for span in tracer.spans()),
+            Equals([('Store.get', False), ('Store.get', True),
+                    ('do_get_pair', True)]))
+
+    def test_sampling(self):
+        """
+        Programs at the top level are traced with the probability of the
+        sample rate, together with everything they perform.
+        """
+        samples = iter([0.7, 0.2, 0.9])
+        tracer = Tracer(sample_rate=0.5, random=lambda: next(samples))
+        dispatcher = tracer.wrap(self.dispatcher)
+        for _ in range(3):
+            sync_perform(dispatcher, get_pair('a', 'b'))
+        self.expectThat(len(tracer.spans()), Equals(3))
+        self.expectThat(lambda: Tracer(sample_rate=2),
+                        Raises(MatchesException(ValueError)))
+
+    def test_bounded(self):
+        """
+        Only the most recent spans are kept.
+        """
+        tracer = Tracer(max_spans=5)
+        sync_perform(tracer.wrap(self.dispatcher), get_pairs())
+        self.expectThat(
+            [span['name'] for span in tracer.spans()],
+            Equals(['do_get_pair', 'Store.get', 'Store.get', 'do_get_pair',
+                    'do_get_pairs']))
+        tracer.clear()
+        self.expectThat(tracer.spans(), Equals([]))
+
+    def test_chrome_trace(self):
+        """
+        Spans are exported as complete events of the Chrome trace format.
+        """
+        tracer = Tracer()
+        sync_perform(tracer.wrap(self.dispatcher), get_pair('a', 'b'))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'trace.json')
+        tracer.write(path, summary_length=10)
+        with open(path) as trace_file:
+            trace = json.load(trace_file)
+        events = trace['traceEvents']
+        self.expectThat(len(events), Equals(3))
+        self.expectThat(set(event['ph'] for event in events), Equals({'X'}))
+        self.expectThat(
+            sorted(event['cat'] for event in events),
+            Equals(['program', 'ziffect', 'ziffect']))
+        self.expectThat(
+            max(len(event['args']['intent']) for event in events),
+            Equals(10))
@@ -0,0 +1,88 @@
+"""
+The ziffect.threads module, for performing ziffect effects whose providers
+run on ``concurrent.futures`` executors.
+
+Blocking providers can be given an executor when creating a dispatcher::
+
+    pool = ThreadPoolExecutor(max_workers=8)
+    dispatcher = ziffect.compile_dispatcher([
+        ziffect.dispatcher({DBInterface: ZiffectDB(db)}, executor=pool),
+        ziffect.threads.threaded_base_dispatcher,
+    ])
+    ziffect.threads.blocking_perform(dispatcher, effect)
+
+Effects of those providers complete asynchronously, so they cannot be
+performed with ``sync_perform``. :func:`blocking_perform` waits for them
+instead, and :obj:`threaded_base_dispatcher` performs the children of
+``effect.parallel`` concurrently so their I/O overlaps.
+"""
+
+from __future__ import absolute_import
+
+from threading import Event
+
+import six
+from effect import TypeDispatcher, ParallelEffects, perform, base_dispatcher
+
+import ziffect
+from ziffect import perform_parallel_async
+
+__all__ = [
+    'blocking_perform',
+    'threaded_base_dispatcher',
+    'PerformTimeout',
+]
+
+
+class PerformTimeout(Exception):
+    """
+    Raised by :func:`blocking_perform` when the effect has not completed in
+    time.
+    """
+
+
+threaded_base_dispatcher = ziffect.compile_dispatcher([
+    TypeDispatcher({ParallelEffects: perform_parallel_async}),
+    base_dispatcher,
+])
+
+
+def blocking_perform(dispatcher, effect, timeout=None):
+    """
+    Perform an effect, and block the calling thread until its result is
+    available. If the final result is an error, the exception will be raised.
+
+    Unlike ``sync_perform`` the effect may complete asynchronously, for
+    instance from the thread of an executor passed to
+    :func:`ziffect.dispatcher`.
+
+    :param dispatcher: The Effect dispatcher to use.
+    :param effect: The Effect to perform.
+    :param timeout: The number of seconds to wait, or ``None`` to wait
+        forever.
+
+    :raises PerformTimeout: if the effect has not completed within
+        ``timeout`` seconds.
+
+    :returns: The result of the effect.
+    """
+    done = Event()
+    outcome = []
+
+    def succeed(result):
+        outcome.append((False, result))
+        done.set()
+
+    def fail(exc_info):
+        outcome.append((True, exc_info))
+        done.set()
+
+    perform(dispatcher, effect.on(success=succeed, error=fail))
+    if not done.wait(timeout):
+        raise PerformTimeout(
+            'Performing %r did not complete within %s seconds' % (
+                effect, timeout))
+    is_error, result = outcome[0]
+    if is_error:
+        six.reraise(*result)
+    return result
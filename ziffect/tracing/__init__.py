@@ -0,0 +1,278 @@
+"""
+The ziffect.tracing module, for recording a timeline of the effects that
+programs perform, and exporting it in the Chrome trace format read by
+``chrome://tracing`` and Perfetto.
+
+Wrap a dispatcher with a :class:`Tracer`::
+
+    tracer = ziffect.tracing.Tracer(sample_rate=0.01)
+    dispatcher = tracer.wrap(ziffect.compile_dispatcher([
+        ziffect.dispatcher({DBInterface: ZiffectDB(db)}),
+        base_dispatcher,
+    ]))
+
+Then every ``@do`` program and every effect of a ziffect interface that is
+performed is recorded as a span, with its start and end, the intent and the
+program that performed it, until :meth:`Tracer.write` exports them.
+
+Each program performed at the top level is traced with probability
+``sample_rate``, together with the effects and programs it performs. The
+effects of programs that are not sampled are performed by the wrapped
+dispatcher without any tracing, so a tracer with a low rate can stay on in
+production. Only the most recent ``max_spans`` spans are kept.
+"""
+
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import random
+import sys
+from collections import deque
+from itertools import count
+from threading import Lock
+
+import six
+from effect import Effect, Func, perform
+from six.moves._thread import get_ident
+
+from ziffect import _clock
+
+__all__ = [
+    'Tracer',
+]
+
+
+_PROGRAM = 'program'
+_INTERFACE = 'ziffect'
+
+
+class _Span(object):
+    """
+    A span that has started.
+    """
+    __slots__ = ('id', 'parent', 'name', 'category', 'intent', 'start',
+                 'thread')
+
+    def __init__(self, id, parent, name, category, intent):
+        self.id = id
+        self.parent = parent
+        self.name = name
+        self.category = category
+        self.intent = intent
+        self.thread = get_ident()
+        self.start = _clock()
+
+
+class _SpanBox(object):
+    """
+    A box that ends a span before providing the outcome of its intent.
+    """
+    __slots__ = ('_tracer', '_span', '_box')
+
+    def __init__(self, tracer, span, box):
+        self._tracer = tracer
+        self._span = span
+        self._box = box
+
+    def succeed(self, result):
+        self._tracer._end(self._span, False)
+        self._box.succeed(result)
+
+    def fail(self, exc_info):
+        self._tracer._end(self._span, True)
+        self._box.fail(exc_info)
+
+
+class _ProgramBox(object):
+    """
+    A box for the :obj:`effect.Func` of a program, that performs the Effect
+    returned by the function with a given dispatcher, such as one whose spans
+    are children of the program.
+    """
+    __slots__ = ('_dispatcher', '_box')
+
+    def __init__(self, dispatcher, box):
+        self._dispatcher = dispatcher
+        self._box = box
+
+    def succeed(self, result):
+        if type(result) is Effect:
+            perform(self._dispatcher, result.on(
+                success=self._box.succeed, error=self._box.fail))
+        else:
+            self._box.succeed(result)
+
+    def fail(self, exc_info):
+        self._box.fail(exc_info)
+
+
+class _TracingDispatcher(object):
+    """
+    A dispatcher that traces the intents performed by the programs of a
+    span.
+    """
+    def __init__(self, tracer, dispatcher, parent):
+        self._tracer = tracer
+        self._dispatcher = dispatcher
+        self._parent = parent
+
+    def __call__(self, intent):
+        performer = self._dispatcher(intent)
+        if performer is None:
+            return None
+        tracer = self._tracer
+        parent = self._parent
+        name = getattr(intent, '_ziffect_name', None)
+        if name is not None:
+            category = _INTERFACE
+            name = name.partition(':')[2]
+        elif type(intent) is Func:
+            category = _PROGRAM
+            name = getattr(intent.func, '__name__', 'program')
+        else:
+            def _perform(dispatcher, intent, box):
+                performer(self, intent, box)
+            return _perform
+
+        def _perform(dispatcher, intent, box):
+            span = tracer._start(parent, name, category, intent)
+            child = _TracingDispatcher(tracer, self._dispatcher, span.id)
+            span_box = _SpanBox(tracer, span, box)
+            if category == _PROGRAM:
+                span_box = _ProgramBox(child, span_box)
+            try:
+                performer(child, intent, span_box)
+            except:
+                span_box.fail(sys.exc_info())
+        return _perform
+
+
+class Tracer(object):
+    """
+    Records spans of the programs and effects performed by dispatchers, and
+    exports them in the Chrome trace format.
+
+    :param sample_rate: The probability that a program performed at the top
+        level is traced.
+    :param max_spans: The largest number of spans to keep. The oldest spans
+        are dropped first.
+    :param random: A function that returns a random float in ``[0, 1)``, used
+        for sampling.
+    """
+    def __init__(self, sample_rate=1.0, max_spans=100000,
+                 random=random.random):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(
+                'sample_rate must be between 0 and 1, not {0!r}'.format(
+                    sample_rate))
+        self._sample_rate = sample_rate
+        self._random = random
+        self._spans = deque(maxlen=max_spans)
+        self._ids = count(1)
+        self._lock = Lock()
+        self._origin = _clock()
+
+    def wrap(self, dispatcher):
+        """
+        Wrap a dispatcher so that the programs it performs are traced.
+
+        :param dispatcher: An Effect dispatcher.
+
+        :returns: An Effect dispatcher.
+        """
+        tracing = _TracingDispatcher(self, dispatcher, None)
+        sample_rate = self._sample_rate
+        sample = self._random
+
+        def _dispatch(intent):
+            if sample_rate >= 1 or sample() < sample_rate:
+                return tracing(intent)
+            performer = dispatcher(intent)
+            if performer is None:
+                return None
+
+            def _perform(_, intent, box):
+                if type(intent) is Func:
+                    box = _ProgramBox(dispatcher, box)
+                performer(dispatcher, intent, box)
+            return _perform
+        return _dispatch
+
+    def _start(self, parent, name, category, intent):
+        return _Span(next(self._ids), parent, name, category, intent)
+
+    def _end(self, span, failed):
+        end = _clock()
+        with self._lock:
+            self._spans.append((span, end, failed))
+
+    def spans(self):
+        """
+        :returns: A list of the recorded spans, as dicts with the keys
+            ``id``, ``parent``, ``name``, ``category``, ``intent``,
+            ``start`` and ``end`` in seconds, ``thread``, the identifier of
+            the thread it started on, and ``failed``, in the order they
+            ended.
+        """
+        with self._lock:
+            spans = list(self._spans)
+        return [
+            dict(id=span.id, parent=span.parent, name=span.name,
+                 category=span.category, intent=span.intent,
+                 start=span.start - self._origin, end=end - self._origin,
+                 thread=span.thread, failed=failed)
+            for span, end, failed in spans
+        ]
+
+    def chrome_trace(self, summary_length=200):
+        """
+        Export the recorded spans in the Chrome trace format.
+
+        :param summary_length: The longest intent summary to include, in
+            characters.
+
+        :returns: A dict that can be serialized as JSON.
+        """
+        pid = os.getpid()
+        events = []
+        for span in self.spans():
+            summary = repr(span['intent'])
+            if len(summary) > summary_length:
+                summary = summary[:summary_length - 3] + '...'
+            args = {'span': span['id'], 'intent': summary}
+            if span['parent'] is not None:
+                args['parent'] = span['parent']
+            if span['failed']:
+                args['failed'] = True
+            events.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': (span['end'] - span['start']) * 1e6,
+                'pid': pid,
+                'tid': span['thread'],
+                'args': args,
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, summary_length=200):
+        """
+        Write the recorded spans to a file in the Chrome trace format.
+
+        :param path: The path of the file, which is overwritten.
+        :param summary_length: The longest intent summary to include, in
+            characters.
+        """
+        with io.open(path, 'w', encoding='utf-8') as output:
+            output.write(six.text_type(json.dumps(
+                self.chrome_trace(summary_length))))
+
+    def clear(self):
+        """
+        Drop the recorded spans.
+        """
+        with self._lock:
+            self._spans.clear()